@@ -0,0 +1,89 @@
+"""initial schema
+
+Tables as created by Base.metadata.create_all before migrations existed. Each
+table is only created when missing, so databases bootstrapped by the app can
+be upgraded without being stamped first.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "users" not in existing:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("username", sa.String(length=255), nullable=False, unique=True),
+            sa.Column("email", sa.String(length=255), nullable=False, unique=True),
+            sa.Column("password", sa.String(length=255), nullable=False),
+            sa.Column("first_name", sa.String(length=255), nullable=False),
+            sa.Column("last_name", sa.String(length=255), nullable=False),
+            sa.Column("is_active", sa.Integer(), nullable=True),
+            sa.Column("is_superuser", sa.Integer(), nullable=True),
+            sa.Column("is_verified", sa.Integer(), nullable=True),
+            sa.Column("date_joined", sa.String(length=255), nullable=False),
+            sa.Column("birth_date", sa.String(length=255), nullable=True),
+        )
+        op.create_index("ix_users_id", "users", ["id"])
+
+    if "books" not in existing:
+        op.create_table(
+            "books",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("title", sa.String(length=255), nullable=False),
+            sa.Column("author", sa.String(), nullable=False),
+            sa.Column("published_year", sa.Integer(), nullable=True),
+            sa.Column("isbn", sa.String(), nullable=True),
+            sa.Column("pages", sa.Integer(), nullable=True),
+            sa.Column("cover", sa.String(), nullable=True),
+            sa.Column("language", sa.String(), nullable=True),
+            sa.Column("description", sa.String(), nullable=True),
+            sa.Column("available", sa.Boolean(), nullable=True),
+            sa.Column("date_added", sa.String(), nullable=True),
+        )
+        op.create_index("ix_books_id", "books", ["id"])
+
+    if "book_owners" not in existing:
+        op.create_table(
+            "book_owners",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("book_id", sa.Integer(), sa.ForeignKey("books.id"), nullable=False),
+            sa.Column("owner_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("date_added", sa.String(), nullable=True),
+        )
+        op.create_index("ix_book_owners_id", "book_owners", ["id"])
+
+    for table in ("readed_books", "booked_books"):
+        if table not in existing:
+            op.create_table(
+                table,
+                sa.Column("id", sa.Integer(), primary_key=True),
+                sa.Column("book_id", sa.Integer(), sa.ForeignKey("books.id"), nullable=False),
+                sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+                sa.Column("start", sa.String(), nullable=True),
+                sa.Column("end", sa.String(), nullable=True),
+            )
+            op.create_index(f"ix_{table}_id", table, ["id"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in ("booked_books", "readed_books", "book_owners", "books", "users"):
+        op.drop_table(table)
@@ -0,0 +1,40 @@
+"""indexes for the owner, book and reader lookups
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 12:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = (
+    ("ix_book_owners_book_id", "book_owners", ["book_id"]),
+    ("ix_book_owners_owner_id_book_id", "book_owners", ["owner_id", "book_id"]),
+    ("ix_readed_books_user_id_book_id", "readed_books", ["user_id", "book_id"]),
+    ("ix_readed_books_book_id", "readed_books", ["book_id"]),
+    ("ix_booked_books_user_id_book_id", "booked_books", ["user_id", "book_id"]),
+    ("ix_booked_books_book_id", "booked_books", ["book_id"]),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # create_all in get_app may have created them already.
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+    op.execute("ANALYZE")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, table, _ in INDEXES:
+        op.drop_index(name, table_name=table, if_exists=True)
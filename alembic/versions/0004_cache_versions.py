@@ -0,0 +1,64 @@
+"""version counters behind the catalog response cache
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 12:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def bump(scope: str) -> str:
+    return (
+        f"INSERT INTO cache_versions(scope, version) VALUES ({scope}, 1) "
+        "ON CONFLICT(scope) DO UPDATE SET version = version + 1;"
+    )
+
+
+PUBLIC_USER_COLUMNS = "username, email, first_name, last_name, is_active, date_joined, birth_date"
+
+TRIGGERS = (
+    ("cache_versions_book_owners_insert", "AFTER INSERT ON book_owners", bump("'catalog'")),
+    ("cache_versions_book_owners_update", "AFTER UPDATE ON book_owners",
+     bump("'catalog'") + bump("'book:' || old.book_id") + bump("'book:' || new.book_id")),
+    ("cache_versions_book_owners_delete", "AFTER DELETE ON book_owners",
+     bump("'catalog'") + bump("'book:' || old.book_id")),
+    ("cache_versions_books_update", "AFTER UPDATE ON books", bump("'catalog'") + bump("'book:' || new.id")),
+    ("cache_versions_books_delete", "AFTER DELETE ON books", bump("'catalog'") + bump("'book:' || old.id")),
+    ("cache_versions_users_update", f"AFTER UPDATE OF {PUBLIC_USER_COLUMNS} ON users",
+     bump("'catalog'")
+     + "INSERT INTO cache_versions(scope, version) "
+     "SELECT 'book:' || book_id, 1 FROM book_owners WHERE owner_id = new.id "
+     "ON CONFLICT(scope) DO UPDATE SET version = version + 1;"),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # create_all in get_app may have created them already.
+    if not sa.inspect(op.get_bind()).has_table("cache_versions"):
+        op.create_table(
+            "cache_versions",
+            sa.Column("scope", sa.String(), nullable=False),
+            sa.Column("version", sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint("scope"),
+        )
+    for name, timing, body in TRIGGERS:
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {timing} BEGIN {body} END")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, _, _ in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.drop_table("cache_versions")
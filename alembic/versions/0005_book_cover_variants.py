@@ -0,0 +1,33 @@
+"""thumbnail and WebP variants of uploaded covers
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, Sequence[str], None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # create_all in get_app may have created it already.
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("books")}
+    if "cover_variants" not in columns:
+        op.add_column("books", sa.Column("cover_variants", sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Plain ALTER TABLE (SQLite >= 3.35): a batch rebuild would drop the
+    # books_fts and cache_versions triggers on books.
+    op.drop_column("books", "cover_variants")
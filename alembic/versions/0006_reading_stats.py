@@ -0,0 +1,83 @@
+"""per-user reading statistics rollups
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 13:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.models.books import READING_STATS_DDL
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, Sequence[str], None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Rebuilds both rollups from the reading history that already exists.
+BACKFILL = (
+    "DELETE FROM reading_stats",
+    "DELETE FROM reading_stats_monthly",
+    """
+    INSERT INTO reading_stats(user_id, finished, pages_read, reading_days, timed, reading)
+    SELECT r.user_id,
+        sum(r."end" IS NOT NULL),
+        sum(CASE WHEN r."end" IS NOT NULL THEN coalesce(b.pages, 0) ELSE 0 END),
+        sum(CASE WHEN r."end" IS NOT NULL AND julianday(r."end") - julianday(r.start) IS NOT NULL
+            THEN max(julianday(r."end") - julianday(r.start), 0) ELSE 0 END),
+        sum(r."end" IS NOT NULL AND julianday(r."end") - julianday(r.start) IS NOT NULL),
+        sum(r.start IS NOT NULL AND r."end" IS NULL)
+    FROM readed_books r LEFT JOIN books b ON b.id = r.book_id
+    GROUP BY r.user_id
+    """,
+    """
+    INSERT INTO reading_stats_monthly(user_id, month, finished, pages_read)
+    SELECT r.user_id, strftime('%Y-%m', r."end"), count(*), sum(coalesce(b.pages, 0))
+    FROM readed_books r LEFT JOIN books b ON b.id = r.book_id
+    WHERE strftime('%Y-%m', r."end") IS NOT NULL
+    GROUP BY r.user_id, strftime('%Y-%m', r."end")
+    """,
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # create_all in get_app may have created them already.
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table("reading_stats"):
+        op.create_table(
+            "reading_stats",
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("finished", sa.Integer(), nullable=False),
+            sa.Column("pages_read", sa.Integer(), nullable=False),
+            sa.Column("reading_days", sa.Float(), nullable=False),
+            sa.Column("timed", sa.Integer(), nullable=False),
+            sa.Column("reading", sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint("user_id"),
+        )
+    if not inspector.has_table("reading_stats_monthly"):
+        op.create_table(
+            "reading_stats_monthly",
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("month", sa.String(length=7), nullable=False),
+            sa.Column("finished", sa.Integer(), nullable=False),
+            sa.Column("pages_read", sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint("user_id", "month"),
+        )
+    for statement in READING_STATS_DDL:
+        op.execute(statement)
+    for statement in BACKFILL:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for trigger in ("reading_stats_after_insert", "reading_stats_after_delete", "reading_stats_after_update"):
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.drop_table("reading_stats_monthly")
+    op.drop_table("reading_stats")
@@ -0,0 +1,37 @@
+"""precomputed item-to-item book similarities
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 13:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007"
+down_revision: Union[str, Sequence[str], None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # create_all in get_app may have created it already. The app fills it on startup.
+    if not sa.inspect(op.get_bind()).has_table("book_similarities"):
+        op.create_table(
+            "book_similarities",
+            sa.Column("book_id", sa.Integer(), sa.ForeignKey("books.id"), nullable=False),
+            sa.Column("rank", sa.Integer(), nullable=False),
+            sa.Column("similar_book_id", sa.Integer(), sa.ForeignKey("books.id"), nullable=False),
+            sa.Column("score", sa.Float(), nullable=False),
+            sa.PrimaryKeyConstraint("book_id", "rank"),
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("book_similarities")
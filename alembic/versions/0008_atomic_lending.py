@@ -0,0 +1,45 @@
+"""one open loan per book and idempotency keys for borrow/return
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 14:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008"
+down_revision: Union[str, Sequence[str], None] = "0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # create_all in get_app may have created them already.
+    op.create_index(
+        "ux_booked_books_open_book_id", "booked_books", ["book_id"],
+        unique=True, sqlite_where=sa.text('"end" IS NULL'), if_not_exists=True
+    )
+    if not sa.inspect(op.get_bind()).has_table("lending_requests"):
+        op.create_table(
+            "lending_requests",
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("key", sa.String(), nullable=False),
+            sa.Column("action", sa.String(), nullable=False),
+            sa.Column("book_id", sa.Integer(), sa.ForeignKey("books.id"), nullable=False),
+            sa.Column("booked_book_id", sa.Integer(), sa.ForeignKey("booked_books.id"), nullable=True),
+            sa.Column("created_at", sa.String(), nullable=False),
+            sa.PrimaryKeyConstraint("user_id", "key"),
+        )
+    op.create_index("ix_lending_requests_created_at", "lending_requests", ["created_at"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("lending_requests")
+    op.drop_index("ux_booked_books_open_book_id", table_name="booked_books", if_exists=True)
@@ -0,0 +1,46 @@
+"""canonical ISBN-13 column and index behind ISBN lookups and import deduplication
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.models.books import normalize_isbn
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0009"
+down_revision: Union[str, Sequence[str], None] = "0008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    # create_all in get_app may have created it already.
+    columns = {column["name"] for column in sa.inspect(bind).get_columns("books")}
+    if "isbn_canonical" not in columns:
+        op.add_column("books", sa.Column("isbn_canonical", sa.String(), nullable=True))
+
+    # Normalization is Python (ISBN-10 check digits and conversion), so the
+    # backfill reads every ISBN once and writes back the valid ones.
+    # Duplicate books already in the catalog are left as they are.
+    rows = bind.execute(sa.text("SELECT id, isbn FROM books WHERE isbn IS NOT NULL AND isbn_canonical IS NULL")).all()
+    updates = [{"id": book_id, "isbn_canonical": canonical} for book_id, isbn in rows if (canonical := normalize_isbn(isbn))]
+    if updates:
+        bind.execute(sa.text("UPDATE books SET isbn_canonical = :isbn_canonical WHERE id = :id"), updates)
+    op.create_index("ix_books_isbn_canonical", "books", ["isbn_canonical"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_books_isbn_canonical", table_name="books", if_exists=True)
+    # Plain ALTER TABLE (SQLite >= 3.35): a batch rebuild would drop the
+    # books_fts and cache_versions triggers on books.
+    op.drop_column("books", "isbn_canonical")
@@ -0,0 +1,55 @@
+"""book counts per language, author, year and availability, kept by triggers
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 15:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.models.books import FACET_COUNTS_BACKFILL, FACET_COUNTS_DDL
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0010"
+down_revision: Union[str, Sequence[str], None] = "0009"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRIGGERS = (
+    "book_facet_counts_after_insert",
+    "book_facet_counts_after_delete",
+    "book_facet_counts_after_update",
+    "book_facet_counts_after_availability",
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # create_all in get_app may have created it already.
+    if not sa.inspect(op.get_bind()).has_table("book_facet_counts"):
+        op.create_table(
+            "book_facet_counts",
+            sa.Column("filter_facet", sa.String(), nullable=False),
+            sa.Column("filter_value", sa.String(), nullable=False),
+            sa.Column("facet", sa.String(), nullable=False),
+            sa.Column("value", sa.String(), nullable=False),
+            sa.Column("count", sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint("filter_facet", "filter_value", "facet", "value"),
+        )
+    op.create_index(
+        "ix_book_facet_counts_top", "book_facet_counts",
+        ["filter_facet", "filter_value", "facet", sa.text("count DESC"), "value"], if_not_exists=True
+    )
+    for statement in FACET_COUNTS_DDL + FACET_COUNTS_BACKFILL:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for trigger in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.drop_table("book_facet_counts")
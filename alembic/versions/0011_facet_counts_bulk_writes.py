@@ -0,0 +1,42 @@
+"""bulk writes add facet counts once per batch instead of through the insert trigger
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18 16:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.models.books import FACET_COUNTS_BULK_GUARD, FACET_COUNTS_DDL
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0011"
+down_revision: Union[str, Sequence[str], None] = "0010"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INSERT_TRIGGER = FACET_COUNTS_DDL[0]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # create_all in get_app may have created it already.
+    if not sa.inspect(op.get_bind()).has_table("book_facet_counts_bulk_writes"):
+        op.create_table(
+            "book_facet_counts_bulk_writes",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+    op.execute("DROP TRIGGER IF EXISTS book_facet_counts_after_insert")
+    op.execute(INSERT_TRIGGER)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS book_facet_counts_after_insert")
+    op.execute(INSERT_TRIGGER.replace(FACET_COUNTS_BULK_GUARD, ""))
+    op.drop_table("book_facet_counts_bulk_writes")
@@ -0,0 +1,78 @@
+"""per-book cache versions, so catalog pages are validated by their range
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-18 18:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.models.books import CACHE_VERSION_BACKFILL, CACHE_VERSION_DDL, CACHE_VERSION_TRIGGERS
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0012"
+down_revision: Union[str, Sequence[str], None] = "0011"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def bump(scope: str) -> str:
+    return (
+        f"INSERT INTO cache_versions(scope, version) VALUES ({scope}, 1) "
+        "ON CONFLICT(scope) DO UPDATE SET version = version + 1;"
+    )
+
+
+PUBLIC_USER_COLUMNS = "username, email, first_name, last_name, is_active, date_joined, birth_date"
+
+# The triggers of 0004, which count 'catalog' and 'book:<id>' scopes.
+PREVIOUS_TRIGGERS = (
+    ("cache_versions_book_owners_insert", "AFTER INSERT ON book_owners", bump("'catalog'")),
+    ("cache_versions_book_owners_update", "AFTER UPDATE ON book_owners",
+     bump("'catalog'") + bump("'book:' || old.book_id") + bump("'book:' || new.book_id")),
+    ("cache_versions_book_owners_delete", "AFTER DELETE ON book_owners",
+     bump("'catalog'") + bump("'book:' || old.book_id")),
+    ("cache_versions_books_update", "AFTER UPDATE ON books", bump("'catalog'") + bump("'book:' || new.id")),
+    ("cache_versions_books_delete", "AFTER DELETE ON books", bump("'catalog'") + bump("'book:' || old.id")),
+    ("cache_versions_users_update", f"AFTER UPDATE OF {PUBLIC_USER_COLUMNS} ON users",
+     bump("'catalog'")
+     + "INSERT INTO cache_versions(scope, version) "
+     "SELECT 'book:' || book_id, 1 FROM book_owners WHERE owner_id = new.id "
+     "ON CONFLICT(scope) DO UPDATE SET version = version + 1;"),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # create_all in get_app may have created it already.
+    if not sa.inspect(op.get_bind()).has_table("book_cache_versions"):
+        op.create_table(
+            "book_cache_versions",
+            sa.Column("book_id", sa.Integer(), nullable=False),
+            sa.Column("version", sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint("book_id"),
+        )
+    for name in CACHE_VERSION_TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    for statement in CACHE_VERSION_BACKFILL + CACHE_VERSION_DDL:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name in CACHE_VERSION_TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    # Books written since the upgrade get a 'book:<id>' version above every
+    # tag handed out in between, from either scheme.
+    op.execute(
+        "INSERT INTO cache_versions(scope, version) "
+        "SELECT 'book:' || book_id, version + 1 FROM book_cache_versions WHERE true "
+        "ON CONFLICT(scope) DO UPDATE SET version = max(version + 1, excluded.version)"
+    )
+    for name, timing, body in PREVIOUS_TRIGGERS:
+        op.execute(f"CREATE TRIGGER {name} {timing} BEGIN {body} END")
+    op.drop_table("book_cache_versions")
@@ -0,0 +1,34 @@
+"""'search' cache version, so search cursors notice a changed ranking
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-18 19:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from app.models.books import SEARCH_VERSION_DDL
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0013"
+down_revision: Union[str, Sequence[str], None] = "0012"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRIGGERS = ("cache_versions_search_insert", "cache_versions_search_update", "cache_versions_search_delete")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # create_all in get_app may have created them already.
+    for statement in SEARCH_VERSION_DDL:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
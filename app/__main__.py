@@ -1,14 +1,143 @@
+import argparse
+import contextlib
+import logging
+import os
+import signal
+import time
+from pathlib import Path
+
 import uvicorn
 
-def main():
-    """ Entry point """
+from app.config.server import (
+    SERVER_HOST, SERVER_PORT, SERVER_LOG_LEVEL, SERVER_WORKERS, SERVER_PRELOAD, LAUNCH_TIME_VARIABLE
+)
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+logger = logging.getLogger("uvicorn.error")
+
+def run_development() -> None:
+    """
+    Auto-reload on code changes, a single worker and create_all on startup.
+    """
     uvicorn.run(
         "app.application:get_app",
-        workers=2,
+        host=SERVER_HOST,
+        port=SERVER_PORT,
         log_level="debug",
         factory=True,
         reload=True,
     )
 
+def preflight() -> None:
+    """
+    Everything the workers must not each do on boot, run once before they
+    start: migrate to head, check the result, create the covers directory and
+    fill book_similarities so workers only load it.
+    """
+    from alembic import command
+    from alembic.config import Config
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    started = time.perf_counter()
+    config = Config(str(REPO_ROOT / "alembic.ini"))
+    config.set_main_option("script_location", str(REPO_ROOT / "alembic"))
+    command.upgrade(config, "head")
+
+    from app.config.covers import COVERS_DIR
+    from app.config.database import engine
+    from app.controller.recommendations import load_similarities, refresh_similarities
+
+    head = ScriptDirectory.from_config(config).get_current_head()
+    with engine.connect() as conn:
+        current = MigrationContext.configure(conn).get_current_revision()
+    if current != head:
+        raise SystemExit(f"Database is at revision {current}, expected {head}")
+    COVERS_DIR.mkdir(parents=True, exist_ok=True)
+    if load_similarities() == 0:
+        refresh_similarities()
+    # No pooled connection may cross the fork into the workers.
+    engine.dispose()
+    logger.info("Preflight done in %.0f ms (schema at %s)", (time.perf_counter() - started) * 1000, head)
+
+def serve_preloaded(workers: int) -> None:
+    """
+    Builds the app once, binds the socket and forks the workers from this
+    process, restarting any that dies until SIGINT/SIGTERM.
+    """
+    from app.application import get_app
+
+    config = uvicorn.Config(get_app(create_schema=False), host=SERVER_HOST, port=SERVER_PORT, log_level=SERVER_LOG_LEVEL)
+    sock = config.bind_socket()
+    children: set[int] = set()
+    stopping = False
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            uvicorn.Server(config).run(sockets=[sock])
+            os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for _ in range(workers):
+        spawn()
+    logger.info("Started %d preloaded workers on http://%s:%d", workers, SERVER_HOST, SERVER_PORT)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            logger.warning("Worker %d exited with status %d, starting a new one", pid, os.waitstatus_to_exitcode(status))
+            spawn()
+    sock.close()
+
+def run_production(workers: int, preload: bool) -> None:
+    os.environ[LAUNCH_TIME_VARIABLE] = str(time.time())
+    # Workers spawned by uvicorn read this when they import the app.
+    os.environ["GBOOKS_CREATE_SCHEMA"] = "0"
+    logging.basicConfig()
+    # alembic.ini's logging section sets the root logger to WARN.
+    logger.setLevel(SERVER_LOG_LEVEL.upper())
+    preflight()
+    if preload:
+        serve_preloaded(workers)
+    else:
+        uvicorn.run(
+            "app.application:get_app",
+            host=SERVER_HOST,
+            port=SERVER_PORT,
+            log_level=SERVER_LOG_LEVEL,
+            factory=True,
+            workers=workers,
+        )
+
+def main():
+    """ Entry point """
+    parser = argparse.ArgumentParser(prog="python -m app")
+    parser.add_argument("mode", nargs="?", choices=["dev", "prod"], default="dev")
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    parser.add_argument("--preload", action=argparse.BooleanOptionalAction, default=SERVER_PRELOAD)
+    args = parser.parse_args()
+    if args.mode == "prod":
+        run_production(args.workers, args.preload)
+    else:
+        run_development()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,19 +1,75 @@
+import time
+# Taken before the imports below, which load the whole application.
+IMPORT_STARTED = time.perf_counter()
+
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager, suppress
 from pathlib import Path
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import UJSONResponse
-from app.config.database import Base, engine
+from fastapi.staticfiles import StaticFiles
+from fastapi.responses import ORJSONResponse
+from app.config.covers import COVERS_DIR, COVERS_URL, STATIC_DIR
+from app.config.database import Base, engine, async_engine
+from app.config.metrics import METRICS_ENABLED, STARTUP_SECONDS
+from app.config.server import CREATE_SCHEMA, LAUNCH_TIME_VARIABLE
+from app.controller.covers import CoverStaticFiles, shutdown_cover_executor
+from app.controller.metrics import MetricsMiddleware, mark_worker_dead, metrics_endpoint
+from app.controller.passwords import shutdown_password_executor
+from app.controller.profiling import ProfilingMiddleware
+from app.controller.recommendations import run_similarity_refresher
 from app.routers.main import router
 
 APP_ROOT = Path(__file__).resolve().parent
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+
+logger = logging.getLogger("uvicorn.error")
+
+def record_startup(app: FastAPI, lifespan_seconds: float) -> dict:
+    """
+    Publishes how long this worker took to start, per phase, as the
+    gbooks_startup_seconds gauge and a log line. "cold_start" counts from the
+    launcher's start, so it includes migrations and, without preload, the
+    worker's own interpreter start.
+    """
+    timings = {
+        "import": IMPORT_SECONDS,
+        "get_app": app.state.build_seconds,
+        "lifespan": lifespan_seconds,
+    }
+    launched = os.getenv(LAUNCH_TIME_VARIABLE)
+    if launched:
+        timings["cold_start"] = time.time() - float(launched)
+    for phase, seconds in timings.items():
+        STARTUP_SECONDS.labels(phase).set(seconds)
+    logger.info("Worker %d ready: %s", os.getpid(), ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in timings.items()))
+    return timings
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    refresher = asyncio.create_task(run_similarity_refresher())
+    app.state.startup = record_startup(app, time.perf_counter() - started)
+    yield
+    refresher.cancel()
+    with suppress(asyncio.CancelledError):
+        await refresher
+    shutdown_password_executor()
+    shutdown_cover_executor()
+    await async_engine.dispose()
+    mark_worker_dead()
 
-def get_app() -> FastAPI:
+def get_app(create_schema: bool = CREATE_SCHEMA) -> FastAPI:
+    started = time.perf_counter()
     app = FastAPI(
         title="API Rasoi",
         version="v1",
         description="API created to manage orders in a restaurant.",
         docs_url="/",
-        # default_response_class=UJSONResponse,
+        lifespan=lifespan,
+        default_response_class=ORJSONResponse,
     )
 
     app.add_middleware(
@@ -23,7 +79,18 @@ def get_app() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
-    Base.metadata.create_all(bind=engine)
-    # app.mount("/static", StaticFiles(directory=APP_ROOT / "static"), name="static")
+    app.add_middleware(ProfilingMiddleware)
+    if METRICS_ENABLED:
+        # Added last so it wraps everything, CORS and the static mounts included.
+        app.add_middleware(MetricsMiddleware)
+        app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
+    if create_schema:
+        # Development and tests only: production workers rely on the migrations.
+        Base.metadata.create_all(bind=engine)
+    COVERS_DIR.mkdir(parents=True, exist_ok=True)
+    # Covers first: GBOOKS_COVERS_DIR may point outside static/.
+    app.mount(COVERS_URL, CoverStaticFiles(directory=COVERS_DIR), name="covers")
+    app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
     app.include_router(router)
+    app.state.build_seconds = time.perf_counter() - started
     return app
@@ -1,3 +1,4 @@
+import os
 import secrets
 from passlib.context import CryptContext
 
@@ -5,5 +6,32 @@ from passlib.context import CryptContext
 SECRET_KEY = "your_secret_key_here"  # Replace with your actual secret key
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt cost factor. Hashes made with a different cost are rehashed on the next successful login.
+BCRYPT_ROUNDS = int(os.getenv("GBOOKS_BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# Worker pool that runs bcrypt off the event loop: "thread" or "process".
+PASSWORD_POOL_KIND = os.getenv("GBOOKS_PASSWORD_POOL", "thread")
+PASSWORD_POOL_WORKERS = int(os.getenv("GBOOKS_PASSWORD_POOL_WORKERS", "4"))
+# Password operations allowed to be running or waiting at once; the rest get a 503.
+PASSWORD_POOL_MAX_QUEUE = int(os.getenv("GBOOKS_PASSWORD_POOL_MAX_QUEUE", "64"))
+
+# Decoded tokens and their users are cached until the token's exp claim or this TTL, whichever comes first.
+TOKEN_CACHE_TTL_SECONDS = int(os.getenv("GBOOKS_TOKEN_CACHE_TTL_SECONDS", "300"))
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("GBOOKS_TOKEN_CACHE_MAX_ENTRIES", "10000"))
+
+# Admission control for /login and /register, which each cost a bcrypt operation.
+# Token buckets per client IP and per username: BURST attempts at once, refilled
+# at RATE_PER_MINUTE. A burst of 0 disables that limit.
+AUTH_RATE_LIMIT_ENABLED = os.getenv("GBOOKS_AUTH_RATE_LIMIT", "1") == "1"
+AUTH_IP_RATE_PER_MINUTE = float(os.getenv("GBOOKS_AUTH_IP_RATE_PER_MINUTE", "30"))
+AUTH_IP_BURST = int(os.getenv("GBOOKS_AUTH_IP_BURST", "20"))
+AUTH_USERNAME_RATE_PER_MINUTE = float(os.getenv("GBOOKS_AUTH_USERNAME_RATE_PER_MINUTE", "6"))
+AUTH_USERNAME_BURST = int(os.getenv("GBOOKS_AUTH_USERNAME_BURST", "5"))
+# Buckets kept per limiter and per worker; the least recently used go first.
+AUTH_RATE_LIMIT_MAX_KEYS = int(os.getenv("GBOOKS_AUTH_RATE_LIMIT_MAX_KEYS", "50000"))
+# /login and /register requests handled at once per worker, from the user
+# lookup to the end of bcrypt. Kept below PASSWORD_POOL_MAX_QUEUE so clients
+# get a 429 here before the pool has to answer 503.
+AUTH_MAX_CONCURRENT = int(os.getenv("GBOOKS_AUTH_MAX_CONCURRENT", str(PASSWORD_POOL_WORKERS * 4)))
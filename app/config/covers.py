@@ -0,0 +1,25 @@
+import os
+from pathlib import Path
+
+# Served at /static. Covers live in COVERS_DIR under their sha256, so the same
+# image uploaded for two books is stored once.
+STATIC_DIR = Path(__file__).resolve().parents[2] / "static"
+COVERS_DIR = Path(os.getenv("GBOOKS_COVERS_DIR", str(STATIC_DIR / "covers")))
+COVERS_URL = "/static/covers"
+
+COVER_MAX_BYTES = int(os.getenv("GBOOKS_COVER_MAX_BYTES", str(10 * 1024 * 1024)))
+# Larger images are rejected before decoding, to avoid decompression bombs.
+COVER_MAX_PIXELS = int(os.getenv("GBOOKS_COVER_MAX_PIXELS", str(40_000_000)))
+# Thumbnail widths in pixels; each one is written as JPEG and WebP.
+COVER_THUMBNAIL_WIDTHS = tuple(int(w) for w in os.getenv("GBOOKS_COVER_THUMBNAIL_WIDTHS", "160,320,640").split(","))
+COVER_JPEG_QUALITY = int(os.getenv("GBOOKS_COVER_JPEG_QUALITY", "82"))
+COVER_WEBP_QUALITY = int(os.getenv("GBOOKS_COVER_WEBP_QUALITY", "78"))
+# Processes that resize covers, created on the first upload.
+COVER_POOL_WORKERS = int(os.getenv("GBOOKS_COVER_POOL_WORKERS", "2"))
+
+# Covers are served from memory when they are at most COVER_MEMORY_MAX_FILE_BYTES
+# (thumbnails); their names are content hashes, so entries never go stale.
+COVER_MEMORY_MAX_BYTES = int(os.getenv("GBOOKS_COVER_MEMORY_MAX_BYTES", str(64 * 1024 * 1024)))
+COVER_MEMORY_MAX_FILE_BYTES = int(os.getenv("GBOOKS_COVER_MEMORY_MAX_FILE_BYTES", str(256 * 1024)))
+# max-age of /book-cover/{book_id}, whose answer changes when a new cover is uploaded.
+COVER_LOOKUP_MAX_AGE = int(os.getenv("GBOOKS_COVER_LOOKUP_MAX_AGE", "300"))
@@ -1,21 +1,139 @@
 import os
+from contextlib import asynccontextmanager, contextmanager
 
-from sqlalchemy import create_engine
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm.session import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
-sqlite_file_name = "database.db"
+from app.config.metrics import METRICS_ENABLED, TimedAsyncAdaptedQueuePool, TimedQueuePool, instrument_engine
+
+sqlite_file_name = os.getenv("GBOOKS_DB_FILE", "database.db")
 sqlite_url = f"sqlite:///{sqlite_file_name}"
+async_sqlite_url = f"sqlite+aiosqlite:///{sqlite_file_name}"
+
+# When enabled run_in_session runs the controllers on the AsyncSession below,
+# otherwise on the sync Session in Starlette's threadpool.
+ASYNC_DB = os.getenv("GBOOKS_ASYNC_DB", "1") == "1"
+
+# "production" applies the pragmas and pool settings below; "default" keeps
+# SQLite's rollback journal and SQLAlchemy's default pool.
+DB_PROFILE = os.getenv("GBOOKS_DB_PROFILE", "production")
+SQLITE_SYNCHRONOUS = os.getenv("GBOOKS_SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("GBOOKS_SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("GBOOKS_SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KIB = int(os.getenv("GBOOKS_SQLITE_CACHE_SIZE_KIB", "65536"))
+# Per engine and per uvicorn worker. SQLite has a single writer, so a few
+# connections per worker is enough to keep readers from queueing behind it.
+DB_POOL_SIZE = int(os.getenv("GBOOKS_DB_POOL_SIZE", "8"))
+DB_MAX_OVERFLOW = int(os.getenv("GBOOKS_DB_MAX_OVERFLOW", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("GBOOKS_DB_POOL_TIMEOUT", "30"))
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Runs on every new DBAPI connection. WAL lets readers proceed while a writer
+    commits, and synchronous=NORMAL is durable in WAL mode except on power loss.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KIB}")
+    cursor.close()
+
+engine_options = {}
+if DB_PROFILE == "production":
+    engine_options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+
+# The timed pools are the classes SQLAlchemy picks for a SQLite file anyway.
+sync_pool_options = {"poolclass": TimedQueuePool} if METRICS_ENABLED else {}
+async_pool_options = {"poolclass": TimedAsyncAdaptedQueuePool} if METRICS_ENABLED else {}
 
-engine = create_engine(sqlite_url, connect_args={"check_same_thread": False})
+engine = create_engine(sqlite_url, connect_args={"check_same_thread": False}, **engine_options, **sync_pool_options)
+async_engine = create_async_engine(async_sqlite_url, **engine_options, **async_pool_options)
+
+if METRICS_ENABLED:
+    instrument_engine(engine, "sync")
+    instrument_engine(async_engine.sync_engine, "async")
+
+if DB_PROFILE == "production":
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
 
 Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSession = async_sessionmaker(autoflush=False, expire_on_commit=False, bind=async_engine)
 
 Base = declarative_base()
 
-def get_db():
+@contextmanager
+def unit_of_work():
+    """
+    One Session and one transaction: commits when the block ends, rolls
+    back if it raises. Controllers only flush.
+    """
     db = Session()
     try:
         yield db
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
     finally:
         db.close()
+
+@asynccontextmanager
+async def async_unit_of_work():
+    """
+    unit_of_work on an AsyncSession.
+    """
+    async with AsyncSession() as db:
+        try:
+            yield db
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            raise
+
+async def get_unit_of_work():
+    """
+    Request-scoped unit of work, an AsyncSession when ASYNC_DB is on and a
+    Session otherwise. FastAPI caches it per request, so the route and its
+    dependencies (get_current_user, ...) share one session, one connection
+    checkout and one identity map. It commits before the response is sent.
+    The sync Session commits on the threadpool too, so no request blocks
+    the event loop on SQLite's write lock.
+    """
+    if ASYNC_DB:
+        async with async_unit_of_work() as db:
+            yield db
+    else:
+        db = Session()
+        try:
+            yield db
+            await run_in_threadpool(db.commit)
+        except BaseException:
+            await run_in_threadpool(db.rollback)
+            raise
+        finally:
+            await run_in_threadpool(db.close)
+
+# For work that runs outside a request, such as background tasks.
+session_unit_of_work = asynccontextmanager(get_unit_of_work)
+
+async def run_in_session(db, fn, *args, **kwargs):
+    """
+    Runs a controller written against the sync Session API on the session
+    get_unit_of_work yielded: on an AsyncSession through run_sync, which hands
+    it the AsyncSession's own Session, and on a sync Session in the
+    threadpool, so each controller exists only once whatever the ASYNC_DB
+    setting and neither blocks the event loop.
+    """
+    if ASYNC_DB:
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
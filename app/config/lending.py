@@ -0,0 +1,6 @@
+import os
+
+# Idempotency-Key values sent to /borrow and /return are remembered per user for
+# this long; retrying after that runs the operation again.
+IDEMPOTENCY_KEY_TTL_HOURS = float(os.getenv("GBOOKS_IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
@@ -0,0 +1,125 @@
+import os
+import time
+from contextvars import ContextVar
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Prometheus metrics at /metrics. With several uvicorn workers, point
+# PROMETHEUS_MULTIPROC_DIR at an empty directory before starting them; every
+# worker then writes its samples there and /metrics adds them up.
+METRICS_ENABLED = os.getenv("GBOOKS_METRICS", "1") == "1"
+METRICS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+DB_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+STATEMENT_KINDS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "PRAGMA", "BEGIN", "COMMIT", "ROLLBACK", "CREATE", "DROP"}
+
+HTTP_REQUESTS = Counter(
+    "gbooks_http_requests_total", "HTTP requests by route template and status code.",
+    ["method", "route", "status"]
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "gbooks_http_request_duration_seconds", "Time from receiving a request to sending the last byte.",
+    ["method", "route"]
+)
+# The route is only known once the router has matched, so this one is per method.
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "gbooks_http_requests_in_progress", "Requests being handled right now.",
+    ["method"], multiprocess_mode="livesum"
+)
+DB_STATEMENTS = Counter(
+    "gbooks_db_statements_total", "SQL statements sent to SQLite.",
+    ["engine", "kind"]
+)
+DB_STATEMENT_SECONDS = Histogram(
+    "gbooks_db_statement_duration_seconds", "Time SQLite spent on each statement, cursor execute to return.",
+    ["engine", "kind"], buckets=DB_BUCKETS
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "gbooks_db_pool_checkout_seconds", "Time to get a connection from the pool, opening it if needed.",
+    ["engine"], buckets=DB_BUCKETS
+)
+# A request should need one checkout (its unit of work), two at most when a
+# background task or the profiler opens another.
+DB_CHECKOUTS_PER_REQUEST = Histogram(
+    "gbooks_db_checkouts_per_request", "Pool checkouts made while handling one request, background tasks included.",
+    ["method", "route"], buckets=(0, 1, 2, 3, 4, 6, 8, 16)
+)
+PASSWORD_SECONDS = Histogram(
+    "gbooks_password_duration_seconds", "bcrypt hash and verify time, including the wait for a pool worker.",
+    ["operation"], buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+AUTH_REJECTIONS = Counter(
+    "gbooks_auth_rejections_total", "/login and /register requests turned away with a 429 before any password work.",
+    ["route", "reason"]
+)
+# Per worker; the largest value across workers in multiprocess mode.
+STARTUP_SECONDS = Gauge(
+    "gbooks_startup_seconds", "Worker start time by phase: import, get_app, lifespan and cold_start.",
+    ["phase"], multiprocess_mode="max"
+)
+
+# [count] of the request being handled, set by MetricsMiddleware. A list so
+# the threadpool and the AsyncSession greenlets, which run on copies of the
+# context, add to the request's own count.
+request_checkouts: ContextVar[list | None] = ContextVar("request_checkouts", default=None)
+
+def statement_kind(statement: str) -> str:
+    words = statement.lstrip()[:10].split(None, 1)
+    kind = words[0].upper() if words else ""
+    return kind if kind in STATEMENT_KINDS else "OTHER"
+
+def instrument_engine(engine, label: str) -> None:
+    """
+    Times every statement of `engine` (a sync Engine; pass
+    async_engine.sync_engine for the async one) with cursor execute events,
+    and counts its pool checkouts towards the current request.
+    The start time rides on the execution context, so concurrent connections
+    do not mix up their timings.
+    """
+    @event.listens_for(engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        checkouts = request_checkouts.get()
+        if checkouts is not None:
+            checkouts[0] += 1
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_metrics_started", None)
+        kind = statement_kind(statement)
+        DB_STATEMENTS.labels(label, kind).inc()
+        if started is not None:
+            DB_STATEMENT_SECONDS.labels(label, kind).observe(time.perf_counter() - started)
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waited. The pool events
+    only fire once a connection is handed out, hence the subclass.
+    """
+    engine_label = "sync"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.labels(self.engine_label).observe(time.perf_counter() - started)
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """
+    TimedQueuePool for the async engine.
+    """
+    engine_label = "async"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.labels(self.engine_label).observe(time.perf_counter() - started)
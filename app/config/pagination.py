@@ -0,0 +1,2 @@
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
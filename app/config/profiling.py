@@ -0,0 +1,15 @@
+import os
+
+# Fraction of requests profiled at random (0 disables sampling). Administrators
+# can also profile a single request by sending PROFILE_HEADER: 1 or adding
+# ?profile=1 with their bearer token.
+PROFILE_SAMPLE_RATE = float(os.getenv("GBOOKS_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_HEADER = "x-profile"
+PROFILE_QUERY_PARAM = "profile"
+# How often the sampler thread records the stack of each profiled request.
+# Below sys.getswitchinterval() (5 ms) the sampler mostly waits for the GIL.
+PROFILE_INTERVAL_MS = float(os.getenv("GBOOKS_PROFILE_INTERVAL_MS", "5"))
+# Profiles kept per worker; the oldest is dropped first.
+PROFILE_BUFFER_SIZE = int(os.getenv("GBOOKS_PROFILE_BUFFER_SIZE", "100"))
+# Samples recorded per request at most, so a stuck request stays bounded.
+PROFILE_MAX_SAMPLES = int(os.getenv("GBOOKS_PROFILE_MAX_SAMPLES", "20000"))
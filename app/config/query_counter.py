@@ -0,0 +1,33 @@
+from sqlalchemy import event
+
+from app.config.database import engine, async_engine
+
+class QueryCounter:
+    """
+    Context manager that records every SQL statement sent through the sync and
+    async engines while it is active.
+
+        with QueryCounter() as counter:
+            client.get("/api/books/get-book/1")
+        assert counter.count <= 1, counter.statements
+    """
+    def __init__(self, engines=None):
+        self.engines = engines or [engine, async_engine.sync_engine]
+        self.statements: list[tuple[str, object]] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append((statement, parameters))
+
+    def __enter__(self):
+        for target in self.engines:
+            event.listen(target, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        for target in self.engines:
+            event.remove(target, "before_cursor_execute", self._record)
+        return False
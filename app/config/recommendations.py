@@ -0,0 +1,9 @@
+import os
+
+# Neighbours kept per book in book_similarities.
+RECOMMENDATIONS_TOP_K = int(os.getenv("GBOOKS_RECOMMENDATIONS_TOP_K", "20"))
+# Pairs of books read or owned together by fewer users are ignored.
+RECOMMENDATIONS_MIN_COOCCURRENCE = int(os.getenv("GBOOKS_RECOMMENDATIONS_MIN_COOCCURRENCE", "1"))
+# How often each worker refreshes the similarity table. 0 disables the
+# background refresh; the worker then only loads what is already stored.
+RECOMMENDATIONS_REFRESH_SECONDS = float(os.getenv("GBOOKS_RECOMMENDATIONS_REFRESH_SECONDS", "3600"))
@@ -0,0 +1,6 @@
+import os
+
+# In-memory cache of serialized catalog and book detail responses, per worker.
+# Entries are evicted least recently used first once either limit is reached.
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("GBOOKS_RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("GBOOKS_RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
@@ -0,0 +1,19 @@
+import os
+
+# `python -m app` starts the development server (auto-reload, one worker);
+# `python -m app prod` migrates, runs the preflight checks and then starts
+# the workers below.
+SERVER_HOST = os.getenv("GBOOKS_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("GBOOKS_PORT", "8000"))
+SERVER_LOG_LEVEL = os.getenv("GBOOKS_LOG_LEVEL", "info")
+SERVER_WORKERS = int(os.getenv("GBOOKS_WORKERS", "2"))
+# Import and build the app once in the parent and fork the workers from it,
+# like gunicorn --preload: workers share the imported modules copy-on-write
+# and start without importing anything. With 0 uvicorn spawns fresh workers.
+SERVER_PRELOAD = os.getenv("GBOOKS_PRELOAD", "1") == "1"
+# Whether get_app() runs Base.metadata.create_all. The production launcher
+# turns it off: the schema comes from `alembic upgrade head` in the preflight.
+CREATE_SCHEMA = os.getenv("GBOOKS_CREATE_SCHEMA", "1") == "1"
+# time.time() when the launcher started, exported to the workers so each can
+# report its cold start. Read when a worker is ready, not at import.
+LAUNCH_TIME_VARIABLE = "GBOOKS_LAUNCH_TIME"
@@ -1,11 +1,18 @@
+import base64
+import binascii
+import json
 from fastapi import HTTPException
-from app.config.database import Session
-from app.models.books import Book as BookModel, BookOwner as BookOwnerModel, ReadedBook as ReadedBookModel
+from sqlalchemy import func, null, or_, select
+from sqlalchemy.orm import Session as SQLSession
+from app.config.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.controller.facets import facet_counts_bulk_finish_statements, facet_counts_bulk_start_statement
+from app.controller.response_cache import book_versions_bulk_statements, cache_version_column
+from app.controller.search import search_version_bulk_statement
+from app.models.books import Book as BookModel, BookCacheVersion, BookOwner as BookOwnerModel, ReadedBook as ReadedBookModel, BookedBook as BookedBookModel, normalize_isbn
 from app.models.users import User
 from app.schemas.book import BookSchema, ReturnBookSchema, OwnerBookSchema
 from app.schemas.user import NonSensitiveUserSchema
-from app.schemas.user_book import BookSchemaWithOwner
-from app.controller.users import query_users
+from app.schemas.user_book import BookSchemaWithOwner, BookPageSchema
 
 def get_parse_bookModel_bookSchemaOwner(books: BookModel, user: User) -> BookSchemaWithOwner:
   """
@@ -23,11 +30,26 @@ def get_parse_bookModel_bookSchemaOwner(books: BookModel, user: User) -> BookSch
       cover=books.cover,
       language=books.language,
       available=books.available,
-      owner_id=user.id,
+      owner_id=user.id if user else None,
       owner=user,
       date_added=books.date_added
   )
 
+def encode_cursor(book_id: int, owner_row_id: int) -> str:
+  """
+  Builds the opaque cursor pointing right after the given (book, ownership) row.
+  """
+  raw = f"{book_id}:{owner_row_id}".encode()
+  return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[int, int]:
+  padded = cursor + "=" * (-len(cursor) % 4)
+  try:
+    book_id, owner_row_id = (int(part) for part in base64.urlsafe_b64decode(padded).decode().split(":"))
+  except (ValueError, binascii.Error, UnicodeDecodeError):
+    raise HTTPException(status_code=400, detail="Invalid cursor")
+  return book_id, owner_row_id
+
 def get_parse_book(book: BookSchemaWithOwner) -> BookSchema:
   book_data: BookSchema = BookSchema(
       title=book.title,
@@ -50,114 +72,350 @@ def get_parse_book_owner(book: BookSchemaWithOwner, book_id: int) -> OwnerBookSc
   )
   return book_owner
 
-def add_new_book(book: BookSchemaWithOwner = None, books: list[BookSchemaWithOwner] = None) -> BookSchemaWithOwner:
-  if book:
-    db = Session()
+def add_new_book(db: SQLSession, book: BookSchemaWithOwner = None, books: list[BookSchemaWithOwner] = None) -> BookSchemaWithOwner | str:
+  if not book and not books:
+    raise ValueError("Either book or books must be provided")
 
+  if book:
     parsed_book = get_parse_book(book)
     new_book = BookModel(**parsed_book.model_dump())
-    
-    parsed_owner = get_parse_book_owner(book, new_book.id)
-    new_book_owner = BookOwnerModel(**parsed_owner.model_dump())
-    
     db.add(new_book)
-    db.add(new_book_owner)
-    db.commit()
-    db.refresh(new_book)
-    db.refresh(new_book_owner)
-    db.close()
-    response = BookSchemaWithOwner.from_orm(new_book)
-
-  if books:
-    db = Session()
-    book_objects: list[BookModel] = []
-
-    for b in books:
-      parsed_book = get_parse_book(b)
-      new_book = BookModel(**parsed_book.model_dump())
-      db.add(new_book)
-      book_objects.append(new_book)
-    
     db.flush()  # Flush to get the new_book.id
 
-    for new_book, original in zip(book_objects, books):
-      parsed_owner = get_parse_book_owner(original, new_book.id)
-      new_book_owner = BookOwnerModel(**parsed_owner.model_dump())
-      db.add(new_book_owner)
+    parsed_owner = get_parse_book_owner(book, new_book.id)
+    db.add(BookOwnerModel(**parsed_owner.model_dump()))
+    db.flush()
+    return book.model_copy(update={"id": new_book.id})
 
+  # The bulk marker is the first write, so the write lock is held from the
+  # ISBN lookup to the commit and concurrent batches cannot both insert a book.
+  db.execute(facet_counts_bulk_start_statement())
+  isbns = [normalize_isbn(b.isbn) for b in books]
+  book_ids = dict(db.execute(isbn_lookup_statement(isbns)).all()) if any(isbns) else {}
+  new_rows = get_new_book_rows(isbns, book_ids)
+  book_objects = get_book_models([books[row] for row in new_rows])
+  db.add_all(book_objects)
+  db.flush()  # Flush to get the new_book.id
+  row_book_ids = get_row_book_ids(isbns, book_ids, new_rows, [new_book.id for new_book in book_objects])
+  pairs = get_attached_pairs([b.owner_id for b in books], row_book_ids, new_rows)
+  owned = {tuple(row) for row in db.execute(owned_pairs_statement(pairs))} if pairs else set()
+  owner_rows = get_new_owner_rows([b.owner_id for b in books], row_book_ids, owned)
+  db.add_all(get_book_owner_models([books[row] for row in owner_rows], [row_book_ids[row] for row in owner_rows]))
+  db.flush()
+  new_ids = [new_book.id for new_book in book_objects]
+  first_id, last_id = (min(new_ids), max(new_ids)) if new_ids else (None, None)
+  for statement in facet_counts_bulk_finish_statements(first_id, last_id) + book_versions_bulk_statements([row_book_ids[row] for row in owner_rows]):
+    db.execute(statement)
+  if new_ids:
+    db.execute(search_version_bulk_statement())
+  return "Books added successfully"
 
-    db.commit()
-    db.refresh(new_book)
-    db.refresh(new_book_owner)
-    db.close()
-    response = "Books added successfully"
-  else:
-    raise ValueError("Either book or books must be provided")
-  return response
+def get_book_models(books: list[BookSchemaWithOwner]) -> list[BookModel]:
+  return [BookModel(**get_parse_book(b).model_dump()) for b in books]
+
+def get_book_owner_models(books: list[BookSchemaWithOwner], book_ids: list[int]) -> list[BookOwnerModel]:
+  return [
+    BookOwnerModel(**get_parse_book_owner(original, book_id).model_dump())
+    for book_id, original in zip(book_ids, books)
+  ]
+
+def isbn_lookup_statement(isbns: list[str | None]):
+  """
+  The oldest book of each canonical ISBN, one index seek per ISBN on
+  ix_books_isbn_canonical. The ISBNs are bound as a single JSON array, so a
+  batch of any size stays under SQLite's limit on bound parameters.
+  """
+  values = func.json_each(json.dumps(sorted({isbn for isbn in isbns if isbn}))).table_valued("value")
+  return select(BookModel.isbn_canonical, func.min(BookModel.id)).where(
+    BookModel.isbn_canonical.in_(select(values.c.value))
+  ).group_by(BookModel.isbn_canonical)
+
+def get_new_book_rows(isbns: list[str | None], book_ids: dict[str, int]) -> list[int]:
+  """
+  Deduplicates a batch by canonical ISBN with a set: returns the positions of
+  the rows that need a new book, which are the rows without a valid ISBN and
+  the first row of every ISBN that is neither in the catalog (book_ids) nor
+  earlier in the batch.
+  """
+  seen = set(book_ids)
+  new_rows = []
+  for position, isbn in enumerate(isbns):
+    if isbn is None or isbn not in seen:
+      seen.add(isbn)
+      new_rows.append(position)
+  return new_rows
+
+def get_row_book_ids(isbns: list[str | None], book_ids: dict[str, int], new_rows: list[int], new_book_ids: list[int]) -> list[int]:
+  """
+  The book every row of the batch ends up owning: its own new book, or the
+  existing book with the same ISBN.
+  """
+  inserted = dict(zip(new_rows, new_book_ids))
+  book_ids = {**book_ids, **{isbns[row]: book_id for row, book_id in inserted.items() if isbns[row]}}
+  return [inserted[position] if position in inserted else book_ids[isbn] for position, isbn in enumerate(isbns)]
+
+def get_attached_pairs(owner_ids: list[int], row_book_ids: list[int], new_rows: list[int]) -> set[tuple[int, int]]:
+  """
+  The (owner_id, book_id) pairs of the rows attached to a book that was
+  already in the catalog: only those can already be owned.
+  """
+  new = set(new_rows)
+  return {(owner_ids[position], book_id) for position, book_id in enumerate(row_book_ids) if position not in new}
+
+def owned_pairs_statement(pairs: set[tuple[int, int]]):
+  """
+  Which of these (owner_id, book_id) pairs already exist, one index seek per
+  pair on ix_book_owners_owner_id_book_id, bound as a single JSON array like
+  isbn_lookup_statement.
+  """
+  values = func.json_each(json.dumps(sorted(pairs))).table_valued("value")
+  return select(BookOwnerModel.owner_id, BookOwnerModel.book_id).distinct().select_from(values).join(
+    BookOwnerModel,
+    (BookOwnerModel.owner_id == func.json_extract(values.c.value, "$[0]")) &
+    (BookOwnerModel.book_id == func.json_extract(values.c.value, "$[1]"))
+  )
+
+def get_new_owner_rows(owner_ids: list[int], row_book_ids: list[int], owned: set[tuple[int, int]]) -> list[int]:
+  """
+  Positions of the rows that need an ownership row: the owner does not own
+  the book yet (owned) and no earlier row of the batch gave it to them.
+  """
+  seen = set(owned)
+  owner_rows = []
+  for position, pair in enumerate(zip(owner_ids, row_book_ids)):
+    if pair not in seen:
+      seen.add(pair)
+      owner_rows.append(position)
+  return owner_rows
+
+# Only the columns ReturnBookSchema needs, so listings skip e.g. description.
+RETURN_BOOK_COLUMNS = (
+  BookModel.id,
+  BookModel.title,
+  BookModel.author,
+  BookModel.published_year,
+  BookModel.isbn,
+  BookModel.pages,
+  BookModel.cover,
+  BookModel.language,
+  BookModel.available,
+  BookModel.date_added,
+)
+
+def owned_books_statement(email: str):
+  """
+  Books owned by the user with this email, in one round-trip. The outer joins
+  start from the user, so an existing user without books still yields one row
+  (with NULL book columns) and an unknown user yields none.
+  """
+  return select(
+    User.id.label("owner_id"),
+    *RETURN_BOOK_COLUMNS
+  ).select_from(User).outerjoin(
+    BookOwnerModel, BookOwnerModel.owner_id == User.id
+  ).outerjoin(
+    BookModel, BookModel.id == BookOwnerModel.book_id
+  ).where(User.email == email).order_by(BookOwnerModel.book_id)
+
+def borrowed_books_statement(email: str):
+  """
+  Books the user with this email has borrowed and not returned yet, with the
+  same columns and the same one-row-per-known-user outer joins as
+  owned_books_statement. owner_id is NULL: the owners are not joined.
+  """
+  return select(
+    *RETURN_BOOK_COLUMNS,
+    null().label("owner_id")
+  ).select_from(User).outerjoin(
+    BookedBookModel, (BookedBookModel.user_id == User.id) & BookedBookModel.end.is_(None)
+  ).outerjoin(
+    BookModel, BookModel.id == BookedBookModel.book_id
+  ).where(User.email == email).order_by(BookedBookModel.id)
+
+def book_by_isbn_statement(isbn: str):
+  """
+  The oldest book with this canonical ISBN, an index seek on
+  ix_books_isbn_canonical. Books imported before deduplication may share an
+  ISBN; the oldest is the one later imports attach their owners to.
+  """
+  return select(*RETURN_BOOK_COLUMNS).where(BookModel.isbn_canonical == isbn).order_by(BookModel.id).limit(1)
 
-def query_books(id: int = None, email: str = None, borrowed: bool = None) -> list[BookSchemaWithOwner] | ReturnBookSchema:
-  db = Session()
+def book_detail_statement(book_id: int):
+  """
+  A book with its first owner in one round-trip. Books without owners are
+  still returned, with a NULL user.
+  """
+  return select(BookModel, User).outerjoin(
+    BookOwnerModel, BookOwnerModel.book_id == BookModel.id
+  ).outerjoin(
+    User, User.id == BookOwnerModel.owner_id
+  ).where(BookModel.id == book_id).order_by(BookOwnerModel.id).limit(1)
+
+# The owner's public columns, labelled so a catalog row is flat.
+OWNER_FIELDS = tuple(NonSensitiveUserSchema.model_fields)
+OWNER_COLUMNS = tuple(getattr(User, field).label(f"owner_{field}") for field in OWNER_FIELDS)
+BOOK_FIELDS = tuple(column.key for column in RETURN_BOOK_COLUMNS)
+MAX_SQLITE_INTEGER = 2**63 - 1
+
+def catalog_page_statement(limit: int, cursor: str = None):
+  """
+  Keyset pagination: a book with several owners yields several rows, so the
+  cursor holds both the book ID and the book_owners row ID of the last item.
+  Without a cursor the page starts at (0, 0), so every page is an index range
+  seek on ix_book_owners_book_id, already in (book_id, id) order.
+  Fetches one extra row to know whether there is a next page. Rows are plain
+  columns (book, then owner, then the book_owners row ID), not ORM objects.
+  """
+  return select(
+    *RETURN_BOOK_COLUMNS,
+    *OWNER_COLUMNS,
+    BookOwnerModel.id.label("owner_row_id")
+  ).select_from(BookOwnerModel).join(
+    BookModel, BookModel.id == BookOwnerModel.book_id
+  ).join(
+    User, BookOwnerModel.owner_id == User.id
+  ).where(
+    *after_catalog_cursor(cursor)
+  ).order_by(BookOwnerModel.book_id, BookOwnerModel.id).limit(limit + 1)
+
+def after_catalog_cursor(cursor: str = None) -> tuple:
+  last_book_id, last_owner_row_id = decode_cursor(cursor) if cursor else (0, 0)
+  return (
+    # The redundant "book_id >= last" lets SQLite seek instead of scanning.
+    BookOwnerModel.book_id >= last_book_id,
+    or_(BookOwnerModel.book_id > last_book_id, BookOwnerModel.id > last_owner_row_id)
+  )
+
+def catalog_page_version_statement(limit: int, cursor: str = None):
+  """
+  Version of the catalog page at this cursor: the latest stamp in
+  book_cache_versions among the books from the cursor's to the one of the
+  extra row catalog_page_statement fetches, or to the end of the catalog when
+  there is none. Any insert, update or delete that moves a row into, out of
+  or within the page stamps a book in that range, so the version grows;
+  writes elsewhere in the catalog leave it alone.
+
+  The bound is an index-only walk over ix_book_owners_book_id, without the
+  joins of the page: it assumes every book_owners row has its book and owner,
+  as the foreign keys require.
+  """
+  limit = max(1, min(limit, MAX_PAGE_SIZE))
+  last_book_id = decode_cursor(cursor)[0] if cursor else 0
+  upper_book_id = select(BookOwnerModel.book_id).where(
+    *after_catalog_cursor(cursor)
+  ).order_by(BookOwnerModel.book_id, BookOwnerModel.id).offset(limit).limit(1).correlate(None).scalar_subquery()
+  return select(func.max(BookCacheVersion.version)).where(
+    BookCacheVersion.book_id >= last_book_id,
+    BookCacheVersion.book_id <= func.coalesce(upper_book_id, MAX_SQLITE_INTEGER)
+  ).correlate(None)
+
+def book_version_statement(book_id: int):
+  return select(BookCacheVersion.version).where(BookCacheVersion.book_id == book_id).correlate(None)
+
+def get_catalog_row_dict(row) -> dict:
+  """
+  Projects a catalog row straight into the BookSchemaWithOwner JSON shape.
+  """
+  book_values = row[:len(BOOK_FIELDS)]
+  owner = dict(zip(OWNER_FIELDS, row[len(BOOK_FIELDS):len(BOOK_FIELDS) + len(OWNER_FIELDS)]))
+  owner["is_active"] = bool(owner["is_active"])
+  book = dict(zip(BOOK_FIELDS, book_values))
+  book["owner_id"] = owner["id"]
+  book["owner"] = owner
+  return book
+
+def get_catalog_page_dict(rows: list, limit: int) -> dict:
+  """
+  Fast path of get_parse_catalog_page: builds the page as plain dicts, ready
+  for orjson, without creating or validating any pydantic model.
+  """
+  next_cursor = None
+  if len(rows) > limit:
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1].id, rows[-1].owner_row_id)
+  return {"items": [get_catalog_row_dict(row) for row in rows], "next_cursor": next_cursor}
+
+def get_parse_owned_books(rows: list) -> list[ReturnBookSchema]:
+  if not rows:
+    raise HTTPException(status_code=404, detail="User not found")
+  return [ReturnBookSchema(**row._mapping) for row in rows if row.id is not None]
+
+def get_parse_book_detail(row) -> BookSchemaWithOwner:
+  if row is None:
+    raise HTTPException(status_code=404, detail="Book not found")
+  book, user = row
+  return get_parse_bookModel_bookSchemaOwner(book, user)
+
+def get_parse_catalog_page(rows: list, limit: int) -> BookPageSchema:
+  return BookPageSchema.model_validate(get_catalog_page_dict(rows, limit))
+
+def get_owned_books_dicts(rows: list) -> list[dict]:
+  """
+  Fast path of get_parse_owned_books: the rows already have the
+  ReturnBookSchema columns, so they are returned as dicts unchanged.
+  """
+  if not rows:
+    raise HTTPException(status_code=404, detail="User not found")
+  return [row._asdict() for row in rows if row.id is not None]
+
+def query_books(db: SQLSession, id: int = None, email: str = None, borrowed: bool = None, limit: int = DEFAULT_PAGE_SIZE, cursor: str = None, raw: bool = False) -> BookPageSchema | dict | list[dict] | list[ReturnBookSchema] | BookSchemaWithOwner:
+  """
+  With raw=True the list results (owned books and catalog pages) come back as
+  plain dicts in the response shape, for routes that encode them with orjson
+  instead of validating them again against a response_model.
+  """
   try:
-    if borrowed:
-      if not email:
-        raise HTTPException(status_code=400, detail="Email is required to query borrowed books")
-      user = query_users(email=email, sensitive=False)
-      
-      if not user:
-        db.close()
-        raise HTTPException(status_code=404, detail="User not found")
-      
-      book_owners = db.query(BookOwnerModel).filter(BookOwnerModel.owner_id == user.id).all()
-      books = [db.query(BookModel).filter(BookModel.id == bo.book_id).first() for bo in book_owners]
-      response: list[ReturnBookSchema] = []
-      for book in books:
-          book_with_owner = ReturnBookSchema.from_orm(book)
-          book_with_owner.owner_id = user.id
-          response.append(book_with_owner)
-      return response
+    if borrowed and not email:
+      raise HTTPException(status_code=400, detail="Email is required to query borrowed books")
 
     if email:
-      user = query_users(email=email, sensitive=False)
-      if not user:
-        db.close()
-        raise HTTPException(status_code=404, detail="User not found")
-      books = db.query(BookModel).join(BookOwnerModel).filter(BookOwnerModel.owner_id == user.id).all()
-      response: list[ReturnBookSchema] = []
-      for book in books:
-          book_with_owner = ReturnBookSchema.from_orm(book)
-          book_with_owner.owner_id = user.id
-          response.append(book_with_owner)
-      return response
+      statement = borrowed_books_statement(email) if borrowed else owned_books_statement(email)
+      rows = db.execute(statement).all()
+      return get_owned_books_dicts(rows) if raw else get_parse_owned_books(rows)
 
     if id:
-      book = db.query(BookModel).filter(BookModel.id == id).first()
-      if not book:
-        db.close()
-        raise HTTPException(status_code=404, detail="Book not found")
-      
-      owner_id = db.query(BookOwnerModel).filter(BookOwnerModel.book_id == id).first()
-      owner = query_users(id=owner_id.owner_id, sensitive=False)
-
-      response = get_parse_bookModel_bookSchemaOwner(book, owner)
-      return response
-
-    books = db.query(
-      BookModel,
-      User
-    ).select_from(BookModel).join(
-      BookOwnerModel, BookModel.id == BookOwnerModel.book_id
-    ).join(
-      User, BookOwnerModel.owner_id == User.id
-    ).all()
-    db.close()
-    
-    response = []
-    for book, user in books:
-      book_with_owner = get_parse_bookModel_bookSchemaOwner(book, user)
-      response.append(book_with_owner)
-    
-    return response
+      row = db.execute(book_detail_statement(id)).first()
+      return get_parse_book_detail(row)
+
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    rows = db.execute(catalog_page_statement(limit, cursor)).all()
+    return get_catalog_page_dict(rows, limit) if raw else get_parse_catalog_page(rows, limit)
+  except HTTPException:
+    raise
   except Exception as e:
     raise HTTPException(status_code=500, detail=str(e))
-  finally:
-    db.close()
\ No newline at end of file
+
+def query_versioned_catalog_page(db: SQLSession, version: int, limit: int = DEFAULT_PAGE_SIZE, cursor: str = None) -> tuple[int, dict]:
+  """
+  A raw catalog page and the catalog version it was read at, from one SELECT.
+  An empty page has no row to carry the version, so it keeps the version the
+  caller read before.
+  """
+  limit = max(1, min(limit, MAX_PAGE_SIZE))
+  rows = db.execute(catalog_page_statement(limit, cursor).add_columns(cache_version_column(catalog_page_version_statement(limit, cursor)))).all()
+  return (rows[0].cache_version if rows else version), get_catalog_page_dict(rows, limit)
+
+def query_versioned_book(db: SQLSession, book_id: int) -> tuple[int, BookSchemaWithOwner]:
+  """
+  query_books(id=...) together with the book's version, from one SELECT.
+  """
+  row = db.execute(book_detail_statement(book_id).add_columns(cache_version_column(book_version_statement(book_id)))).first()
+  return (row.cache_version if row else 0), get_parse_book_detail(row[:2] if row else None)
+
+def get_canonical_isbn(isbn: str) -> str:
+  canonical = normalize_isbn(isbn)
+  if canonical is None:
+    raise HTTPException(status_code=422, detail="Not a valid ISBN-10 or ISBN-13")
+  return canonical
+
+def get_parse_book_by_isbn(row) -> ReturnBookSchema:
+  if row is None:
+    raise HTTPException(status_code=404, detail="Book not found")
+  return ReturnBookSchema(**row._mapping)
+
+def query_book_by_isbn(db: SQLSession, isbn: str) -> ReturnBookSchema:
+  """
+  Looks a book up by ISBN-10 or ISBN-13, with or without hyphens.
+  """
+  row = db.execute(book_by_isbn_statement(get_canonical_isbn(isbn))).first()
+  return get_parse_book_by_isbn(row)
@@ -0,0 +1,283 @@
+import asyncio
+import csv
+import json
+import time
+from typing import AsyncIterator, NamedTuple
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from app.config.database import engine
+from app.controller.books import get_attached_pairs, get_new_book_rows, get_new_owner_rows, get_row_book_ids, isbn_lookup_statement, owned_pairs_statement
+from app.controller.facets import facet_counts_bulk_finish_statements, facet_counts_bulk_start_statement
+from app.controller.response_cache import book_versions_bulk_statements
+from app.controller.search import search_version_bulk_statement
+from app.models.books import Book as BookModel, BookOwner as BookOwnerModel, normalize_isbn
+from app.models.users import User
+from app.schemas.book import BookImportSchema, ImportChunkReportSchema, ImportReportSchema, ImportRowErrorSchema
+
+DEFAULT_IMPORT_CHUNK_SIZE = 5000
+MAX_IMPORT_CHUNK_SIZE = 50000
+# Rejected rows listed per chunk in the report; the rest are only counted.
+MAX_ERRORS_PER_CHUNK = 20
+# A CSV record may span lines inside quoted fields; one that grows past this
+# is rejected, so an unbalanced quote cannot buffer the rest of the upload.
+MAX_CSV_RECORD_CHARS = 1 << 20
+# Longer lines are rejected without being buffered, in either format.
+MAX_IMPORT_LINE_BYTES = 1 << 20
+
+BOOK_FIELD_SET = {field for field in BookImportSchema.model_fields if field != "owner_id"}
+
+class OverlongLine(NamedTuple):
+  """
+  Stands in for a line longer than MAX_IMPORT_LINE_BYTES, which is dropped
+  as it arrives. Keeps the number of quotes in it, so CSV parsing still
+  knows whether the line closed a quoted field.
+  """
+  quotes: int
+
+async def iter_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, bytes | OverlongLine]]:
+  """
+  Splits the request body into (line number, raw line) as it arrives. Only
+  the new data is searched for line breaks, and at most one partial line of
+  up to MAX_IMPORT_LINE_BYTES is held between reads; the rest of a longer
+  line is skipped and the line is yielded as an OverlongLine.
+  """
+  pending = bytearray()
+  dropped_quotes: int | None = None
+  line_number = 0
+  async for data in stream:
+    start = 0
+    while (end := data.find(b"\n", start)) >= 0:
+      line_number += 1
+      if dropped_quotes is not None:
+        yield line_number, OverlongLine(dropped_quotes + data.count(b'"', start, end))
+        dropped_quotes = None
+      elif len(pending) + end - start > MAX_IMPORT_LINE_BYTES:
+        yield line_number, OverlongLine(pending.count(b'"') + data.count(b'"', start, end))
+        pending.clear()
+      elif pending:
+        pending += data[start:end]
+        line = bytes(pending)
+        pending.clear()
+        yield line_number, line
+      else:
+        yield line_number, data[start:end]
+      start = end + 1
+    if dropped_quotes is not None:
+      dropped_quotes += data.count(b'"', start)
+    elif len(pending) + len(data) - start > MAX_IMPORT_LINE_BYTES:
+      dropped_quotes = pending.count(b'"') + data.count(b'"', start)
+      pending.clear()
+    else:
+      pending += memoryview(data)[start:]
+  if dropped_quotes is not None:
+    yield line_number + 1, OverlongLine(dropped_quotes)
+  elif pending:
+    yield line_number + 1, bytes(pending)
+
+async def iter_records(stream: AsyncIterator[bytes], format: str) -> AsyncIterator[tuple[int, dict | str]]:
+  """
+  Yields (line number, record) where record is the parsed row, or the parse
+  error message.
+
+  A CSV record spans lines while it has an open quoted field, so the line
+  breaks csv.writer keeps inside quoted fields (as in /export) survive the
+  round trip; the record is reported under its first line number. Quotes
+  inside a field must be doubled, as csv.writer does.
+  """
+  header = None
+  record: list[str] | None = None
+  record_line = record_chars = 0
+  record_error: str | None = None
+  open_quote = False
+  async for line_number, raw in iter_lines(stream):
+    if isinstance(raw, OverlongLine):
+      line, error = "", f"Line {line_number} is longer than {MAX_IMPORT_LINE_BYTES} bytes"
+    else:
+      try:
+        line, error = raw.decode("utf-8-sig" if line_number == 1 else "utf-8"), None
+      except UnicodeDecodeError as e:
+        line, error = "", f"Invalid UTF-8 on line {line_number}: {e}"
+    if format != "csv":
+      if error is not None:
+        yield line_number, error
+        continue
+      if not line.strip():
+        continue
+      try:
+        parsed = json.loads(line)
+      except json.JSONDecodeError as e:
+        yield line_number, f"Invalid JSON: {e}"
+        continue
+      yield line_number, parsed if isinstance(parsed, dict) else "Each line must be a JSON object"
+      continue
+
+    if record is None:
+      if error is None and not line.strip():
+        continue
+      record, record_line, record_chars, record_error = [], line_number, 0, None
+    record_chars += len(line)
+    if record_error is None:
+      if error is not None:
+        record_error = error
+      elif record_chars > MAX_CSV_RECORD_CHARS:
+        record_error = f"Record longer than {MAX_CSV_RECORD_CHARS} characters"
+      else:
+        record.append(line + "\n")
+    # Quotes are ASCII, so they can be counted on undecodable lines too.
+    quotes = raw.quotes if isinstance(raw, OverlongLine) else raw.count(b'"')
+    open_quote ^= quotes % 2 == 1
+    if open_quote:
+      continue
+    lines, record = record, None
+    if record_error is not None:
+      yield record_line, record_error
+      continue
+    values = next(csv.reader(lines))
+    if header is None:
+      header = values
+      continue
+    if len(values) != len(header):
+      yield record_line, f"Expected {len(header)} columns, got {len(values)}"
+      continue
+    yield record_line, {key: value for key, value in zip(header, values) if value != ""}
+  if record is not None:
+    yield record_line, record_error or "Unterminated quoted field"
+
+def insert_chunk(rows: list[tuple[int, BookImportSchema]]) -> tuple[int, int, int, list[ImportRowErrorSchema]]:
+  """
+  Inserts one validated chunk in a single transaction with two Core
+  executemany statements. RETURNING hands back the new book IDs, so the
+  ownership rows can be built without any per-row round-trip.
+
+  Rows repeating an ISBN already in the catalog, or earlier in the chunk, do
+  not insert a book: they only add an owner to the existing one, unless that
+  owner already has it. Returns the books inserted, the rows attached to an
+  existing book, the rows skipped as already owned, and the errors.
+  """
+  errors: list[ImportRowErrorSchema] = []
+  with engine.begin() as conn:
+    owner_ids = {book.owner_id for _, book in rows}
+    known_owners = set(conn.execute(select(User.id).where(User.id.in_(owner_ids))).scalars())
+    accepted = []
+    for line_number, book in rows:
+      if book.owner_id in known_owners:
+        accepted.append(book)
+      else:
+        errors.append(ImportRowErrorSchema(line=line_number, error=f"Unknown owner_id {book.owner_id}"))
+    if not accepted:
+      return 0, 0, 0, errors
+
+    # Facet counts and cache versions are written once for the whole chunk,
+    # not by the insert triggers. Writing the marker first also takes SQLite's
+    # write lock before the ISBN lookup, so a concurrent chunk cannot insert
+    # the same ISBN between the lookup and the insert.
+    conn.execute(facet_counts_bulk_start_statement())
+    isbns = [normalize_isbn(book.isbn) for book in accepted]
+    book_ids = dict(conn.execute(isbn_lookup_statement(isbns)).all()) if any(isbns) else {}
+    new_rows = get_new_book_rows(isbns, book_ids)
+    # SQLite does not promise RETURNING order, and asking SQLAlchemy for
+    # parameter order makes it fall back to one INSERT per row. But this
+    # transaction is the only writer, and SQLite gives each new row max(id) + 1,
+    # so sorting the returned IDs recovers the insertion order.
+    new_book_ids = []
+    if new_rows:
+      new_book_ids = sorted(conn.execute(
+        insert(BookModel).returning(BookModel.id),
+        [{**accepted[row].model_dump(include=BOOK_FIELD_SET), "isbn_canonical": isbns[row]} for row in new_rows]
+      ).scalars().all())
+    row_book_ids = get_row_book_ids(isbns, book_ids, new_rows, new_book_ids)
+    owner_ids = [book.owner_id for book in accepted]
+    pairs = get_attached_pairs(owner_ids, row_book_ids, new_rows)
+    owned = {tuple(row) for row in conn.execute(owned_pairs_statement(pairs))} if pairs else set()
+    owner_rows = get_new_owner_rows(owner_ids, row_book_ids, owned)
+    if owner_rows:
+      conn.execute(insert(BookOwnerModel), [
+        {"book_id": row_book_ids[row], "owner_id": owner_ids[row], "date_added": accepted[row].date_added}
+        for row in owner_rows
+      ])
+    first_id, last_id = (new_book_ids[0], new_book_ids[-1]) if new_book_ids else (None, None)
+    for statement in facet_counts_bulk_finish_statements(first_id, last_id) + book_versions_bulk_statements([row_book_ids[row] for row in owner_rows]):
+      conn.execute(statement)
+    if new_book_ids:
+      conn.execute(search_version_bulk_statement())
+  return len(new_rows), len(owner_rows) - len(new_rows), len(accepted) - len(owner_rows), errors
+
+async def import_books(stream: AsyncIterator[bytes], format: str = "ndjson", chunk_size: int = DEFAULT_IMPORT_CHUNK_SIZE) -> ImportReportSchema:
+  """
+  Validates the upload chunk_size rows at a time and inserts every chunk in
+  its own transaction on the threadpool, so a bad row only rejects itself and
+  a failing chunk only rejects its own rows, without undoing the chunks
+  before it or stopping the ones after. The next chunk is parsed
+  while the previous one is being written; at most two chunks are in memory.
+  """
+  if format not in ("ndjson", "csv"):
+    raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+  chunk_size = max(1, min(chunk_size, MAX_IMPORT_CHUNK_SIZE))
+  started = time.perf_counter()
+  chunks: list[ImportChunkReportSchema] = []
+  writing: asyncio.Task | None = None
+
+  async def write_chunk(number: int, rows: list, invalid: list) -> ImportChunkReportSchema:
+    try:
+      inserted, attached, already_owned, errors = await run_in_threadpool(insert_chunk, rows) if rows else (0, 0, 0, [])
+    except SQLAlchemyError as e:
+      # The chunk's transaction was rolled back: its rows are rejected and
+      # the upload goes on with the next chunk.
+      error = f"Chunk not written: {getattr(e, 'orig', None) or e}"
+      inserted, attached, already_owned = 0, 0, 0
+      errors = [ImportRowErrorSchema(line=line_number, error=error) for line_number, _ in rows]
+    errors = invalid + errors
+    return ImportChunkReportSchema(
+      chunk=number,
+      inserted=inserted,
+      attached=attached,
+      already_owned=already_owned,
+      rejected=len(errors),
+      errors=errors[:MAX_ERRORS_PER_CHUNK],
+    )
+
+  async def flush(rows: list, invalid: list):
+    nonlocal writing
+    if writing is not None:
+      chunks.append(await writing)
+    writing = asyncio.create_task(write_chunk(len(chunks) + 1, rows, invalid))
+
+  rows: list[tuple[int, BookImportSchema]] = []
+  invalid: list[ImportRowErrorSchema] = []
+  try:
+    async for line_number, record in iter_records(stream, format):
+      if isinstance(record, str):
+        invalid.append(ImportRowErrorSchema(line=line_number, error=record))
+      else:
+        try:
+          rows.append((line_number, BookImportSchema.model_validate(record)))
+        except ValidationError as e:
+          invalid.append(ImportRowErrorSchema(line=line_number, error=str(e.errors(include_url=False))))
+      if len(rows) + len(invalid) >= chunk_size:
+        await flush(rows, invalid)
+        rows, invalid = [], []
+    if rows or invalid:
+      await flush(rows, invalid)
+    if writing is not None:
+      chunks.append(await writing)
+  finally:
+    if writing is not None and not writing.done():
+      # The client went away mid-upload: let the chunk being written finish.
+      await asyncio.shield(writing)
+
+  seconds = time.perf_counter() - started
+  inserted = sum(chunk.inserted for chunk in chunks)
+  attached = sum(chunk.attached for chunk in chunks)
+  already_owned = sum(chunk.already_owned for chunk in chunks)
+  return ImportReportSchema(
+    inserted=inserted,
+    attached=attached,
+    already_owned=already_owned,
+    rejected=sum(chunk.rejected for chunk in chunks),
+    seconds=round(seconds, 3),
+    rows_per_second=round((inserted + attached + already_owned) / seconds, 1) if seconds else 0.0,
+    chunks=chunks,
+  )
@@ -0,0 +1,333 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator
+from fastapi import HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from fastapi.staticfiles import StaticFiles
+from PIL import Image, ImageOps
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session as SQLSession
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSQLSession
+from starlette.datastructures import Headers
+from starlette.types import Receive, Scope, Send
+from app.config.covers import (
+  COVERS_DIR, COVERS_URL, COVER_MAX_BYTES, COVER_MAX_PIXELS, COVER_THUMBNAIL_WIDTHS,
+  COVER_JPEG_QUALITY, COVER_WEBP_QUALITY, COVER_POOL_WORKERS,
+  COVER_MEMORY_MAX_BYTES, COVER_MEMORY_MAX_FILE_BYTES
+)
+from app.config.database import run_in_session, session_unit_of_work
+from app.controller.response_cache import ResponseCache, etag_matches
+from app.models.books import Book as BookModel
+from app.schemas.book import BookCoverSchema, CoverUploadSchema
+
+logger = logging.getLogger("uvicorn.error")
+
+_executor: ProcessPoolExecutor | None = None
+
+# Leading bytes of the formats accepted as covers, and the extension they are stored with.
+COVER_SIGNATURES = (
+  (b"\xff\xd8\xff", "jpg"),
+  (b"\x89PNG\r\n\x1a\n", "png"),
+)
+
+# <sha256>.<ext> for uploads, <sha256>-<width>.<ext> for thumbnails.
+COVER_NAME_PATTERN = re.compile(r"^[0-9a-f]{64}(-[0-9]+)?\.(jpg|png|webp)$")
+COVER_MEDIA_TYPES = {"jpg": "image/jpeg", "png": "image/png", "webp": "image/webp"}
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Cover bytes by file name. The version is always 0: a name never changes content.
+cover_file_cache = ResponseCache(max_entries=COVER_MEMORY_MAX_BYTES // 1024, max_bytes=COVER_MEMORY_MAX_BYTES)
+
+def get_cover_executor() -> ProcessPoolExecutor:
+  """
+  Lazily creates the resizing pool, so processes are only forked inside the
+  uvicorn worker that actually receives uploads.
+  """
+  global _executor
+  if _executor is None:
+    _executor = ProcessPoolExecutor(max_workers=COVER_POOL_WORKERS)
+  return _executor
+
+def shutdown_cover_executor() -> None:
+  global _executor
+  if _executor is not None:
+    _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+
+def sniff_cover_format(head: bytes) -> str | None:
+  for signature, extension in COVER_SIGNATURES:
+    if head.startswith(signature):
+      return extension
+  if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+    return "webp"
+  return None
+
+def cover_url(name: str) -> str:
+  return f"{COVERS_URL}/{name}"
+
+def check_cover_header(path: str) -> None:
+  """
+  Image.open only parses the header, so this reads the size without decoding
+  any pixel. Fails with 415 when Pillow cannot parse the image and with 413
+  when it has more than COVER_MAX_PIXELS, so such a cover is never stored or
+  handed to the cover pool.
+  """
+  try:
+    with Image.open(path) as opened:
+      width, height = opened.size
+  except Image.DecompressionBombError:
+    raise HTTPException(status_code=413, detail=f"Cover must be at most {COVER_MAX_PIXELS} pixels")
+  except (OSError, SyntaxError, ValueError):
+    raise HTTPException(status_code=415, detail="Cover is not a valid JPEG, PNG or WebP image")
+  if width * height > COVER_MAX_PIXELS:
+    raise HTTPException(status_code=413, detail=f"Cover is {width}x{height}, over {COVER_MAX_PIXELS} pixels")
+
+async def store_cover(stream: AsyncIterator[bytes], content_length: int | None = None) -> tuple[str, str, int]:
+  """
+  Writes the upload to a temporary file while hashing it, then moves it to
+  <sha256>.<ext> under COVERS_DIR. Returns (file name, sha256, size). Fails
+  with 413 as soon as the body goes over COVER_MAX_BYTES and with 415 when it
+  is not a JPEG, PNG or WebP image; check_cover_header rejects unreadable
+  and oversized images before the move. A cover that is already stored is
+  kept and the new copy discarded.
+  """
+  if content_length is not None and content_length > COVER_MAX_BYTES:
+    raise HTTPException(status_code=413, detail=f"Cover must be at most {COVER_MAX_BYTES} bytes")
+
+  COVERS_DIR.mkdir(parents=True, exist_ok=True)
+  digest = hashlib.sha256()
+  size = 0
+  head = b""
+  fd, temp_path = tempfile.mkstemp(dir=COVERS_DIR, prefix=".upload-")
+  try:
+    with os.fdopen(fd, "wb") as file:
+      async for data in stream:
+        size += len(data)
+        if size > COVER_MAX_BYTES:
+          raise HTTPException(status_code=413, detail=f"Cover must be at most {COVER_MAX_BYTES} bytes")
+        if len(head) < 12:
+          head += data[:12]
+        digest.update(data)
+        await run_in_threadpool(file.write, data)
+
+    extension = sniff_cover_format(head)
+    if extension is None:
+      raise HTTPException(status_code=415, detail="Cover must be a JPEG, PNG or WebP image")
+    await run_in_threadpool(check_cover_header, temp_path)
+
+    sha256 = digest.hexdigest()
+    name = f"{sha256}.{extension}"
+    if (COVERS_DIR / name).exists():
+      os.unlink(temp_path)
+    else:
+      os.chmod(temp_path, 0o644)
+      os.replace(temp_path, COVERS_DIR / name)
+    return name, sha256, size
+  except BaseException:
+    if os.path.exists(temp_path):
+      os.unlink(temp_path)
+    raise
+
+def _save_atomically(image, path: Path, **options) -> None:
+  # Per process: two uploads of the same image may render it at once.
+  temp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+  image.save(temp_path, **options)
+  os.replace(temp_path, path)
+
+def render_cover_variants(source: str) -> dict:
+  """
+  Runs in the cover pool: writes a full-size WebP and, for every thumbnail
+  width smaller than the image, a JPEG and a WebP next to the source. Files
+  that already exist (the same cover uploaded before) are not rendered again.
+  Returns the variant file names.
+  """
+  Image.MAX_IMAGE_PIXELS = COVER_MAX_PIXELS
+  source = Path(source)
+  stem = source.name.split(".")[0]
+  variants = {"original": source.name, "webp": f"{stem}.webp", "thumbnails": {}}
+
+  with Image.open(source) as opened:
+    # MAX_IMAGE_PIXELS only raises above twice the limit (below that Pillow
+    # just warns), so the header size is checked here, before any decoding.
+    if opened.width * opened.height > COVER_MAX_PIXELS:
+      raise Image.DecompressionBombError(f"Cover is {opened.width}x{opened.height}, over {COVER_MAX_PIXELS} pixels")
+    image = ImageOps.exif_transpose(opened).convert("RGB")
+  if not (source.parent / variants["webp"]).exists():
+    _save_atomically(image, source.parent / variants["webp"], format="WEBP", quality=COVER_WEBP_QUALITY, method=4)
+
+  for width in sorted(COVER_THUMBNAIL_WIDTHS):
+    if width >= image.width:
+      break
+    names = {"jpeg": f"{stem}-{width}.jpg", "webp": f"{stem}-{width}.webp"}
+    if not all((source.parent / name).exists() for name in names.values()):
+      height = round(image.height * width / image.width)
+      thumbnail = image.resize((width, height), Image.Resampling.LANCZOS)
+      _save_atomically(thumbnail, source.parent / names["jpeg"], format="JPEG", quality=COVER_JPEG_QUALITY, optimize=True, progressive=True)
+      _save_atomically(thumbnail, source.parent / names["webp"], format="WEBP", quality=COVER_WEBP_QUALITY, method=4)
+    variants["thumbnails"][str(width)] = names
+  return variants
+
+def get_parse_cover_variants(variants: dict) -> dict:
+  """
+  The stored variant file names as URLs, in the shape returned to clients.
+  """
+  return {
+    "original": cover_url(variants["original"]),
+    "webp": cover_url(variants["webp"]),
+    "thumbnails": {
+      width: {kind: cover_url(name) for kind, name in names.items()}
+      for width, names in variants["thumbnails"].items()
+    },
+  }
+
+def get_parse_book_cover(row) -> BookCoverSchema:
+  if row is None:
+    raise HTTPException(status_code=404, detail="Book not found")
+  variants = get_parse_cover_variants(json.loads(row.cover_variants)) if row.cover_variants else None
+  return BookCoverSchema(book_id=row.id, cover=row.cover, variants=variants)
+
+def book_cover_query(book_id: int):
+  return select(BookModel.id, BookModel.cover, BookModel.cover_variants).where(BookModel.id == book_id)
+
+def book_cover_statement(book_id: int, cover: str):
+  # cover_variants is reset to NULL until the new variants are rendered.
+  return update(BookModel).where(BookModel.id == book_id).values(cover=cover, cover_variants=None)
+
+def cover_variants_statement(book_id: int, cover: str, variants: dict):
+  # Only if the book still has this cover, so a slow render never overwrites a newer upload.
+  return update(BookModel).where(BookModel.id == book_id, BookModel.cover == cover).values(cover_variants=json.dumps(variants))
+
+def accepts_webp(accept: str | None) -> bool:
+  for media_range in (accept or "").split(","):
+    media_type, _, params = media_range.partition(";")
+    if media_type.strip() == "image/webp":
+      return params.replace(" ", "") not in ("q=0", "q=0.0")
+  return False
+
+def choose_cover_variant(row, width: int | None, webp: bool) -> str | None:
+  """
+  File name of the variant to send for a book row (cover, cover_variants):
+  the smallest thumbnail at least `width` pixels wide, otherwise the full-size
+  image; WebP when the client accepts it. While the variants are still being
+  rendered the uploaded file is used. None when the book has no stored cover.
+  """
+  kind = "webp" if webp else "jpeg"
+  if row.cover_variants:
+    variants = json.loads(row.cover_variants)
+    if width is not None:
+      for thumbnail_width in sorted(int(w) for w in variants["thumbnails"]):
+        if thumbnail_width >= width:
+          return variants["thumbnails"][str(thumbnail_width)][kind]
+    return variants["webp"] if webp else variants["original"]
+  prefix = f"{COVERS_URL}/"
+  if row.cover and row.cover.startswith(prefix):
+    return row.cover[len(prefix):]
+  return None
+
+class CoverFileResponse(FileResponse):
+  """
+  FileResponse (so Range and If-Range keep working) that hands the file to
+  the server with the ASGI pathsend extension when the server offers it,
+  letting it use sendfile instead of reading the file through Python.
+  """
+  chunk_size = 256 * 1024
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+    self.pathsend = "http.response.pathsend" in scope.get("extensions", {})
+    await super().__call__(scope, receive, send)
+
+  async def _handle_simple(self, send: Send, send_header_only: bool) -> None:
+    if not self.pathsend or send_header_only:
+      return await super()._handle_simple(send, send_header_only)
+    await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+    await send({"type": "http.response.pathsend", "path": str(self.path)})
+
+async def cover_file_response(request_headers: Headers, name: str, cache_control: str, vary: str | None = None) -> Response:
+  """
+  Sends a stored cover. Its name is its content hash, which makes it a strong
+  ETag. Small files (thumbnails) are kept in memory; larger ones and Range
+  requests go through CoverFileResponse.
+  """
+  etag = f'"{name}"'
+  headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+  if vary:
+    headers["Vary"] = vary
+  if etag_matches(request_headers.get("if-none-match"), etag):
+    return Response(status_code=304, headers=headers)
+
+  media_type = COVER_MEDIA_TYPES[name.rsplit(".", 1)[-1]]
+  ranged = "range" in request_headers
+  body = None if ranged else cover_file_cache.get((name,), 0)
+  if body is not None:
+    return Response(content=body, media_type=media_type, headers=headers)
+
+  path = COVERS_DIR / name
+  try:
+    stat_result = await run_in_threadpool(os.stat, path)
+  except FileNotFoundError:
+    raise HTTPException(status_code=404, detail="Cover not found")
+  if not ranged and stat_result.st_size <= COVER_MEMORY_MAX_FILE_BYTES:
+    body = await run_in_threadpool(path.read_bytes)
+    cover_file_cache.set((name,), 0, body)
+    return Response(content=body, media_type=media_type, headers=headers)
+  return CoverFileResponse(path, headers=headers, media_type=media_type, stat_result=stat_result)
+
+class CoverStaticFiles(StaticFiles):
+  """
+  Serves COVERS_DIR at COVERS_URL. Only content-hashed names are served, with
+  Cache-Control: immutable, so clients never revalidate them.
+  """
+  async def get_response(self, path: str, scope: Scope) -> Response:
+    if scope["method"] not in ("GET", "HEAD"):
+      raise HTTPException(status_code=405)
+    if not COVER_NAME_PATTERN.match(path):
+      raise HTTPException(status_code=404, detail="Cover not found")
+    return await cover_file_response(Headers(scope=scope), path, IMMUTABLE_CACHE_CONTROL)
+
+def query_book_cover_row(db: SQLSession, book_id: int):
+  row = db.execute(book_cover_query(book_id)).first()
+  if row is None:
+    raise HTTPException(status_code=404, detail="Book not found")
+  return row
+
+def query_book_cover(db: SQLSession, book_id: int) -> BookCoverSchema:
+  return get_parse_book_cover(db.execute(book_cover_query(book_id)).first())
+
+def set_book_cover(db: SQLSession, book_id: int, cover: str) -> None:
+  db.execute(book_cover_statement(book_id, cover))
+
+def set_cover_variants(db: SQLSession, book_id: int, cover: str, variants: dict) -> None:
+  db.execute(cover_variants_statement(book_id, cover, variants))
+
+async def upload_cover(db: SQLSession | AsyncSQLSession, book_id: int, stream: AsyncIterator[bytes], content_length: int | None = None) -> CoverUploadSchema:
+  """
+  Stores the cover and points the book at it. The variants are rendered
+  afterwards by generate_cover_variants, so they start out as None.
+  """
+  # Raises 404 before anything is stored.
+  await run_in_session(db, query_book_cover, book_id)
+  name, sha256, size = await store_cover(stream, content_length)
+  await run_in_session(db, set_book_cover, book_id, cover_url(name))
+  return CoverUploadSchema(book_id=book_id, cover=cover_url(name), sha256=sha256, size=size)
+
+async def generate_cover_variants(book_id: int, name: str) -> None:
+  """
+  Background task run after the upload response: renders the variants in the
+  cover pool and records them on the book. It runs outside the request's
+  unit of work, so it opens its own.
+  """
+  try:
+    variants = await asyncio.get_running_loop().run_in_executor(get_cover_executor(), render_cover_variants, str(COVERS_DIR / name))
+  except Exception:
+    logger.exception("Error rendering cover variants for book %d", book_id)
+    return
+  async with session_unit_of_work() as db:
+    await run_in_session(db, set_cover_variants, book_id, cover_url(name), variants)
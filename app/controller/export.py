@@ -0,0 +1,66 @@
+import csv
+import io
+import json
+from typing import Iterator
+from sqlalchemy import select
+from app.config.database import engine
+from app.models.books import Book as BookModel, BookOwner as BookOwnerModel
+
+# Rows fetched from SQLite per round and written per chunk to the response.
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_COLUMNS = (
+  BookModel.id,
+  BookModel.title,
+  BookModel.author,
+  BookModel.published_year,
+  BookModel.isbn,
+  BookModel.pages,
+  BookModel.cover,
+  BookModel.language,
+  BookModel.description,
+  BookModel.available,
+  BookModel.date_added,
+  BookOwnerModel.owner_id,
+)
+
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+def export_statement():
+  """
+  One row per (book, owner), in the same order as /get-all-books.
+  """
+  return select(*EXPORT_COLUMNS).select_from(BookOwnerModel).join(
+    BookModel, BookModel.id == BookOwnerModel.book_id
+  ).order_by(BookOwnerModel.book_id, BookOwnerModel.id)
+
+def iter_catalog_batches() -> Iterator[list]:
+  """
+  Streams the catalog EXPORT_BATCH_SIZE rows at a time through a Core
+  connection: no ORM objects, no Pydantic models and never more than one batch
+  in memory.
+  """
+  with engine.connect() as conn:
+    result = conn.execution_options(yield_per=EXPORT_BATCH_SIZE).execute(export_statement())
+    for batch in result.partitions():
+      yield batch
+
+def export_books_ndjson() -> Iterator[bytes]:
+  for batch in iter_catalog_batches():
+    yield "".join(json.dumps(dict(row._mapping), ensure_ascii=False) + "\n" for row in batch).encode()
+
+def export_books_csv() -> Iterator[bytes]:
+  """
+  Line breaks inside fields (descriptions) are kept: csv.writer quotes those
+  fields, and /import reads a quoted field across lines, so the file can be
+  imported back unchanged.
+  """
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  writer.writerow(EXPORT_FIELDS)
+  yield buffer.getvalue().encode()
+  for batch in iter_catalog_batches():
+    buffer.seek(0)
+    buffer.truncate()
+    writer.writerows(batch)
+    yield buffer.getvalue().encode()
@@ -0,0 +1,88 @@
+from fastapi import HTTPException
+from sqlalchemy import delete, insert, literal, select, text, union_all
+from sqlalchemy.orm import Session as SQLSession
+from app.models.books import BookFacetCount, BookFacetCountsBulkWrite, FACET_COUNTS_BULK_INSERT, FACET_VALUES
+from app.schemas.book import BookFacetsSchema, FacetValueSchema
+
+DEFAULT_FACET_LIMIT = 20
+MAX_FACET_LIMIT = 200
+
+def facet_counts_bulk_start_statement():
+  """
+  Run in a bulk write's transaction before its books are inserted: while the
+  marker row exists the insert trigger leaves the counts alone.
+  """
+  return insert(BookFacetCountsBulkWrite).prefix_with("OR IGNORE").values(id=1)
+
+def facet_counts_bulk_finish_statements(first_id: int | None, last_id: int | None) -> list:
+  """
+  Run in the same transaction after the inserts: adds the counts of books
+  first_id..last_id with one GROUP BY and drops the marker before commit.
+  A batch that only added owners passes None and just drops the marker.
+  """
+  counts = [text(FACET_COUNTS_BULK_INSERT).bindparams(first_id=first_id, last_id=last_id)] if first_id is not None else []
+  return counts + [delete(BookFacetCountsBulkWrite)]
+
+def get_facet_filter(filters: dict[str, str | int | bool | None]) -> tuple[str, str]:
+  """
+  The (filter_facet, filter_value) key of the counts to read: ('', '') for
+  the whole catalog. The counts are kept per single filter, so at most one
+  facet can be filtered on.
+  """
+  active = [(facet, value) for facet, value in filters.items() if value is not None]
+  if len(active) > 1:
+    raise HTTPException(status_code=400, detail="Facet counts can be filtered by one facet at a time")
+  if not active:
+    return "", ""
+  facet, value = active[0]
+  # Stored as text, the way SQLite casts the column: available is '1' or '0'.
+  return facet, str(int(value)) if isinstance(value, bool) else str(value)
+
+def facet_counts_statement(filter_facet: str, filter_value: str, limit: int):
+  """
+  The top values of every facet in one statement: each branch reads at most
+  `limit` rows from the end of ix_book_facet_counts_top, however many books
+  the catalog has. The filtered facet is read without the filter.
+  """
+  branches = []
+  for facet in FACET_VALUES:
+    key = ("", "") if facet == filter_facet else (filter_facet, filter_value)
+    top = select(BookFacetCount.value, BookFacetCount.count).where(
+      BookFacetCount.filter_facet == key[0],
+      BookFacetCount.filter_value == key[1],
+      BookFacetCount.facet == facet,
+      BookFacetCount.count > 0
+    ).order_by(BookFacetCount.count.desc(), BookFacetCount.value).limit(
+      # Both availability values are always read: the total is their sum.
+      max(limit, 2) if facet == "available" else limit
+    ).subquery()
+    branches.append(select(literal(facet).label("facet"), top.c.value, top.c.count))
+  return union_all(*branches)
+
+def get_facet_value(facet: str, value: str) -> str | int | bool:
+  if facet == "published_year":
+    return int(value)
+  if facet == "available":
+    return value == "1"
+  return value
+
+def get_parse_facets(rows: list, filter_facet: str, filter_value: str) -> BookFacetsSchema:
+  facets = {facet: [] for facet in FACET_VALUES}
+  for row in rows:
+    facets[row.facet].append(FacetValueSchema(value=get_facet_value(row.facet, row.value), count=row.count))
+  availability = [row for row in rows if row.facet == "available"]
+  if filter_facet == "available":
+    total = sum(row.count for row in availability if row.value == filter_value)
+  else:
+    total = sum(row.count for row in availability)
+  return BookFacetsSchema(total=total, **facets)
+
+def query_facets(db: SQLSession, filters: dict[str, str | int | bool | None], limit: int = DEFAULT_FACET_LIMIT) -> BookFacetsSchema:
+  """
+  Book counts per language, author, published_year and available, from
+  book_facet_counts, which the triggers on books keep up to date.
+  """
+  filter_facet, filter_value = get_facet_filter(filters)
+  limit = max(1, min(limit, MAX_FACET_LIMIT))
+  rows = db.execute(facet_counts_statement(filter_facet, filter_value, limit)).all()
+  return get_parse_facets(rows, filter_facet, filter_value)
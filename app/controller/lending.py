@@ -0,0 +1,154 @@
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session as SQLSession
+from app.config.lending import IDEMPOTENCY_KEY_TTL_HOURS
+from app.models.books import Book as BookModel, BookedBook as BookedBookModel, LendingRequest
+from app.schemas.book import LendingSchema
+
+BORROW = "borrow"
+RETURN = "return"
+
+def lending_now() -> str:
+  return datetime.now(timezone.utc).isoformat()
+
+def book_availability_statement(book_id: int):
+  return select(BookModel.available).where(BookModel.id == book_id)
+
+def open_lending_statement(book_id: int, user_id: int):
+  return select(BookedBookModel.id).where(
+    BookedBookModel.book_id == book_id, BookedBookModel.user_id == user_id, BookedBookModel.end.is_(None)
+  )
+
+def claim_book_statement(book_id: int):
+  """
+  The whole borrow race in one statement: of any number of concurrent
+  requests, in any worker, exactly one finds the book available and flips
+  it; the others update no row. SQLite runs writers one at a time, so no
+  read-then-write window exists between the check and the change.
+  """
+  return update(BookModel).where(
+    BookModel.id == book_id, BookModel.available.isnot(False)
+  ).values(available=False).execution_options(synchronize_session=False)
+
+def release_book_statement(book_id: int, user_id: int):
+  """
+  The return counterpart of claim_book_statement: only the borrower's first
+  return finds the open loan and makes the book available again.
+  """
+  return update(BookModel).where(
+    BookModel.id == book_id, open_lending_statement(book_id, user_id).exists()
+  ).values(available=True).execution_options(synchronize_session=False)
+
+def close_lending_statement(book_id: int, user_id: int, end: str):
+  """
+  Closes the user's open loan of the book and returns it. The partial unique
+  index on open loans guarantees there is at most one.
+  """
+  return update(BookedBookModel).where(
+    BookedBookModel.book_id == book_id, BookedBookModel.user_id == user_id, BookedBookModel.end.is_(None)
+  ).values(end=end).returning(
+    BookedBookModel.id, BookedBookModel.start
+  ).execution_options(synchronize_session=False)
+
+def claim_key_statement(user_id: int, key: str, action: str, book_id: int, now: str):
+  """
+  Records the key before doing anything else. This is the transaction's first
+  write, so a concurrent retry with the same key waits for this one to commit
+  and then finds the key taken, instead of racing it for the book.
+  """
+  return insert(LendingRequest).values(
+    user_id=user_id, key=key, action=action, book_id=book_id, created_at=now
+  ).on_conflict_do_nothing()
+
+def purge_keys_statement(now: str):
+  cutoff = (datetime.fromisoformat(now) - timedelta(hours=IDEMPOTENCY_KEY_TTL_HOURS)).isoformat()
+  return delete(LendingRequest).where(LendingRequest.created_at < cutoff)
+
+def record_key_statement(user_id: int, key: str, booked_book_id: int):
+  return update(LendingRequest).where(
+    LendingRequest.user_id == user_id, LendingRequest.key == key
+  ).values(booked_book_id=booked_book_id).execution_options(synchronize_session=False)
+
+def replayed_lending_statement(user_id: int, key: str):
+  return select(LendingRequest.action, LendingRequest.book_id, BookedBookModel).join(
+    BookedBookModel, BookedBookModel.id == LendingRequest.booked_book_id
+  ).where(LendingRequest.user_id == user_id, LendingRequest.key == key)
+
+def get_parse_replayed_lending(row, action: str, book_id: int) -> LendingSchema:
+  # Keys are committed together with their loan; a missing one was deleted since.
+  if row is None:
+    raise HTTPException(status_code=409, detail="The loan of this Idempotency-Key no longer exists")
+  stored_action, stored_book_id, lending = row
+  if stored_action != action or stored_book_id != book_id:
+    raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+  return LendingSchema.model_validate(lending)
+
+def get_lending_conflict(book_exists: bool, action: str) -> HTTPException:
+  if not book_exists:
+    return HTTPException(status_code=404, detail="Book not found")
+  if action == BORROW:
+    return HTTPException(status_code=409, detail="Book is already borrowed")
+  return HTTPException(status_code=409, detail="You have not borrowed this book")
+
+def borrow_book(db: SQLSession, book_id: int, user_id: int, idempotency_key: str = None) -> tuple[LendingSchema, bool]:
+  """
+  Lends the book to the user. Returns the loan and whether it is the stored
+  result of an earlier request with the same Idempotency-Key.
+
+  Replays and requests for a lent book are answered from plain reads, which
+  SQLite runs outside any write transaction, so under contention only the
+  requests that can still win queue for the write lock. The loan's start is
+  taken once the book is claimed, under that lock, so it never predates the
+  end of the previous loan.
+  """
+  now = lending_now()
+  if idempotency_key:
+    row = db.execute(replayed_lending_statement(user_id, idempotency_key)).first()
+    if row is not None:
+      return get_parse_replayed_lending(row, BORROW, book_id), True
+  book = db.execute(book_availability_statement(book_id)).first()
+  if book is None or book.available is False:
+    raise get_lending_conflict(book is not None, BORROW)
+
+  if idempotency_key:
+    if db.execute(claim_key_statement(user_id, idempotency_key, BORROW, book_id, now)).rowcount == 0:
+      row = db.execute(replayed_lending_statement(user_id, idempotency_key)).first()
+      return get_parse_replayed_lending(row, BORROW, book_id), True
+    db.execute(purge_keys_statement(now))
+  if db.execute(claim_book_statement(book_id)).rowcount == 0:
+    raise get_lending_conflict(True, BORROW)
+  lending = BookedBookModel(book_id=book_id, user_id=user_id, start=lending_now())
+  db.add(lending)
+  db.flush()
+  if idempotency_key:
+    db.execute(record_key_statement(user_id, idempotency_key, lending.id))
+  return LendingSchema.model_validate(lending), False
+
+def return_book(db: SQLSession, book_id: int, user_id: int, idempotency_key: str = None) -> tuple[LendingSchema, bool]:
+  """
+  Closes the user's loan of the book and makes it available again. Like
+  borrow_book, it only takes the write lock once a read found the loan, and
+  takes the loan's end under it.
+  """
+  now = lending_now()
+  if idempotency_key:
+    row = db.execute(replayed_lending_statement(user_id, idempotency_key)).first()
+    if row is not None:
+      return get_parse_replayed_lending(row, RETURN, book_id), True
+  if db.execute(open_lending_statement(book_id, user_id)).first() is None:
+    raise get_lending_conflict(db.get(BookModel, book_id) is not None, RETURN)
+
+  if idempotency_key:
+    if db.execute(claim_key_statement(user_id, idempotency_key, RETURN, book_id, now)).rowcount == 0:
+      row = db.execute(replayed_lending_statement(user_id, idempotency_key)).first()
+      return get_parse_replayed_lending(row, RETURN, book_id), True
+    db.execute(purge_keys_statement(now))
+  if db.execute(release_book_statement(book_id, user_id)).rowcount == 0:
+    raise get_lending_conflict(True, RETURN)
+  end = lending_now()
+  closed = db.execute(close_lending_statement(book_id, user_id, end)).first()
+  if idempotency_key:
+    db.execute(record_key_statement(user_id, idempotency_key, closed.id))
+  return LendingSchema(id=closed.id, book_id=book_id, user_id=user_id, start=closed.start, end=end), False
@@ -0,0 +1,89 @@
+import os
+import time
+from fastapi import Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+from prometheus_client import multiprocess
+from starlette.routing import Mount
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.config.metrics import (
+  METRICS_MULTIPROC_DIR, HTTP_REQUESTS, HTTP_REQUEST_SECONDS, HTTP_REQUESTS_IN_PROGRESS, DB_CHECKOUTS_PER_REQUEST,
+  request_checkouts
+)
+
+# Label for requests that matched no route, so scanners cannot create series.
+UNMATCHED_ROUTE = "<unmatched>"
+
+class MetricsMiddleware:
+  """
+  Pure ASGI middleware that times every HTTP request and labels it with the
+  route template ("/api/books/get-book/{book_id}") instead of the raw path.
+  The router records the matched endpoint in the scope; the template is
+  looked up from it once the response is done. It also counts the pool
+  checkouts the request made.
+  """
+  def __init__(self, app: ASGIApp):
+    self.app = app
+    self.templates: dict | None = None
+
+  def route_template(self, scope: Scope) -> str:
+    if self.templates is None:
+      templates = {}
+      for route in scope["app"].routes:
+        if isinstance(route, Mount):
+          templates[id(route.app)] = f"{route.path}/{{path}}"
+        elif hasattr(route, "endpoint"):
+          templates[id(route.endpoint)] = route.path
+      self.templates = templates
+    endpoint = scope.get("endpoint")
+    return self.templates.get(id(endpoint), UNMATCHED_ROUTE) if endpoint is not None else UNMATCHED_ROUTE
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+    if scope["type"] != "http":
+      await self.app(scope, receive, send)
+      return
+
+    method = scope["method"]
+    status = 500
+    started = time.perf_counter()
+
+    async def send_wrapper(message: Message) -> None:
+      nonlocal status
+      if message["type"] == "http.response.start":
+        status = message["status"]
+      await send(message)
+
+    in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method)
+    in_progress.inc()
+    checkouts = [0]
+    checkouts_token = request_checkouts.set(checkouts)
+    try:
+      await self.app(scope, receive, send_wrapper)
+    finally:
+      request_checkouts.reset(checkouts_token)
+      in_progress.dec()
+      route = self.route_template(scope)
+      DB_CHECKOUTS_PER_REQUEST.labels(method, route).observe(checkouts[0])
+      HTTP_REQUEST_SECONDS.labels(method, route).observe(time.perf_counter() - started)
+      HTTP_REQUESTS.labels(method, route, str(status)).inc()
+
+def metrics_registry():
+  """
+  This worker's registry, or, in multiprocess mode, one that merges the
+  files every worker writes to PROMETHEUS_MULTIPROC_DIR.
+  """
+  if METRICS_MULTIPROC_DIR:
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+  return REGISTRY
+
+async def metrics_endpoint(request: Request) -> Response:
+  return Response(generate_latest(metrics_registry()), media_type=CONTENT_TYPE_LATEST)
+
+def mark_worker_dead() -> None:
+  """
+  Drops this worker's live gauges from the multiprocess files on shutdown,
+  so in-progress counts of a stopped worker do not linger.
+  """
+  if METRICS_MULTIPROC_DIR:
+    multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,61 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import HTTPException
+
+from app.config.authentication import pwd_context, PASSWORD_POOL_KIND, PASSWORD_POOL_WORKERS, PASSWORD_POOL_MAX_QUEUE
+from app.config.metrics import PASSWORD_SECONDS
+
+_executor: Executor | None = None
+_pending = 0
+
+def get_password_executor() -> Executor:
+    """
+    Lazily creates the worker pool, so processes are only forked inside the
+    uvicorn worker that actually hashes passwords.
+    """
+    global _executor
+    if _executor is None:
+        if PASSWORD_POOL_KIND == "process":
+            _executor = ProcessPoolExecutor(max_workers=PASSWORD_POOL_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=PASSWORD_POOL_WORKERS, thread_name_prefix="bcrypt")
+    return _executor
+
+def shutdown_password_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify_and_update(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+async def run_password_task(task, *args, operation: str = "hash"):
+    """
+    Runs a bcrypt task on the pool. The counter is only touched from the event
+    loop thread, so it needs no lock.
+    """
+    global _pending
+    if _pending >= PASSWORD_POOL_MAX_QUEUE:
+        raise HTTPException(status_code=503, detail="Too many password operations in progress", headers={"Retry-After": "1"})
+    _pending += 1
+    started = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(get_password_executor(), task, *args)
+    finally:
+        _pending -= 1
+        PASSWORD_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+async def hash_password(password: str) -> str:
+    return await run_password_task(_hash, password, operation="hash")
+
+async def verify_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """
+    Returns whether the password matches and, when the stored hash was made
+    with a different bcrypt cost than BCRYPT_ROUNDS, the replacement hash.
+    """
+    return await run_password_task(_verify_and_update, plain_password, hashed_password, operation="verify")
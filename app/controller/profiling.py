@@ -0,0 +1,260 @@
+import asyncio
+import itertools
+import os
+import random
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter, deque
+from pathlib import Path
+from starlette.datastructures import Headers, QueryParams
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.config.profiling import (
+  PROFILE_SAMPLE_RATE, PROFILE_HEADER, PROFILE_QUERY_PARAM, PROFILE_INTERVAL_MS, PROFILE_BUFFER_SIZE, PROFILE_MAX_SAMPLES
+)
+from app.config.database import session_unit_of_work
+from app.controller.users import get_admin_user
+from app.schemas.profile import ProfileSchema
+
+APP_ROOT = str(Path(__file__).resolve().parent.parent.parent) + os.sep
+STDLIB_ROOT = sysconfig.get_paths()["stdlib"] + os.sep
+# Leaf frame of samples taken while the request was suspended: awaiting SQLite
+# on the aiosqlite thread, bcrypt on its pool, the client, ...
+WAITING_FRAME = "[waiting]"
+
+_frame_names: dict = {}
+_profile_ids = itertools.count(1)
+
+def frame_name(code) -> str:
+  """
+  "function (path:first line)", with paths relative to the repository,
+  site-packages or the standard library, cached per code object.
+  """
+  name = _frame_names.get(code)
+  if name is None:
+    filename = code.co_filename
+    if filename.startswith(APP_ROOT):
+      filename = filename[len(APP_ROOT):]
+    elif "site-packages" + os.sep in filename:
+      filename = filename.split("site-packages" + os.sep, 1)[1]
+    elif filename.startswith(STDLIB_ROOT):
+      filename = filename[len(STDLIB_ROOT):]
+    name = f"{code.co_name} ({filename}:{code.co_firstlineno})"
+    _frame_names[code] = name
+  return name
+
+class ProfileSession:
+  """
+  One profiled request: the task that runs it, the frame its stacks start
+  at and the collapsed stacks sampled so far.
+  """
+  def __init__(self, scope: Scope, trigger: str, root_frame):
+    self.id = f"{os.getpid()}-{next(_profile_ids)}"
+    self.method = scope["method"]
+    self.path = scope["path"]
+    self.trigger = trigger
+    self.loop = asyncio.get_running_loop()
+    self.task = asyncio.current_task()
+    self.thread_id = threading.get_ident()
+    self.root_frame = root_frame
+    self.stacks: Counter[str] = Counter()
+    self.samples = 0
+    self.status = None
+    self.started_at = time.time()
+    self.duration_ms = None
+
+  def running_stack(self, frame) -> list[str]:
+    names = []
+    while frame is not None:
+      names.append(frame_name(frame.f_code))
+      if frame is self.root_frame:
+        break
+      frame = frame.f_back
+    names.reverse()
+    return names
+
+  def waiting_stack(self) -> list[str]:
+    names = []
+    awaitable = self.task.get_coro()
+    started = False
+    while awaitable is not None:
+      frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None) or getattr(awaitable, "ag_frame", None)
+      if frame is None:
+        break
+      started = started or frame is self.root_frame
+      if started:
+        names.append(frame_name(frame.f_code))
+      awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None) or getattr(awaitable, "ag_await", None)
+    names.append(WAITING_FRAME)
+    return names
+
+  def sample(self, frames: dict) -> None:
+    if self.samples >= PROFILE_MAX_SAMPLES:
+      return
+    if asyncio.current_task(self.loop) is self.task:
+      frame = frames.get(self.thread_id)
+      if frame is None:
+        return
+      stack = self.running_stack(frame)
+    else:
+      stack = self.waiting_stack()
+    self.stacks[";".join(stack)] += 1
+    self.samples += 1
+
+  def finish(self, duration_ms: float) -> None:
+    """
+    Drops the references to the task and its frames, so profiles kept in
+    the buffer do not keep finished requests alive.
+    """
+    self.duration_ms = duration_ms
+    self.loop = self.task = self.root_frame = None
+
+  def schema(self) -> ProfileSchema:
+    return ProfileSchema(
+      id=self.id, method=self.method, path=self.path, status=self.status, trigger=self.trigger,
+      started_at=self.started_at, duration_ms=self.duration_ms, samples=self.samples,
+      interval_ms=PROFILE_INTERVAL_MS,
+    )
+
+class StackSampler:
+  """
+  A single daemon thread that samples every active session each
+  PROFILE_INTERVAL_MS. Wall-clock sampling: a request suspended on I/O still
+  collects samples, ending in WAITING_FRAME, so SQL and bcrypt waits show up
+  next to the Python work done on the event loop.
+  """
+  def __init__(self, interval_seconds: float):
+    self.interval_seconds = interval_seconds
+    self.sessions: set[ProfileSession] = set()
+    self._lock = threading.Lock()
+    self._wakeup = threading.Event()
+    self._thread: threading.Thread | None = None
+
+  def add(self, session: ProfileSession) -> None:
+    with self._lock:
+      self.sessions.add(session)
+      if self._thread is None:
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+    self._wakeup.set()
+
+  def remove(self, session: ProfileSession) -> None:
+    with self._lock:
+      self.sessions.discard(session)
+
+  def _run(self) -> None:
+    while True:
+      with self._lock:
+        sessions = list(self.sessions)
+        if not sessions:
+          self._wakeup.clear()
+      if not sessions:
+        self._wakeup.wait()
+        continue
+      frames = sys._current_frames()
+      for session in sessions:
+        try:
+          session.sample(frames)
+        except Exception:
+          # The request may finish while its stack is being walked.
+          pass
+      del frames
+      time.sleep(self.interval_seconds)
+
+class ProfileBuffer:
+  """
+  Ring buffer of the last `max_entries` finished profiles of this worker.
+  """
+  def __init__(self, max_entries: int):
+    self._entries: deque[ProfileSession] = deque(maxlen=max_entries)
+    self._lock = threading.Lock()
+
+  def add(self, session: ProfileSession) -> None:
+    with self._lock:
+      self._entries.append(session)
+
+  def list(self) -> list[ProfileSession]:
+    with self._lock:
+      return list(reversed(self._entries))
+
+  def get(self, profile_id: str) -> ProfileSession | None:
+    with self._lock:
+      return next((session for session in self._entries if session.id == profile_id), None)
+
+  def clear(self) -> None:
+    with self._lock:
+      self._entries.clear()
+
+stack_sampler = StackSampler(PROFILE_INTERVAL_MS / 1000)
+profile_buffer = ProfileBuffer(PROFILE_BUFFER_SIZE)
+
+def collapsed_stacks(sessions: list[ProfileSession]) -> str:
+  """
+  Brendan Gregg's collapsed format ("root;...;leaf count" per line), read by
+  flamegraph.pl, speedscope and most flamegraph viewers. Each session's
+  stacks are prefixed with "METHOD path" so merged downloads stay apart.
+  """
+  lines = []
+  for session in sessions:
+    prefix = f"{session.method} {session.path}"
+    for stack, count in session.stacks.items():
+      lines.append(f"{prefix};{stack} {count}")
+  return "\n".join(lines) + "\n" if lines else ""
+
+def requested_profile(scope: Scope) -> bool:
+  return Headers(scope=scope).get(PROFILE_HEADER) == "1" or \
+    QueryParams(scope.get("query_string", b"")).get(PROFILE_QUERY_PARAM) == "1"
+
+async def is_admin_request(scope: Scope) -> bool:
+  authorization = Headers(scope=scope).get("authorization", "")
+  scheme, _, token = authorization.partition(" ")
+  if scheme.lower() != "bearer" or not token:
+    return False
+  try:
+    async with session_unit_of_work() as db:
+      await get_admin_user(token, db)
+  except Exception:
+    return False
+  return True
+
+class ProfilingMiddleware:
+  """
+  Pure ASGI middleware that profiles a request when an administrator asks
+  for it or when it falls in PROFILE_SAMPLE_RATE. Profiled responses carry
+  an X-Profile-Id header naming the entry in /api/admin/profiles.
+  """
+  def __init__(self, app: ASGIApp):
+    self.app = app
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+    if scope["type"] != "http":
+      await self.app(scope, receive, send)
+      return
+
+    trigger = None
+    if requested_profile(scope) and await is_admin_request(scope):
+      trigger = "admin"
+    elif PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+      trigger = "sample"
+    if trigger is None:
+      await self.app(scope, receive, send)
+      return
+
+    session = ProfileSession(scope, trigger, sys._getframe())
+
+    async def send_wrapper(message: Message) -> None:
+      if message["type"] == "http.response.start":
+        session.status = message["status"]
+        message.setdefault("headers", [])
+        message["headers"] = [*message["headers"], (b"x-profile-id", session.id.encode())]
+      await send(message)
+
+    started = time.perf_counter()
+    stack_sampler.add(session)
+    try:
+      await self.app(scope, receive, send_wrapper)
+    finally:
+      stack_sampler.remove(session)
+      session.finish(round((time.perf_counter() - started) * 1000, 3))
+      profile_buffer.add(session)
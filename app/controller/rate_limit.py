@@ -0,0 +1,110 @@
+import math
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from fastapi import HTTPException, Request
+
+from app.config.authentication import (
+    AUTH_RATE_LIMIT_ENABLED, AUTH_IP_RATE_PER_MINUTE, AUTH_IP_BURST, AUTH_USERNAME_RATE_PER_MINUTE,
+    AUTH_USERNAME_BURST, AUTH_RATE_LIMIT_MAX_KEYS, AUTH_MAX_CONCURRENT
+)
+from app.config.metrics import AUTH_REJECTIONS
+
+class TokenBucketLimiter:
+    """
+    One token bucket per key (client IP, username), holding up to `burst`
+    tokens and refilled at rate_per_minute. Only the event loop thread uses
+    it, so it needs no lock.
+
+    At most max_keys buckets are kept, least recently used evicted first. An
+    evicted bucket starts over full, which is what it would have been anyway
+    unless max_keys other keys were seen within burst / rate seconds.
+    """
+    def __init__(self, rate_per_minute: float, burst: int, max_keys: int):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.max_keys = max_keys
+        self.evictions = 0
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def acquire(self, key: str) -> float:
+        """
+        Takes a token from key's bucket. Returns 0 if there was one, otherwise
+        the seconds until there will be.
+        """
+        if self.burst <= 0:
+            return 0.0
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate if self.rate > 0 else math.inf
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+            self.evictions += 1
+        return wait
+
+    def clear(self) -> None:
+        self._buckets.clear()
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._buckets),
+            "max_keys": self.max_keys,
+            "evictions": self.evictions,
+            "burst": self.burst,
+            "rate_per_minute": self.rate * 60,
+        }
+
+ip_limiter = TokenBucketLimiter(AUTH_IP_RATE_PER_MINUTE, AUTH_IP_BURST, AUTH_RATE_LIMIT_MAX_KEYS)
+username_limiter = TokenBucketLimiter(AUTH_USERNAME_RATE_PER_MINUTE, AUTH_USERNAME_BURST, AUTH_RATE_LIMIT_MAX_KEYS)
+_in_flight = 0
+
+def too_many_requests(route: str, reason: str, retry_after: float) -> HTTPException:
+    AUTH_REJECTIONS.labels(route, reason).inc()
+    # An empty bucket with no refill never recovers; ask for a minute.
+    seconds = 60 if math.isinf(retry_after) else max(1, math.ceil(retry_after))
+    return HTTPException(status_code=429, detail="Too many attempts, try again later", headers={"Retry-After": str(seconds)})
+
+@contextmanager
+def password_admission(request: Request, route: str, username: str | None):
+    """
+    Admits a /login or /register request before it touches the database or
+    bcrypt, or raises a 429 with Retry-After: when AUTH_MAX_CONCURRENT of them
+    are already running, or when the client IP or the username is out of
+    tokens. The IP is request.client, so behind a proxy run uvicorn with
+    --forwarded-allow-ips for it to be the real client.
+    """
+    global _in_flight
+    if not AUTH_RATE_LIMIT_ENABLED:
+        yield
+        return
+    if _in_flight >= AUTH_MAX_CONCURRENT:
+        raise too_many_requests(route, "concurrency", 1)
+    client_ip = request.client.host if request.client else "unknown"
+    wait = ip_limiter.acquire(client_ip)
+    if wait:
+        raise too_many_requests(route, "ip", wait)
+    if username:
+        wait = username_limiter.acquire(username.strip().lower())
+        if wait:
+            raise too_many_requests(route, "username", wait)
+
+    _in_flight += 1
+    try:
+        yield
+    finally:
+        _in_flight -= 1
+
+def admission_stats() -> dict:
+    return {
+        "enabled": AUTH_RATE_LIMIT_ENABLED,
+        "in_flight": _in_flight,
+        "max_concurrent": AUTH_MAX_CONCURRENT,
+        "ip": ip_limiter.stats(),
+        "username": username_limiter.stats(),
+    }
@@ -0,0 +1,88 @@
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.orm import Session as SQLSession
+from app.models.books import Book as BookModel, ReadedBook as ReadedBookModel, ReadingStats, MonthlyReadingStats
+from app.schemas.book import ReadedBookSchema, ReadingStatsSchema, MonthlyReadingSchema
+
+DEFAULT_STATS_MONTHS = 12
+MAX_STATS_MONTHS = 120
+
+def parse_reading_date(value: str | None, field: str) -> datetime | None:
+  if value is None:
+    return None
+  try:
+    return datetime.fromisoformat(value)
+  except ValueError:
+    raise HTTPException(status_code=400, detail=f"{field} must be an ISO date")
+
+def validate_reading_dates(start: str | None, end: str | None) -> None:
+  """
+  The rollup triggers read the dates with SQLite's date functions, so they
+  must be ISO dates and a reading cannot end before it starts.
+  """
+  start_date = parse_reading_date(start, "start")
+  end_date = parse_reading_date(end, "end")
+  if start_date and end_date and end_date < start_date:
+    raise HTTPException(status_code=400, detail="end must not be before start")
+
+def get_parse_reading(reading: ReadedBookModel) -> ReadedBookSchema:
+  return ReadedBookSchema.model_validate(reading)
+
+def reading_stats_statement(user_id: int):
+  return select(ReadingStats).where(ReadingStats.user_id == user_id)
+
+def monthly_reading_stats_statement(user_id: int, months: int):
+  return select(MonthlyReadingStats).where(
+    MonthlyReadingStats.user_id == user_id
+  ).order_by(MonthlyReadingStats.month.desc()).limit(months)
+
+def get_parse_reading_stats(user_id: int, stats: ReadingStats | None, months: list[MonthlyReadingStats]) -> ReadingStatsSchema:
+  if stats is None:
+    return ReadingStatsSchema(user_id=user_id)
+  return ReadingStatsSchema(
+    user_id=user_id,
+    finished=stats.finished,
+    pages_read=stats.pages_read,
+    average_days=round(stats.reading_days / stats.timed, 2) if stats.timed else None,
+    currently_reading=stats.reading,
+    months=[
+      MonthlyReadingSchema(month=month.month, finished=month.finished, pages_read=month.pages_read)
+      for month in months
+    ]
+  )
+
+def add_reading(db: SQLSession, reading: ReadedBookSchema) -> ReadedBookSchema:
+  """
+  Stores a reading record; the triggers on readed_books update the user's
+  reading_stats rows in the same transaction.
+  """
+  validate_reading_dates(reading.start, reading.end)
+  if db.get(BookModel, reading.book_id) is None:
+    raise HTTPException(status_code=404, detail="Book not found")
+  new_reading = ReadedBookModel(**reading.model_dump(exclude={"id"}))
+  db.add(new_reading)
+  db.flush()
+  return get_parse_reading(new_reading)
+
+def get_user_reading(reading: ReadedBookModel | None, user_id: int) -> ReadedBookModel:
+  if reading is None or reading.user_id != user_id:
+    raise HTTPException(status_code=404, detail="Reading not found")
+  return reading
+
+def finish_reading(db: SQLSession, reading_id: int, user_id: int, end: str) -> ReadedBookSchema:
+  reading = get_user_reading(db.get(ReadedBookModel, reading_id), user_id)
+  validate_reading_dates(reading.start, end)
+  reading.end = end
+  db.flush()
+  return get_parse_reading(reading)
+
+def query_reading_stats(db: SQLSession, user_id: int, months: int = DEFAULT_STATS_MONTHS) -> ReadingStatsSchema:
+  """
+  Two primary-key lookups on the rollup tables, whatever the length of the
+  user's history.
+  """
+  months = max(1, min(months, MAX_STATS_MONTHS))
+  stats = db.execute(reading_stats_statement(user_id)).scalar()
+  month_rows = db.execute(monthly_reading_stats_statement(user_id, months)).scalars().all() if stats else []
+  return get_parse_reading_stats(user_id, stats, month_rows)
@@ -0,0 +1,222 @@
+import asyncio
+import random
+import time
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from scipy import sparse
+from sqlalchemy import delete, select, text, union
+from sqlalchemy.orm import Session as SQLSession
+from app.config.database import engine
+from app.config.recommendations import RECOMMENDATIONS_TOP_K, RECOMMENDATIONS_MIN_COOCCURRENCE, RECOMMENDATIONS_REFRESH_SECONDS
+from app.controller.books import RETURN_BOOK_COLUMNS
+from app.models.books import Book as BookModel, BookOwner as BookOwnerModel, ReadedBook as ReadedBookModel, BookSimilarity
+from app.schemas.book import RecommendedBookSchema
+
+# cache_versions scope bumped by every refresh, so workers know when to reload.
+RECOMMENDATIONS_SCOPE = "recommendations"
+
+def interactions_statement(user_id: int = None):
+  """
+  (user, book) pairs from ownership and reading history, without duplicates.
+  """
+  owned = select(BookOwnerModel.owner_id.label("user_id"), BookOwnerModel.book_id)
+  read = select(ReadedBookModel.user_id, ReadedBookModel.book_id)
+  if user_id is not None:
+    owned = owned.where(BookOwnerModel.owner_id == user_id)
+    read = read.where(ReadedBookModel.user_id == user_id)
+  return union(owned, read)
+
+def compute_similarities(user_ids: np.ndarray, book_ids: np.ndarray, top_k: int, min_cooccurrence: int = 1) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+  """
+  Item-to-item cosine similarity on the binary user x book matrix X:
+  C = X^T X counts the users two books share and the score is
+  C[i, j] / sqrt(C[i, i] * C[j, j]). Only the top_k neighbours of each book
+  are kept, selected with one lexsort over all non-zero pairs instead of a
+  per-book loop. Returns (book_id, rank, similar_book_id, score) arrays.
+  """
+  empty = np.array([], dtype=np.int64)
+  if len(user_ids) == 0:
+    return empty, empty, empty, np.array([], dtype=np.float64)
+
+  users, user_index = np.unique(user_ids, return_inverse=True)
+  books, book_index = np.unique(book_ids, return_inverse=True)
+  interactions = sparse.csr_matrix(
+    (np.ones(len(user_index), dtype=np.float32), (user_index, book_index)),
+    shape=(len(users), len(books))
+  )
+  interactions.data[:] = 1  # Pairs listed twice still count once.
+
+  cooccurrence = (interactions.T @ interactions).tocoo()
+  counts = np.asarray(interactions.sum(axis=0)).ravel()
+  keep = (cooccurrence.row != cooccurrence.col) & (cooccurrence.data >= min_cooccurrence)
+  rows, cols = cooccurrence.row[keep], cooccurrence.col[keep]
+  scores = cooccurrence.data[keep] / np.sqrt(counts[rows] * counts[cols])
+
+  # Best first within each book; ties go to the lower book ID.
+  order = np.lexsort((books[cols], -scores, rows))
+  rows, cols, scores = rows[order], cols[order], scores[order]
+  ranks = np.arange(len(rows)) - np.searchsorted(rows, rows)
+  top = ranks < top_k
+  return books[rows[top]], ranks[top], books[cols[top]], scores[top].astype(np.float64)
+
+class SimilarityIndex:
+  """
+  In-memory copy of book_similarities: book ID -> (neighbour IDs, scores),
+  best first. Replaced as a whole on reload, so readers never see a
+  half-built index.
+  """
+  def __init__(self):
+    self.version = None
+    self.neighbours: dict[int, tuple[tuple[int, ...], tuple[float, ...]]] = {}
+    self.refreshed_at = None
+    self.refresh_seconds = None
+
+  def replace(self, version: int, book_ids, ranks, similar_ids, scores) -> None:
+    neighbours = {}
+    boundaries = np.flatnonzero(np.diff(book_ids)) + 1
+    for start, end in zip(np.r_[0, boundaries], np.r_[boundaries, len(book_ids)]):
+      if start < end:
+        neighbours[int(book_ids[start])] = (tuple(similar_ids[start:end].tolist()), tuple(scores[start:end].tolist()))
+    self.neighbours = neighbours
+    self.version = version
+
+  def similar(self, book_id: int, limit: int) -> list[tuple[int, float]]:
+    ids, scores = self.neighbours.get(book_id, ((), ()))
+    return list(zip(ids[:limit], scores[:limit]))
+
+  def recommend(self, book_ids: set[int], limit: int) -> list[tuple[int, float]]:
+    """
+    Sums the similarity of every neighbour of the given books, leaving out
+    the books themselves, and returns the best `limit` (book ID, score).
+    """
+    totals: dict[int, float] = {}
+    neighbours = self.neighbours
+    for book_id in book_ids:
+      ids, scores = neighbours.get(book_id, ((), ()))
+      for similar_id, score in zip(ids, scores):
+        if similar_id not in book_ids:
+          totals[similar_id] = totals.get(similar_id, 0.0) + score
+    best = sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+    return best[:limit]
+
+  def stats(self) -> dict:
+    return {
+      "version": self.version,
+      "books": len(self.neighbours),
+      "refreshed_at": self.refreshed_at,
+      "refresh_seconds": self.refresh_seconds,
+    }
+
+similarity_index = SimilarityIndex()
+
+def get_recommendations_version(conn) -> int:
+  return conn.execute(
+    text("SELECT version FROM cache_versions WHERE scope = :scope"), {"scope": RECOMMENDATIONS_SCOPE}
+  ).scalar() or 0
+
+def refresh_similarities() -> int:
+  """
+  Recomputes book_similarities from the current interactions and replaces
+  the table and this worker's index. Runs on the threadpool; NumPy and SciPy
+  release the GIL for the heavy parts. Returns the new version.
+  """
+  started = time.perf_counter()
+  with engine.connect() as conn:
+    pairs = conn.execute(interactions_statement()).all()
+  user_ids = np.fromiter((pair[0] for pair in pairs), dtype=np.int64, count=len(pairs))
+  book_ids = np.fromiter((pair[1] for pair in pairs), dtype=np.int64, count=len(pairs))
+  result = compute_similarities(user_ids, book_ids, RECOMMENDATIONS_TOP_K, RECOMMENDATIONS_MIN_COOCCURRENCE)
+
+  with engine.begin() as conn:
+    conn.execute(delete(BookSimilarity))
+    if len(result[0]):
+      conn.exec_driver_sql(
+        "INSERT INTO book_similarities (book_id, rank, similar_book_id, score) VALUES (?, ?, ?, ?)",
+        list(zip(*(column.tolist() for column in result)))
+      )
+    conn.execute(text(
+      "INSERT INTO cache_versions(scope, version) VALUES (:scope, 1) "
+      "ON CONFLICT(scope) DO UPDATE SET version = version + 1"
+    ), {"scope": RECOMMENDATIONS_SCOPE})
+    version = get_recommendations_version(conn)
+
+  similarity_index.replace(version, *result)
+  similarity_index.refreshed_at = time.time()
+  similarity_index.refresh_seconds = round(time.perf_counter() - started, 3)
+  return version
+
+def load_similarities() -> int:
+  """
+  Loads the stored table into this worker's index. Returns its version.
+  """
+  with engine.connect() as conn:
+    version = get_recommendations_version(conn)
+    rows = conn.execute(
+      select(BookSimilarity.book_id, BookSimilarity.rank, BookSimilarity.similar_book_id, BookSimilarity.score)
+      .order_by(BookSimilarity.book_id, BookSimilarity.rank)
+    ).all()
+  columns = [np.array(column) for column in zip(*rows)] if rows else [np.array([], dtype=np.int64)] * 4
+  similarity_index.replace(version, *columns)
+  return version
+
+def sync_similarities() -> None:
+  """
+  One refresh tick. If another worker refreshed since this worker last looked,
+  its result is loaded; otherwise this worker recomputes. Timers are jittered,
+  so with several workers usually only one of them does the computation.
+  """
+  with engine.connect() as conn:
+    version = get_recommendations_version(conn)
+  if version == 0 or version == similarity_index.version:
+    refresh_similarities()
+  else:
+    load_similarities()
+
+async def run_similarity_refresher() -> None:
+  """
+  Lifespan task: loads the stored neighbours (computing them if there are
+  none yet), then keeps them fresh every RECOMMENDATIONS_REFRESH_SECONDS.
+  """
+  try:
+    version = await run_in_threadpool(load_similarities)
+    if version == 0:
+      await run_in_threadpool(refresh_similarities)
+  except Exception as e:
+    print(f"Error loading book similarities: {e}")
+  if RECOMMENDATIONS_REFRESH_SECONDS <= 0:
+    return
+  while True:
+    await asyncio.sleep(RECOMMENDATIONS_REFRESH_SECONDS * random.uniform(0.9, 1.1))
+    try:
+      await run_in_threadpool(sync_similarities)
+    except Exception as e:
+      print(f"Error refreshing book similarities: {e}")
+
+def books_by_id_statement(book_ids: list[int]):
+  return select(*RETURN_BOOK_COLUMNS).where(BookModel.id.in_(book_ids))
+
+def get_parse_recommended_books(rows: list, scored: list[tuple[int, float]]) -> list[RecommendedBookSchema]:
+  books = {row.id: row for row in rows}
+  return [
+    RecommendedBookSchema(**books[book_id]._mapping, score=round(score, 6))
+    for book_id, score in scored if book_id in books
+  ]
+
+def query_similar_books(db: SQLSession, book_id: int, limit: int) -> list[RecommendedBookSchema]:
+  scored = similarity_index.similar(book_id, limit)
+  if not scored:
+    return []
+  rows = db.execute(books_by_id_statement([similar_id for similar_id, _ in scored])).all()
+  return get_parse_recommended_books(rows, scored)
+
+def query_recommendations(db: SQLSession, user_id: int, limit: int) -> list[RecommendedBookSchema]:
+  """
+  Books most similar to everything the user owns or has read, scored from
+  the in-memory index; one query for the user's books and one for the result.
+  """
+  seen = {row.book_id for row in db.execute(interactions_statement(user_id))}
+  scored = similarity_index.recommend(seen, limit)
+  if not scored:
+    return []
+  rows = db.execute(books_by_id_statement([book_id for book_id, _ in scored])).all()
+  return get_parse_recommended_books(rows, scored)
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable
+from fastapi import Request, Response
+from pydantic import BaseModel
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session as SQLSession
+from app.config.response_cache import RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_MAX_ENTRIES
+from app.models.books import CACHE_VERSION_BULK_STAMP
+
+def get_cache_version(db: SQLSession, statement) -> int:
+  """
+  Runs a version statement (catalog_page_version_statement,
+  book_version_statement). The triggers on books, book_owners and users
+  stamp the versions in the same transaction as the write; a range or book
+  never written is at 0.
+  """
+  return db.execute(statement).scalar() or 0
+
+def book_versions_bulk_statements(book_ids: list[int]) -> list:
+  """
+  Run in a bulk write's transaction, next to facet_counts_bulk_finish_statements:
+  its book_owners rows were inserted under the marker, so this bumps
+  'catalog' once and stamps every book of the batch with it.
+  """
+  bump, stamp = CACHE_VERSION_BULK_STAMP
+  return [text(bump), text(stamp).bindparams(book_ids=json.dumps(book_ids))]
+
+def cache_version_column(statement):
+  """
+  A version statement as an extra column, so a query reads the version from
+  the same snapshot as its rows. Two separate SELECTs are two snapshots.
+  """
+  return func.coalesce(statement.scalar_subquery(), 0).label("cache_version")
+
+def make_etag(key: tuple, version: int) -> str:
+  """
+  Strong ETag for the response to key at this version. The body is fully
+  determined by the two, so the tag can be computed without building it.
+  """
+  digest = hashlib.blake2b(repr((key, version)).encode(), digest_size=12).hexdigest()
+  return f'"{digest}"'
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+  """
+  Whether If-None-Match lists this tag. "*" is left to cached_json_response,
+  which only knows whether the resource exists once it has the body.
+  """
+  if not if_none_match:
+    return False
+  # If-None-Match uses the weak comparison, so W/"x" matches "x".
+  return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+class ResponseCache:
+  """
+  LRU cache of serialized JSON bodies, bounded by entry count and total bytes.
+
+  Each entry remembers the version it was built at. A lookup with a newer
+  version drops the entry, so a write only invalidates the responses of the
+  scopes its triggers bumped.
+  """
+  def __init__(self, max_entries: int, max_bytes: int):
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self._bytes = 0
+    self._entries: OrderedDict[tuple, tuple[int, bytes]] = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key: tuple, version: int) -> bytes | None:
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None or entry[0] != version:
+        if entry is not None:
+          self._remove(key)
+        self.misses += 1
+        return None
+      self._entries.move_to_end(key)
+      self.hits += 1
+      return entry[1]
+
+  def set(self, key: tuple, version: int, body: bytes) -> None:
+    if len(body) > self.max_bytes:
+      return
+    with self._lock:
+      if key in self._entries:
+        self._remove(key)
+      self._entries[key] = (version, body)
+      self._bytes += len(body)
+      while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+        self._remove(next(iter(self._entries)))
+        self.evictions += 1
+
+  def _remove(self, key: tuple) -> None:
+    _, body = self._entries.pop(key)
+    self._bytes -= len(body)
+
+  def clear(self) -> None:
+    with self._lock:
+      self._entries.clear()
+      self._bytes = 0
+
+  def stats(self) -> dict:
+    with self._lock:
+      return {
+        "hits": self.hits,
+        "misses": self.misses,
+        "evictions": self.evictions,
+        "entries": len(self._entries),
+        "bytes": self._bytes,
+        "max_entries": self.max_entries,
+        "max_bytes": self.max_bytes,
+      }
+
+response_cache = ResponseCache(max_entries=RESPONSE_CACHE_MAX_ENTRIES, max_bytes=RESPONSE_CACHE_MAX_BYTES)
+
+async def cached_json_response(request: Request, key: tuple, version: int, load: Callable[[], Awaitable[tuple[int, BaseModel | bytes]]]) -> Response:
+  """
+  Answers a GET from the cache: 304 when the client already has this version,
+  the cached body when this worker has it, otherwise awaits load() and caches
+  its JSON (load may return the encoded body itself). load() returns the
+  version together with the body, read by the same SELECT, and a fresh body
+  is tagged and cached with that version rather than the one read first.
+  """
+  etag = make_etag(key, version)
+  headers = {"ETag": etag, "Cache-Control": "no-cache"}
+  if_none_match = request.headers.get("if-none-match")
+  if etag_matches(if_none_match, etag):
+    return Response(status_code=304, headers=headers)
+
+  body = response_cache.get(key, version)
+  if body is None:
+    # Raises (a 404 for a missing book) before anything is cached.
+    version, body = await load()
+    if isinstance(body, BaseModel):
+      body = body.model_dump_json().encode()
+    response_cache.set(key, version, body)
+    headers["ETag"] = make_etag(key, version)
+  # "*" matches any current representation, and there is one.
+  if if_none_match and if_none_match.strip() == "*":
+    return Response(status_code=304, headers=headers)
+  return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,112 @@
+import base64
+import binascii
+import re
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.orm import Session as SQLSession
+from app.config.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.models.books import SEARCH_VERSION_BULK_BUMP
+from app.schemas.book import BookSearchResultSchema, BookSearchPageSchema
+
+# Column weights for bm25(): a hit in the title counts more than in the description.
+TITLE_WEIGHT = 10.0
+AUTHOR_WEIGHT = 5.0
+DESCRIPTION_WEIGHT = 1.0
+
+SEARCH_COLUMNS = "b.id, b.title, b.author, b.published_year, b.isbn, b.pages, b.cover, b.language, b.available, b.date_added"
+
+def build_match_query(q: str) -> str:
+  """
+  Turns free text into an FTS5 query: every word must match and the last one
+  also matches as a prefix, so results show up while the user is typing.
+  Quoting each term keeps FTS5 operators in user input from being interpreted.
+  """
+  terms = re.findall(r"\w+", q)
+  if not terms:
+    raise HTTPException(status_code=400, detail="Search query must contain at least one word")
+  quoted = [f'"{term}"' for term in terms]
+  quoted[-1] += "*"
+  return " ".join(quoted)
+
+SEARCH_VERSION = "(SELECT version FROM cache_versions WHERE scope = 'search')"
+
+def encode_search_cursor(score: float, book_id: int, version: int) -> str:
+  raw = f"{score!r}:{book_id}:{version}".encode()
+  return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_search_cursor(cursor: str) -> tuple[float, int, int]:
+  padded = cursor + "=" * (-len(cursor) % 4)
+  try:
+    score, book_id, version = base64.urlsafe_b64decode(padded).decode().split(":")
+    return float(score), int(book_id), int(version)
+  except (ValueError, binascii.Error, UnicodeDecodeError):
+    raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def search_version_statement():
+  return text(f"SELECT coalesce({SEARCH_VERSION}, 0)")
+
+def search_version_bulk_statement():
+  """
+  Run in a bulk write's transaction that inserted books under the facet
+  counts marker, whose insert trigger left the 'search' version alone.
+  """
+  return text(SEARCH_VERSION_BULK_BUMP)
+
+def search_statement(q: str, limit: int, cursor: str = None):
+  """
+  Ranked FTS5 lookup, keyset-paginated on (score, id). Fetches one extra row
+  to know whether there is a next page.
+
+  bm25 scores depend on the whole index, so a cursor carries the 'search'
+  version it was ranked under and only matches rows while that version is
+  current; every row also carries the version, read in the same snapshot.
+  """
+  params = {
+    "match": build_match_query(q),
+    "limit": limit + 1,
+    "title_weight": TITLE_WEIGHT,
+    "author_weight": AUTHOR_WEIGHT,
+    "description_weight": DESCRIPTION_WEIGHT,
+  }
+  after = ""
+  if cursor:
+    params["last_score"], params["last_id"], params["version"] = decode_search_cursor(cursor)
+    after = f"""
+      WHERE coalesce({SEARCH_VERSION}, 0) = :version
+        AND (hits.score > :last_score OR (hits.score = :last_score AND hits.id > :last_id))
+    """
+  return text(f"""
+    SELECT {SEARCH_COLUMNS}, hits.score, hits.snippet, coalesce({SEARCH_VERSION}, 0) AS search_version
+    FROM (
+      SELECT rowid AS id,
+             bm25(books_fts, :title_weight, :author_weight, :description_weight) AS score,
+             snippet(books_fts, -1, '<mark>', '</mark>', '…', 16) AS snippet
+      FROM books_fts
+      WHERE books_fts MATCH :match
+    ) AS hits
+    JOIN books AS b ON b.id = hits.id
+    {after}
+    ORDER BY hits.score, hits.id
+    LIMIT :limit
+  """).bindparams(**params)
+
+def get_parse_search_page(rows: list, limit: int) -> BookSearchPageSchema:
+  next_cursor = None
+  if len(rows) > limit:
+    rows = rows[:limit]
+    next_cursor = encode_search_cursor(rows[-1].score, rows[-1].id, rows[-1].search_version)
+  items = [BookSearchResultSchema(**row._mapping) for row in rows]
+  return BookSearchPageSchema(items=items, next_cursor=next_cursor)
+
+def search_books(db: SQLSession, q: str, limit: int = DEFAULT_PAGE_SIZE, cursor: str = None) -> BookSearchPageSchema:
+  """
+  A cursor ranked under an older 'search' version gets 409: the scores it
+  holds no longer order the results, so the client must start again from
+  the first page. Versions only grow, so an empty page whose version still
+  matches afterwards really is the end of the results.
+  """
+  limit = max(1, min(limit, MAX_PAGE_SIZE))
+  rows = db.execute(search_statement(q, limit, cursor)).all()
+  if cursor and not rows and db.execute(search_version_statement()).scalar() != decode_search_cursor(cursor)[2]:
+    raise HTTPException(status_code=409, detail="The search results changed, search again without a cursor")
+  return get_parse_search_page(rows, limit)
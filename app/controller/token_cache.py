@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app.config.authentication import TOKEN_CACHE_TTL_SECONDS, TOKEN_CACHE_MAX_ENTRIES
+from app.models.users import User as UserModel
+from app.schemas.user import SensitiveUserSchema
+
+class TokenCache:
+    """
+    LRU cache of bearer token -> resolved user.
+
+    Each entry expires at the token's exp claim or after ttl_seconds, whichever
+    comes first. Invalidation on user changes only reaches the current worker;
+    other workers pick the change up when their entry expires.
+    """
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, SensitiveUserSchema]] = OrderedDict()
+        # Sync controllers and dependencies run on the threadpool, async ones on the event loop.
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> SensitiveUserSchema | None:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, token: str, user: SensitiveUserSchema, exp: float | None = None) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+        with self._lock:
+            self._entries[token] = (expires_at, user)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            stale = [token for token, (_, user) in self._entries.items() if user.id == user_id]
+            for token in stale:
+                del self._entries[token]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+token_cache = TokenCache(max_entries=TOKEN_CACHE_MAX_ENTRIES, ttl_seconds=TOKEN_CACHE_TTL_SECONDS)
+
+# Users changed by a flush are only evicted once the transaction commits:
+# evicting at flush time would let a concurrent request re-cache the old row
+# before the commit, and would evict on changes that are later rolled back.
+STALE_USERS_KEY = "token_cache_stale_users"
+
+@event.listens_for(UserModel, "after_update")
+@event.listens_for(UserModel, "after_delete")
+def record_changed_user(mapper, connection, target: UserModel) -> None:
+    session = object_session(target)
+    if session is None:
+        token_cache.invalidate_user(target.id)
+    else:
+        session.info.setdefault(STALE_USERS_KEY, set()).add(target.id)
+
+@event.listens_for(Session, "after_commit")
+def invalidate_committed_users(session: Session) -> None:
+    for user_id in session.info.pop(STALE_USERS_KEY, ()):
+        token_cache.invalidate_user(user_id)
+
+@event.listens_for(Session, "after_rollback")
+def forget_rolled_back_users(session: Session) -> None:
+    session.info.pop(STALE_USERS_KEY, None)
@@ -2,41 +2,65 @@ import re
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session as SQLSession
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSQLSession
 
 from app.config.authentication import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
 from app.models.users import User as UserModel
-from app.config.database import Session, get_db
+from app.config.database import get_unit_of_work, run_in_session
 from app.schemas.user import SensitiveUserSchema, NonSensitiveUserSchema, UserRegisterSchema, UserLoginSchema
 from app.schemas.token import Token
+from app.controller.passwords import hash_password, verify_password
+from app.controller.token_cache import token_cache
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 email_regex = r"^([a-z]|[0-9]|\-|\_|\+|\.)+\@([a-z]|[0-9]){2,}\.[a-z]{2,}(\.[a-z]{2,})?$"
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-def get_current_user(
+async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: SQLSession = Depends(get_db)
+    db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)
 ) -> NonSensitiveUserSchema:
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email = payload.get("sub")
-        if email is None:
-            raise HTTPException(status_code=401, detail="Token inválido")
-
-        user = db.query(UserModel).filter(UserModel.email == email).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="Usuario no encontrado")
-        return NonSensitiveUserSchema.from_orm(user)
+    user = await resolve_token_user(db, token, not_found_detail="Usuario no encontrado")
+    return NonSensitiveUserSchema.from_orm(user)
 
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Token inválido")
-
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def get_admin_user(
+    token: str = Depends(oauth2_scheme),
+    db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)
+) -> SensitiveUserSchema:
+    """
+    Dependency for administrator-only routes: the token must belong to a superuser.
+    """
+    user = await resolve_token_user(db, token)
+    if not user.is_superuser:
+        raise HTTPException(status_code=403, detail="Administrator access required")
+    return user
+
+async def resolve_token_user(db: SQLSession | AsyncSQLSession, token: str, not_found_detail: str = "User not found") -> SensitiveUserSchema:
+    """
+    get_user_from_token for async callers. A token_cache hit is answered
+    without going through the session.
+    """
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+    return await run_in_session(db, get_user_from_token, token, not_found_detail)
+
+def get_user_from_token(db: SQLSession, token: str, not_found_detail: str = "User not found") -> SensitiveUserSchema:
+    """
+    Resolves the user a token belongs to, through token_cache when possible.
+    """
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+
+    payload = getPayloadFromToken(token)
+    db_user = db.query(UserModel).filter(UserModel.email == payload["sub"]).first()
+    if not db_user:
+        raise HTTPException(status_code=404, detail=not_found_detail)
+    user = SensitiveUserSchema.from_orm(db_user)
+    token_cache.set(token, user, payload.get("exp"))
+    return user
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
@@ -49,72 +73,71 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def add_new_user(user: SensitiveUserSchema | UserRegisterSchema ) -> NonSensitiveUserSchema:
-    db = Session()
-    if isinstance(user, UserRegisterSchema):
-        if re.match(email_regex, user.email) is None:
-            db.close()
-            raise HTTPException(status_code=400, detail="Invalid email address")
-        
-        if db.query(UserModel).filter(UserModel.username == user.username).first():
-            db.close()
-            raise HTTPException(status_code=400, detail="Username already exists")
-
-        if db.query(UserModel).filter(UserModel.email == user.email).first():
-            db.close()
-            raise HTTPException(status_code=400, detail="Email already exists")
-
-        if len(user.password) < 8:
-            db.close()
-            raise HTTPException(status_code=400, detail="Password must be at least 8 characters long")
-        
-        if user.password != user.confirm_password:
-            db.close()
-            raise HTTPException(status_code=400, detail="Passwords do not match")
-
-        if db.query(UserModel).filter(UserModel.username == user.username).first():
-            db.close()
-            raise HTTPException(status_code=400, detail="Username already exists")
-
-    user.password = pwd_context.hash(user.password)
+def validate_registration(user: UserRegisterSchema) -> None:
+    if re.match(email_regex, user.email) is None:
+        raise HTTPException(status_code=400, detail="Invalid email address")
+    if len(user.password) < 8:
+        raise HTTPException(status_code=400, detail="Password must be at least 8 characters long")
+    if user.password != user.confirm_password:
+        raise HTTPException(status_code=400, detail="Passwords do not match")
 
+def new_user_model(user: SensitiveUserSchema | UserRegisterSchema) -> UserModel:
     """ 
      Este fragmento de código se encarga de crear una nueva instancia del modelo de usuario (UserModel) utilizando los datos proporcionados por el objeto user. Primero, verifica si el atributo confirm_password del usuario no está presente o es falso. Si es así, utiliza todos los campos del usuario para crear el nuevo usuario. En cambio, si confirm_password está presente, excluye ese campo al crear el nuevo usuario.
 
      Esto es útil porque el campo confirm_password generalmente se utiliza solo para validar que el usuario haya escrito correctamente su contraseña durante el registro, pero no debe almacenarse en la base de datos. Así, el código garantiza que solo los datos necesarios y seguros se guarden en el modelo de usuario.
      """
-    if not user.confirm_password:
-        new_user = UserModel(**user.model_dump())
-    else:
-        new_user = UserModel(**user.model_dump(exclude={"confirm_password"}))
-
+    if not getattr(user, "confirm_password", None):
+        return UserModel(**user.model_dump())
+    return UserModel(**user.model_dump(exclude={"confirm_password"}))
+
+def check_new_user(db: SQLSession, user: UserRegisterSchema) -> None:
+    if db.query(UserModel).filter(UserModel.username == user.username).first():
+        raise HTTPException(status_code=400, detail="Username already exists")
+    if db.query(UserModel).filter(UserModel.email == user.email).first():
+        raise HTTPException(status_code=400, detail="Email already exists")
+
+def insert_user(db: SQLSession, user: SensitiveUserSchema | UserRegisterSchema) -> SensitiveUserSchema:
+    new_user = new_user_model(user)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    db.close()
-    response = SensitiveUserSchema.from_orm(new_user)
-    return response
-
-def login(user: OAuth2PasswordRequestForm, db: SQLSession) -> NonSensitiveUserSchema:
-    # db = Session()
-    if user.username is None:
-        db.close()
-        raise HTTPException(status_code=400, detail="Username or email must be provided")
-    
-    db_user = db.query(UserModel).filter(UserModel.email == user.username).first()
-    if not db_user:
-        db_user = db.query(UserModel).filter(UserModel.username == user.username).first()
+    db.flush()
+    return SensitiveUserSchema.from_orm(new_user)
+
+async def add_new_user(db: SQLSession | AsyncSQLSession, user: SensitiveUserSchema | UserRegisterSchema) -> SensitiveUserSchema:
+    """
+    The session is only used before and after hashing, never while the
+    password pool works.
+    """
+    if isinstance(user, UserRegisterSchema):
+        validate_registration(user)
+        await run_in_session(db, check_new_user, user)
+
+    user.password = await hash_password(user.password)
+    return await run_in_session(db, insert_user, user)
 
+def query_login_user(db: SQLSession, username: str) -> UserModel:
+    db_user = db.query(UserModel).filter(UserModel.email == username).first()
     if not db_user:
-        db.close()
-        raise HTTPException(status_code=404, detail="User not found")
+        db_user = db.query(UserModel).filter(UserModel.username == username).first()
 
     if not db_user:
-        db.close()
         raise HTTPException(status_code=404, detail="User not found")
-    if not verify_password(user.password, db_user.password):
-        db.close()
+    return db_user
+
+def update_password_hash(db: SQLSession, db_user: UserModel, new_hash: str) -> None:
+    db_user.password = new_hash
+    db.flush()
+
+async def login(user: OAuth2PasswordRequestForm, db: SQLSession | AsyncSQLSession) -> Token:
+    if user.username is None:
+        raise HTTPException(status_code=400, detail="Username or email must be provided")
+
+    db_user = await run_in_session(db, query_login_user, user.username)
+    valid, new_hash = await verify_password(user.password, db_user.password)
+    if not valid:
         raise HTTPException(status_code=400, detail="Invalid password")
+    if new_hash:
+        await run_in_session(db, update_password_hash, db_user, new_hash)
 
     token: Token = Token(
         access_token=create_access_token(data={"sub": db_user.email}),
@@ -123,64 +146,44 @@ def login(user: OAuth2PasswordRequestForm, db: SQLSession) -> NonSensitiveUserSc
     )
     return token
 
-def query_users(id: int = None, token: str = None, email: str = None, sensitive: bool = False) -> list[NonSensitiveUserSchema] | list[SensitiveUserSchema] | NonSensitiveUserSchema | SensitiveUserSchema:
-    db = Session()
-    try:
-        if id is not None:
-            user = db.query(UserModel).filter(UserModel.id == id).first()
-            if not user:
-                return None
-            if not sensitive:
-                response = NonSensitiveUserSchema.from_orm(user)
-            else:
-                response = SensitiveUserSchema.from_orm(user)
-            db.close()
-            return response
-
-        if email is not None:
-            user = db.query(UserModel).filter(UserModel.email == email).first()
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found")
-            if not sensitive:
-                response = NonSensitiveUserSchema.from_orm(user)
-            else:
-                response = SensitiveUserSchema.from_orm(user)
-            db.close()
-            return response
-
-        if token is not None:
-            user_email = getEmailFromToken(token)
-            user = db.query(UserModel).filter(UserModel.email == user_email).first()
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found")
-            if not sensitive:
-                response = NonSensitiveUserSchema.from_orm(user)
-            else:
-                response = SensitiveUserSchema.from_orm(user)
-            db.close()
-            return response
-
-        users = db.query(UserModel).all()
-        if not sensitive:
-            response = [NonSensitiveUserSchema.from_orm(user) for user in users]
-        else:
-            response = [SensitiveUserSchema.from_orm(user) for user in users]
-        db.close()
-        return response
-    except Exception as e:
-        raise e
-    finally:
-        db.close()
+def get_parse_users(user: UserModel, sensitive: bool) -> NonSensitiveUserSchema | SensitiveUserSchema:
+    if not sensitive:
+        return NonSensitiveUserSchema.from_orm(user)
+    return SensitiveUserSchema.from_orm(user)
 
-def getEmailFromToken(token: str) -> str:
+def query_users(db: SQLSession, id: int = None, token: str = None, email: str = None, sensitive: bool = False) -> list[NonSensitiveUserSchema] | list[SensitiveUserSchema] | NonSensitiveUserSchema | SensitiveUserSchema:
+    if id is not None:
+        user = db.get(UserModel, id)
+        if not user:
+            return None
+        return get_parse_users(user, sensitive)
+
+    if email is not None:
+        user = db.query(UserModel).filter(UserModel.email == email).first()
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        return get_parse_users(user, sensitive)
+
+    if token is not None:
+        return get_parse_users(get_user_from_token(db, token), sensitive)
+
+    users = db.query(UserModel).all()
+    return [get_parse_users(user, sensitive) for user in users]
+
+def getPayloadFromToken(token: str) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_email = payload.get("sub")
-        if user_email is None:
-            raise HTTPException(status_code=401, detail="Token inválido")
-        return user_email
     except JWTError:
         raise HTTPException(status_code=401, detail="Token inválido")
+    if payload.get("sub") is None:
+        raise HTTPException(status_code=401, detail="Token inválido")
+    return payload
+
+def getEmailFromToken(token: str) -> str:
+    user = token_cache.get(token)
+    if user is not None:
+        return user.email
+    return getPayloadFromToken(token)["sub"]
 
 def token_validator(token: str) -> dict:
     try:
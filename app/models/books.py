@@ -1,7 +1,36 @@
+import re
 from app.config.database import Base
-from sqlalchemy import Column, ForeignKey, Integer, String, Boolean
+from sqlalchemy import Column, Float, ForeignKey, Index, Integer, String, Boolean, event, text
 from sqlalchemy.orm import relationship
 
+ISBN_PREFIX = re.compile(r"^\s*ISBN(?:-1[03])?:?", re.IGNORECASE)
+ISBN_SEPARATORS = re.compile(r"[\s\-]")
+
+def normalize_isbn(isbn: str | None) -> str | None:
+    """
+    Forma canónica de un ISBN: los 13 dígitos del ISBN-13, sin guiones ni
+    espacios. Los ISBN-10 se convierten a ISBN-13 (prefijo 978). Devuelve None
+    si el texto no es un ISBN-10 o ISBN-13 con dígito de control válido, para
+    no confundir dos libros distintos por un código mal escrito.
+    """
+    if not isbn:
+        return None
+    digits = ISBN_SEPARATORS.sub("", ISBN_PREFIX.sub("", isbn)).upper()
+    if len(digits) == 10 and digits[:9].isdigit() and (digits[9].isdigit() or digits[9] == "X"):
+        check = 10 if digits[9] == "X" else int(digits[9])
+        if (sum((10 - i) * int(d) for i, d in enumerate(digits[:9])) + check) % 11:
+            return None
+        digits = "978" + digits[:9]
+        return digits + str(-sum((3 if i % 2 else 1) * int(d) for i, d in enumerate(digits)) % 10)
+    if len(digits) == 13 and digits.isdigit():
+        if sum((3 if i % 2 else 1) * int(d) for i, d in enumerate(digits)) % 10:
+            return None
+        return digits
+    return None
+
+def default_isbn_canonical(context) -> str | None:
+    return normalize_isbn(context.get_current_parameters().get("isbn"))
+
 class Book(Base):
     """
     Modelo de datos para libros en la base de datos.
@@ -14,9 +43,13 @@ class Book(Base):
         title (str): Título del libro (máximo 255 caracteres, obligatorio)
         author (str): Nombre del autor del libro (obligatorio)
         published_year (int): Año de publicación del libro (opcional)
-        isbn (str): Código ISBN del libro (opcional)
+        isbn (str): Código ISBN del libro, tal como se introdujo (opcional)
+        isbn_canonical (str): ISBN-13 normalizado (ver normalize_isbn), que se
+                              calcula al insertar; NULL si isbn no es válido
         pages (int): Número de páginas del libro (opcional)
         cover (str): URL o ruta de la imagen de portada del libro (opcional)
+        cover_variants (str): JSON con las miniaturas y la versión WebP de la
+                              portada subida, o NULL mientras se generan (opcional)
         language (str): Idioma del libro (opcional)
         description (str): Descripción o sinopsis del libro (opcional)
         available (bool): Indica si el libro está disponible (por defecto True)
@@ -26,14 +59,19 @@ class Book(Base):
         las opciones unique=True en sus respectivas definiciones.
     """
     __tablename__ = 'books'
+    __table_args__ = (
+        Index("ix_books_isbn_canonical", "isbn_canonical"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(length=255), unique=False, nullable=False) # Activate unique=True for title
     author = Column(String, nullable=False)
     published_year = Column(Integer, nullable=True)
     isbn = Column(String, unique=False, nullable=True) # Activate unique=True for isbn
+    isbn_canonical = Column(String, nullable=True, default=default_isbn_canonical)
     pages = Column(Integer, nullable=True)
     cover = Column(String, nullable=True)
+    cover_variants = Column(String, nullable=True)  # JSON written by app.controller.covers
     language = Column(String, nullable=True)
     description = Column(String, nullable=True)
     available = Column(Boolean, default=True)  # Default to 1 for availability
@@ -62,6 +100,10 @@ class BookOwner(Base):
         un libro pueda tener múltiples propietarios.
     """
     __tablename__ = 'book_owners'
+    __table_args__ = (
+        Index("ix_book_owners_book_id", "book_id"),
+        Index("ix_book_owners_owner_id_book_id", "owner_id", "book_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
@@ -92,6 +134,10 @@ class ReadedBook(Base):
         progreso de lectura.
     """
     __tablename__ = 'readed_books'
+    __table_args__ = (
+        Index("ix_readed_books_user_id_book_id", "user_id", "book_id"),
+        Index("ix_readed_books_book_id", "book_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
@@ -101,28 +147,621 @@ class ReadedBook(Base):
 
 class BookedBook(Base):
     """
-    Modelo de datos para el seguimiento de libros que un usuario ha marcado como leídos.
+    Modelo de datos para el historial de préstamos de libros.
     
-    Esta clase representa la tabla 'booked_books' que registra qué libros
-    han sido marcados como leídos por los usuarios, junto con las fechas
-    de inicio y finalización de la lectura.
+    Esta clase representa la tabla 'booked_books', con una fila por préstamo:
+    se crea al tomar prestado el libro y se cierra (end) al devolverlo.
     
     Attributes:
-        id (int): Identificador único del registro de libro leído (clave primaria)
-        book_id (int): ID del libro leído (referencia a la tabla books)
-        user_id (int): ID del usuario que leyó el libro (referencia a la tabla users)
-        start (str): Fecha de inicio de la lectura (formato ISO string, opcional)
-        end (str): Fecha de finalización de la lectura (formato ISO string, opcional)
+        id (int): Identificador único del préstamo (clave primaria)
+        book_id (int): ID del libro prestado (referencia a la tabla books)
+        user_id (int): ID del usuario que lo tomó prestado (referencia a la tabla users)
+        start (str): Fecha y hora del préstamo (formato ISO string)
+        end (str): Fecha y hora de la devolución (formato ISO string), NULL
+                   mientras el préstamo sigue abierto
     
     Note:
-        Esta tabla permite llevar un registro detallado de los libros leídos
-        por cada usuario, facilitando el seguimiento del progreso y las
-        estadísticas de lectura.
+        El índice único parcial ux_booked_books_open_book_id impide que un
+        libro tenga dos préstamos abiertos a la vez, aunque dos workers
+        intenten prestarlo al mismo tiempo.
     """
     __tablename__ = 'booked_books'
+    __table_args__ = (
+        Index("ix_booked_books_user_id_book_id", "user_id", "book_id"),
+        Index("ix_booked_books_book_id", "book_id"),
+        Index("ux_booked_books_open_book_id", "book_id", unique=True, sqlite_where=text('"end" IS NULL')),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)  # Assuming user_id is an integer
     start = Column(String, nullable=True)  # Assuming start is a string in ISO format
-    end = Column(String, nullable=True)  # Assuming end is a string in ISO format
\ No newline at end of file
+    end = Column(String, nullable=True)  # Assuming end is a string in ISO format
+
+class LendingRequest(Base):
+    """
+    Modelo de datos para las claves de idempotencia de préstamos y devoluciones.
+
+    Esta clase representa la tabla 'lending_requests'. Cada petición con
+    cabecera Idempotency-Key guarda aquí su clave en la misma transacción que
+    el préstamo o la devolución, así que repetirla (por ejemplo, un reintento
+    tras un timeout) devuelve el mismo préstamo en vez de repetir la operación.
+
+    Attributes:
+        user_id (int): ID del usuario que envió la petición (clave primaria)
+        key (str): Valor de la cabecera Idempotency-Key (clave primaria)
+        action (str): 'borrow' o 'return'
+        book_id (int): ID del libro de la petición
+        booked_book_id (int): ID del préstamo creado o cerrado
+        created_at (str): Fecha y hora de la petición (formato ISO string);
+                          las claves más antiguas que IDEMPOTENCY_KEY_TTL_HOURS
+                          se borran
+    """
+    __tablename__ = 'lending_requests'
+    __table_args__ = (
+        Index("ix_lending_requests_created_at", "created_at"),
+    )
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    key = Column(String, primary_key=True)
+    action = Column(String, nullable=False)
+    book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
+    booked_book_id = Column(Integer, ForeignKey("booked_books.id"), nullable=True)
+    created_at = Column(String, nullable=False)
+
+class ReadingStats(Base):
+    """
+    Modelo de datos con el resumen de lectura de cada usuario.
+
+    Esta clase representa la tabla 'reading_stats', una fila por usuario que
+    los triggers de READING_STATS_DDL mantienen al día en cada INSERT, UPDATE
+    o DELETE sobre 'readed_books', así que leer las estadísticas no recorre
+    el historial.
+
+    Attributes:
+        user_id (int): ID del usuario (clave primaria, referencia a users)
+        finished (int): Lecturas terminadas (con fecha de fin)
+        pages_read (int): Suma de las páginas de los libros terminados
+        reading_days (float): Suma de los días entre inicio y fin de las
+                              lecturas terminadas que tienen ambas fechas
+        timed (int): Lecturas que cuentan en reading_days
+        reading (int): Lecturas empezadas y aún sin terminar
+
+    Note:
+        Las páginas se toman del libro al escribir el registro de lectura;
+        cambiar después 'books.pages' no recalcula el resumen.
+    """
+    __tablename__ = 'reading_stats'
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    finished = Column(Integer, nullable=False, default=0)
+    pages_read = Column(Integer, nullable=False, default=0)
+    reading_days = Column(Float, nullable=False, default=0)
+    timed = Column(Integer, nullable=False, default=0)
+    reading = Column(Integer, nullable=False, default=0)
+
+class MonthlyReadingStats(Base):
+    """
+    Modelo de datos con las lecturas terminadas por usuario y mes.
+
+    Esta clase representa la tabla 'reading_stats_monthly', mantenida por los
+    mismos triggers que 'reading_stats'. El mes es el de la fecha de fin.
+
+    Attributes:
+        user_id (int): ID del usuario (referencia a users)
+        month (str): Mes en formato 'YYYY-MM'
+        finished (int): Lecturas terminadas ese mes
+        pages_read (int): Páginas de los libros terminados ese mes
+    """
+    __tablename__ = 'reading_stats_monthly'
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    month = Column(String(length=7), primary_key=True)
+    finished = Column(Integer, nullable=False, default=0)
+    pages_read = Column(Integer, nullable=False, default=0)
+
+class BookSimilarity(Base):
+    """
+    Modelo de datos con los libros más parecidos a cada libro.
+
+    Esta clase representa la tabla 'book_similarities', que guarda los k
+    vecinos de cada libro según la similitud coseno entre los usuarios que lo
+    poseen o lo han leído. La recalcula por completo
+    app.controller.recommendations en segundo plano; no se escribe desde las
+    peticiones.
+
+    Attributes:
+        book_id (int): ID del libro (referencia a la tabla books)
+        rank (int): Posición del vecino, empezando en 0 para el más parecido
+        similar_book_id (int): ID del libro vecino (referencia a la tabla books)
+        score (float): Similitud coseno entre 0 y 1
+    """
+    __tablename__ = 'book_similarities'
+
+    book_id = Column(Integer, ForeignKey("books.id"), primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    similar_book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
+    score = Column(Float, nullable=False)
+
+class CacheVersion(Base):
+    """
+    Modelo de datos para los contadores de versión de la caché.
+
+    Esta clase representa la tabla 'cache_versions', que guarda un contador
+    por ámbito. Los triggers de CACHE_VERSION_DDL incrementan 'catalog' en
+    la misma transacción que modifica los datos, así que cualquier escritura
+    (ORM, Core o SQL directo, desde cualquier proceso) lo cambia; su valor
+    es la secuencia con la que se sellan las filas de 'book_cache_versions'.
+    Los de SEARCH_VERSION_DDL incrementan 'search' cuando cambia el texto
+    indexado en 'books_fts', y con él la puntuación bm25 de la búsqueda.
+
+    Attributes:
+        scope (str): Ámbito del contador (clave primaria)
+        version (int): Versión actual; un ámbito sin fila está en la versión 0
+    """
+    __tablename__ = 'cache_versions'
+
+    scope = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class BookCacheVersion(Base):
+    """
+    Modelo de datos con la versión de cada libro en la caché de respuestas.
+
+    Esta clase representa la tabla 'book_cache_versions'. Cada escritura que
+    cambia un libro, sus propietarios o los datos públicos de uno de ellos
+    copia en la fila del libro el valor de 'catalog' que acaba de dejar, así
+    que las versiones crecen con cada escritura en todo el catálogo. La
+    versión del detalle de un libro es la de su fila, y la de una página del
+    catálogo la mayor entre los libros de su rango: cualquier cambio dentro
+    del rango la hace crecer y los cambios fuera de él no la tocan.
+
+    Attributes:
+        book_id (int): ID del libro (clave primaria). Las filas de los libros
+            borrados se conservan, porque el borrado cambia su rango
+        version (int): Valor de 'catalog' en la última escritura que afectó al
+            libro; un libro sin fila está en la versión 0
+    """
+    __tablename__ = 'book_cache_versions'
+
+    book_id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+
+class BookFacetCount(Base):
+    """
+    Modelo de datos con los recuentos de libros por faceta.
+
+    Esta clase representa la tabla 'book_facet_counts': cuántos libros tienen
+    cada valor de language, author, published_year y available, en total
+    (filter_facet y filter_value vacíos) y entre los libros que tienen un
+    valor concreto de otra faceta. Los triggers de FACET_COUNTS_DDL la
+    mantienen al día en cada INSERT, UPDATE o DELETE sobre 'books', así que
+    leer las facetas no recorre el catálogo.
+
+    Attributes:
+        filter_facet (str): Faceta del filtro, o '' sin filtro
+        filter_value (str): Valor del filtro, o '' sin filtro
+        facet (str): Faceta contada
+        value (str): Valor contado, como texto ('1'/'0' para available)
+        count (int): Libros con ese valor; las filas que llegan a 0 se
+                     conservan para el siguiente cambio de disponibilidad
+
+    Note:
+        Un libro sin idioma o sin año no cuenta en esas facetas, y un
+        available NULL cuenta como disponible, igual que al prestarlo.
+    """
+    __tablename__ = 'book_facet_counts'
+
+    filter_facet = Column(String, primary_key=True)
+    filter_value = Column(String, primary_key=True)
+    facet = Column(String, primary_key=True)
+    value = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class BookFacetCountsBulkWrite(Base):
+    """
+    Marca de escritura masiva para 'book_facet_counts'.
+
+    Esta clase representa la tabla 'book_facet_counts_bulk_writes'. Mientras
+    tiene una fila, los triggers de INSERT sobre 'books' no tocan los
+    recuentos ni la versión 'search', ni el de INSERT sobre 'book_owners'
+    las versiones de la caché: la
+    importación masiva y add_new_book(books=...) insertan la fila antes que
+    sus libros y propietarios y, al final, suman los recuentos de todo el
+    lote con FACET_COUNTS_BULK_INSERT, sellan sus libros con
+    CACHE_VERSION_BULK_STAMP y la borran, todo en la misma transacción.
+    Como SQLite solo admite un escritor a la vez, ninguna otra transacción
+    llega a verla.
+
+    Attributes:
+        id (int): Siempre 1 (clave primaria)
+    """
+    __tablename__ = 'book_facet_counts_bulk_writes'
+
+    id = Column(Integer, primary_key=True)
+
+# En el orden de la respuesta (más libros primero, empates por valor), para
+# que leer los N primeros valores de una faceta recorra solo N entradas.
+Index(
+    "ix_book_facet_counts_top",
+    BookFacetCount.filter_facet, BookFacetCount.filter_value, BookFacetCount.facet,
+    BookFacetCount.count.desc(), BookFacetCount.value,
+)
+
+# Índice de texto completo (SQLite FTS5) sobre title, author y description.
+# Es una tabla "external content": guarda solo el índice y lee el texto de
+# 'books'; los triggers lo mantienen al día en cada INSERT, UPDATE y DELETE.
+BOOKS_FTS_DDL = (
+    """
+    CREATE VIRTUAL TABLE books_fts USING fts5(
+        title, author, description,
+        content='books', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER books_fts_after_insert AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts(rowid, title, author, description)
+        VALUES (new.id, new.title, new.author, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER books_fts_after_delete AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, description)
+        VALUES ('delete', old.id, old.title, old.author, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER books_fts_after_update AFTER UPDATE OF title, author, description ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, description)
+        VALUES ('delete', old.id, old.title, old.author, old.description);
+        INSERT INTO books_fts(rowid, title, author, description)
+        VALUES (new.id, new.title, new.author, new.description);
+    END
+    """,
+    "INSERT INTO books_fts(books_fts) VALUES ('rebuild')",
+)
+
+@event.listens_for(Base.metadata, "after_create")
+def create_books_fts(target, connection, **kw):
+    """
+    Crea el índice FTS5 y sus triggers tras create_all si aún no existen, y lo
+    llena con los libros que ya hubiera en la tabla.
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'books_fts'")).first()
+    if not exists:
+        for statement in BOOKS_FTS_DDL:
+            connection.execute(text(statement))
+
+_BUMP_CATALOG_VERSION = (
+    "INSERT INTO cache_versions(scope, version) VALUES ('catalog', 1) "
+    "ON CONFLICT(scope) DO UPDATE SET version = version + 1;"
+)
+
+def _stamp_book_version(book_id: str) -> str:
+    """
+    Copia la versión de 'catalog', ya incrementada, en la fila del libro.
+    """
+    return (
+        "INSERT INTO book_cache_versions(book_id, version) "
+        f"SELECT {book_id}, version FROM cache_versions WHERE scope = 'catalog' "
+        "ON CONFLICT(book_id) DO UPDATE SET version = excluded.version;"
+    )
+
+# Columnas de 'users' que aparecen en las respuestas del catálogo (NonSensitiveUserSchema).
+_PUBLIC_USER_COLUMNS = "username, email, first_name, last_name, is_active, date_joined, birth_date"
+
+CACHE_VERSION_TRIGGERS = (
+    "cache_versions_book_owners_insert",
+    "cache_versions_book_owners_update",
+    "cache_versions_book_owners_delete",
+    "cache_versions_books_update",
+    "cache_versions_books_delete",
+    "cache_versions_users_update",
+)
+
+# La misma marca que FACET_COUNTS_BULK_GUARD: las escrituras masivas sellan
+# sus libros de una vez con CACHE_VERSION_BULK_STAMP en lugar de dos upserts
+# por propietario.
+CACHE_VERSION_BULK_GUARD = "WHEN NOT EXISTS (SELECT 1 FROM book_facet_counts_bulk_writes)"
+
+CACHE_VERSION_DDL = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS cache_versions_book_owners_insert AFTER INSERT ON book_owners
+    {CACHE_VERSION_BULK_GUARD} BEGIN
+        {_BUMP_CATALOG_VERSION}
+        {_stamp_book_version("new.book_id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS cache_versions_book_owners_update AFTER UPDATE ON book_owners BEGIN
+        {_BUMP_CATALOG_VERSION}
+        {_stamp_book_version("old.book_id")}
+        {_stamp_book_version("new.book_id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS cache_versions_book_owners_delete AFTER DELETE ON book_owners BEGIN
+        {_BUMP_CATALOG_VERSION}
+        {_stamp_book_version("old.book_id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS cache_versions_books_update AFTER UPDATE ON books BEGIN
+        {_BUMP_CATALOG_VERSION}
+        {_stamp_book_version("new.id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS cache_versions_books_delete AFTER DELETE ON books BEGIN
+        {_BUMP_CATALOG_VERSION}
+        {_stamp_book_version("old.id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS cache_versions_users_update AFTER UPDATE OF {_PUBLIC_USER_COLUMNS} ON users BEGIN
+        {_BUMP_CATALOG_VERSION}
+        INSERT INTO book_cache_versions(book_id, version)
+        SELECT book_owners.book_id, cache_versions.version FROM book_owners, cache_versions
+        WHERE book_owners.owner_id = new.id AND cache_versions.scope = 'catalog'
+        ON CONFLICT(book_id) DO UPDATE SET version = excluded.version;
+    END
+    """,
+)
+
+CACHE_VERSION_BULK_STAMP = (
+    _BUMP_CATALOG_VERSION,
+    """
+    INSERT INTO book_cache_versions(book_id, version)
+    SELECT DISTINCT json_each.value, cache_versions.version FROM json_each(:book_ids), cache_versions
+    WHERE cache_versions.scope = 'catalog'
+    ON CONFLICT(book_id) DO UPDATE SET version = excluded.version
+    """,
+)
+
+# Sella los libros que ya hubiera con la versión actual de 'catalog', que
+# no es menor que ninguna de las que pudieran tener antes.
+CACHE_VERSION_BACKFILL = (
+    """
+    INSERT INTO book_cache_versions(book_id, version)
+    SELECT id, coalesce((SELECT version FROM cache_versions WHERE scope = 'catalog'), 0) FROM books WHERE true
+    ON CONFLICT(book_id) DO NOTHING
+    """,
+)
+
+_BUMP_SEARCH_VERSION = (
+    "INSERT INTO cache_versions(scope, version) VALUES ('search', 1) "
+    "ON CONFLICT(scope) DO UPDATE SET version = version + 1;"
+)
+
+# Cualquier cambio en 'books_fts' altera las estadísticas del corpus con las
+# que bm25 puntúa, así que un cursor de la búsqueda solo vale mientras
+# 'search' no cambie. Las escrituras masivas lo incrementan una vez por
+# bloque con SEARCH_VERSION_BULK_BUMP.
+SEARCH_VERSION_DDL = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS cache_versions_search_insert AFTER INSERT ON books
+    {CACHE_VERSION_BULK_GUARD} BEGIN
+        {_BUMP_SEARCH_VERSION}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS cache_versions_search_update AFTER UPDATE OF title, author, description ON books BEGIN
+        {_BUMP_SEARCH_VERSION}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS cache_versions_search_delete AFTER DELETE ON books BEGIN
+        {_BUMP_SEARCH_VERSION}
+    END
+    """,
+)
+
+SEARCH_VERSION_BULK_BUMP = _BUMP_SEARCH_VERSION
+
+@event.listens_for(Base.metadata, "after_create")
+def create_cache_version_triggers(target, connection, **kw):
+    """
+    Crea tras create_all los triggers que mantienen 'cache_versions' y
+    'book_cache_versions', incluido el ámbito 'search'. Los triggers
+    anteriores a la migración 0012, que no sellan los libros, se sustituyen.
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    insert_trigger = connection.execute(text("SELECT sql FROM sqlite_master WHERE name = 'cache_versions_book_owners_insert'")).scalar()
+    if insert_trigger is not None and CACHE_VERSION_BULK_GUARD not in insert_trigger:
+        for name in CACHE_VERSION_TRIGGERS:
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+        for statement in CACHE_VERSION_BACKFILL:
+            connection.execute(text(statement))
+    for statement in CACHE_VERSION_DDL + SEARCH_VERSION_DDL:
+        connection.execute(text(statement))
+
+def _reading_stats_delta(row: str, sign: str) -> str:
+    """
+    Suma (sign '+') o resta (sign '-') la aportación del registro de lectura
+    'new' u 'old' a los dos resúmenes.
+    """
+    finished = f'{row}."end" IS NOT NULL'
+    pages = f"CASE WHEN {finished} THEN coalesce((SELECT pages FROM books WHERE id = {row}.book_id), 0) ELSE 0 END"
+    days = f'julianday({row}."end") - julianday({row}.start)'
+    timed = f"{finished} AND {days} IS NOT NULL"
+    month = f'strftime(\'%Y-%m\', {row}."end")'
+    return f"""
+        INSERT INTO reading_stats(user_id, finished, pages_read, reading_days, timed, reading)
+        VALUES (
+            {row}.user_id,
+            {sign}({finished}),
+            {sign}({pages}),
+            {sign}(CASE WHEN {timed} THEN max({days}, 0) ELSE 0 END),
+            {sign}({timed}),
+            {sign}({row}.start IS NOT NULL AND {row}."end" IS NULL)
+        )
+        ON CONFLICT(user_id) DO UPDATE SET
+            finished = finished + excluded.finished,
+            pages_read = pages_read + excluded.pages_read,
+            reading_days = reading_days + excluded.reading_days,
+            timed = timed + excluded.timed,
+            reading = reading + excluded.reading;
+        INSERT INTO reading_stats_monthly(user_id, month, finished, pages_read)
+        SELECT {row}.user_id, {month}, {sign}1, {sign}({pages})
+        WHERE {month} IS NOT NULL
+        ON CONFLICT(user_id, month) DO UPDATE SET
+            finished = finished + excluded.finished,
+            pages_read = pages_read + excluded.pages_read;
+        DELETE FROM reading_stats_monthly WHERE user_id = {row}.user_id AND finished = 0;
+    """
+
+READING_STATS_DDL = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS reading_stats_after_insert AFTER INSERT ON readed_books BEGIN
+        {_reading_stats_delta("new", "+")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS reading_stats_after_delete AFTER DELETE ON readed_books BEGIN
+        {_reading_stats_delta("old", "-")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS reading_stats_after_update AFTER UPDATE ON readed_books BEGIN
+        {_reading_stats_delta("old", "-")}
+        {_reading_stats_delta("new", "+")}
+    END
+    """,
+)
+
+@event.listens_for(Base.metadata, "after_create")
+def create_reading_stats_triggers(target, connection, **kw):
+    """
+    Crea tras create_all los triggers que mantienen 'reading_stats' y
+    'reading_stats_monthly'.
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    for statement in READING_STATS_DDL:
+        connection.execute(text(statement))
+
+# Expresión SQL del valor de cada faceta para la fila 'new' u 'old' de books.
+FACET_VALUES = {
+    "language": "{row}.language",
+    "author": "{row}.author",
+    "published_year": "CAST({row}.published_year AS TEXT)",
+    "available": "CAST(coalesce({row}.available, 1) AS TEXT)",
+}
+
+# (faceta del filtro, faceta contada): los recuentos sin filtro y los de cada
+# faceta dentro de cada valor de otra. Un libro aporta una fila a cada par.
+FACET_PAIRS = tuple(("", facet) for facet in FACET_VALUES) + tuple(
+    (filter_facet, facet) for filter_facet in FACET_VALUES for facet in FACET_VALUES if facet != filter_facet
+)
+
+def _facet_value(facet: str, row: str) -> str:
+    return FACET_VALUES[facet].format(row=row) if facet else "''"
+
+def _facet_counts_delta(row: str, sign: str, facet: str | None = None) -> str:
+    """
+    Suma (sign '+') o resta (sign '-') la fila 'new' u 'old' de books a los
+    recuentos; con facet, solo a los pares en los que aparece esa faceta.
+    """
+    pairs = [pair for pair in FACET_PAIRS if facet is None or facet in pair]
+    keys = " UNION ALL ".join(
+        f"SELECT '{filter_facet}' AS filter_facet, {_facet_value(filter_facet, row)} AS filter_value, "
+        f"'{counted}' AS facet, {_facet_value(counted, row)} AS value"
+        for filter_facet, counted in pairs
+    )
+    return f"""
+        INSERT INTO book_facet_counts(filter_facet, filter_value, facet, value, count)
+        SELECT filter_facet, filter_value, facet, value, {sign}1 FROM ({keys})
+        WHERE filter_value IS NOT NULL AND value IS NOT NULL
+        ON CONFLICT(filter_facet, filter_value, facet, value) DO UPDATE SET count = count + excluded.count;
+    """
+
+_FACET_COLUMNS_CHANGED = " OR ".join(
+    f"old.{column} IS NOT new.{column}" for column in ("language", "author", "published_year")
+)
+_AVAILABILITY_CHANGED = "coalesce(old.available, 1) IS NOT coalesce(new.available, 1)"
+
+FACET_COUNTS_BULK_GUARD = "WHEN NOT EXISTS (SELECT 1 FROM book_facet_counts_bulk_writes)"
+
+FACET_COUNTS_DDL = (
+    # Las escrituras masivas suman sus recuentos de una vez (ver
+    # BookFacetCountsBulkWrite): 16 upserts por libro las hacían 3 veces más lentas.
+    f"""
+    CREATE TRIGGER IF NOT EXISTS book_facet_counts_after_insert AFTER INSERT ON books
+    {FACET_COUNTS_BULK_GUARD} BEGIN
+        {_facet_counts_delta("new", "+")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS book_facet_counts_after_delete AFTER DELETE ON books BEGIN
+        {_facet_counts_delta("old", "-")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS book_facet_counts_after_update AFTER UPDATE OF language, author, published_year, available ON books
+    WHEN {_FACET_COLUMNS_CHANGED} BEGIN
+        {_facet_counts_delta("old", "-")}
+        {_facet_counts_delta("new", "+")}
+    END
+    """,
+    # Préstamos y devoluciones solo cambian available: basta con los 7 pares
+    # en los que aparece, en lugar de restar y sumar los 16.
+    f"""
+    CREATE TRIGGER IF NOT EXISTS book_facet_counts_after_availability AFTER UPDATE OF available ON books
+    WHEN NOT ({_FACET_COLUMNS_CHANGED}) AND {_AVAILABILITY_CHANGED} BEGIN
+        {_facet_counts_delta("old", "-", "available")}
+        {_facet_counts_delta("new", "+", "available")}
+    END
+    """,
+)
+
+# Recalcula los recuentos desde los libros que ya existen.
+FACET_COUNTS_BACKFILL = ("DELETE FROM book_facet_counts",) + tuple(
+    f"""
+    INSERT INTO book_facet_counts(filter_facet, filter_value, facet, value, count)
+    SELECT '{filter_facet}', {_facet_value(filter_facet, "books")}, '{counted}', {_facet_value(counted, "books")}, count(*)
+    FROM books
+    WHERE {_facet_value(filter_facet, "books")} IS NOT NULL AND {_facet_value(counted, "books")} IS NOT NULL
+    GROUP BY 2, 4
+    """
+    for filter_facet, counted in FACET_PAIRS
+)
+
+# Suma a los recuentos los libros con id entre :first_id y :last_id, con un
+# GROUP BY por par y un upsert por (filtro, faceta, valor) en lugar de 16 por
+# libro. Agrupar cada par por separado ordena claves de dos columnas y cuesta
+# la mitad que un GROUP BY sobre la unión de los 16. Se ejecuta en la
+# transacción que insertó los libros: como es el único escritor y SQLite da
+# a cada fila max(id) + 1, el rango son exactamente esos libros.
+FACET_COUNTS_BULK_INSERT = (
+    "INSERT INTO book_facet_counts(filter_facet, filter_value, facet, value, count) "
+    + " UNION ALL ".join(
+        f"SELECT '{filter_facet}', {_facet_value(filter_facet, 'books')}, '{counted}', {_facet_value(counted, 'books')}, count(*) "
+        f"FROM books WHERE books.id BETWEEN :first_id AND :last_id "
+        f"AND {_facet_value(filter_facet, 'books')} IS NOT NULL AND {_facet_value(counted, 'books')} IS NOT NULL "
+        f"GROUP BY 2, 4"
+        for filter_facet, counted in FACET_PAIRS
+    )
+    + " ON CONFLICT(filter_facet, filter_value, facet, value) DO UPDATE SET count = count + excluded.count"
+)
+
+@event.listens_for(Base.metadata, "after_create")
+def create_facet_counts_triggers(target, connection, **kw):
+    """
+    Crea tras create_all los triggers que mantienen 'book_facet_counts' si aún
+    no existen, y calcula los recuentos de los libros que ya hubiera. Un
+    trigger de INSERT anterior a la migración 0011 se sustituye.
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    insert_trigger = connection.execute(text("SELECT sql FROM sqlite_master WHERE name = 'book_facet_counts_after_insert'")).scalar()
+    if insert_trigger is None:
+        for statement in FACET_COUNTS_DDL + FACET_COUNTS_BACKFILL:
+            connection.execute(text(statement))
+    elif FACET_COUNTS_BULK_GUARD not in insert_trigger:
+        # Trigger de antes de la migración 0011: las escrituras masivas contarían dos veces.
+        connection.execute(text("DROP TRIGGER book_facet_counts_after_insert"))
+        connection.execute(text(FACET_COUNTS_DDL[0]))
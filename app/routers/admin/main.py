@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from app.schemas.profile import ProfileSchema
+from app.schemas.user import SensitiveUserSchema
+from app.controller.profiling import collapsed_stacks, profile_buffer
+from app.controller.users import get_admin_user
+
+router = APIRouter()
+
+def collapsed_response(sessions: list, filename: str) -> PlainTextResponse:
+    return PlainTextResponse(
+        collapsed_stacks(sessions),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.get("/profiles", tags=["Admin"], response_model=list[ProfileSchema], description="Profiled requests kept by this worker, newest first")
+async def list_profiles(admin: SensitiveUserSchema = Depends(get_admin_user)):
+    return [session.schema() for session in profile_buffer.list()]
+
+@router.get("/profiles/collapsed", tags=["Admin"], response_class=PlainTextResponse, description="Every profile of this worker as collapsed stacks, for flamegraph.pl or speedscope")
+async def download_all_profiles(admin: SensitiveUserSchema = Depends(get_admin_user)):
+    return collapsed_response(profile_buffer.list(), "profiles.collapsed")
+
+@router.get("/profiles/{profile_id}/collapsed", tags=["Admin"], response_class=PlainTextResponse, description="One profile as collapsed stacks")
+async def download_profile(profile_id: str, admin: SensitiveUserSchema = Depends(get_admin_user)):
+    session = profile_buffer.get(profile_id)
+    if session is None:
+        # Each uvicorn worker keeps its own buffer; the ID starts with the worker's PID.
+        raise HTTPException(status_code=404, detail="Profile not found in this worker")
+    return collapsed_response([session], f"profile-{profile_id}.collapsed")
+
+@router.delete("/profiles", tags=["Admin"], status_code=204, description="Empty this worker's profile buffer")
+async def clear_profiles(admin: SensitiveUserSchema = Depends(get_admin_user)):
+    profile_buffer.clear()
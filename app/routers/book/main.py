@@ -1,78 +1,180 @@
-import os
-from fastapi import APIRouter, HTTPException, UploadFile, Depends
-import shutil
-from app.schemas.book import ReturnBookSchema
-from app.schemas.user_book import BookSchemaWithOwner
-from app.controller.books import add_new_book, query_books
-from app.controller.users import oauth2_scheme
+from typing import Literal
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+import orjson
+from sqlalchemy.orm import Session as SQLSession
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSQLSession
+from app.config.covers import COVER_LOOKUP_MAX_AGE
+from app.config.database import get_unit_of_work, run_in_session
+from app.config.lending import IDEMPOTENCY_KEY_MAX_LENGTH
+from app.config.recommendations import RECOMMENDATIONS_TOP_K
+from app.config.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.schemas.book import ReturnBookSchema, BookFacetsSchema, BookSearchPageSchema, ImportReportSchema, BookCoverSchema, CoverUploadSchema, ReadedBookSchema, FinishReadingSchema, RecommendedBookSchema, LendingSchema
+from app.schemas.user import NonSensitiveUserSchema, SensitiveUserSchema
+from app.schemas.user_book import BookSchemaWithOwner, BookPageSchema
+from app.controller.books import (
+  add_new_book, book_version_statement, catalog_page_version_statement, query_book_by_isbn, query_books,
+  query_versioned_book, query_versioned_catalog_page
+)
+from app.controller.covers import (
+  accepts_webp, choose_cover_variant, cover_file_response, generate_cover_variants,
+  query_book_cover, query_book_cover_row, upload_cover
+)
+from app.controller.lending import borrow_book, return_book
+from app.controller.bulk_import import DEFAULT_IMPORT_CHUNK_SIZE, MAX_IMPORT_CHUNK_SIZE, import_books
+from app.controller.export import export_books_csv, export_books_ndjson
+from app.controller.facets import DEFAULT_FACET_LIMIT, MAX_FACET_LIMIT, query_facets
+from app.controller.response_cache import cached_json_response, get_cache_version, response_cache
+from app.controller.search import search_books
+from app.controller.recommendations import query_similar_books, similarity_index
+from app.controller.readings import add_reading, finish_reading
+from app.controller.users import oauth2_scheme, getEmailFromToken, get_admin_user, get_current_user
 
 router = APIRouter()
 
 @router.post("/add-book", tags=["Books"], response_model=BookSchemaWithOwner, description="Add a new book")
-async def new_book(book: BookSchemaWithOwner):
+async def new_book(book: BookSchemaWithOwner, db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
   if not book:
     raise HTTPException(status_code=400, detail="Book data is required")
-  response = add_new_book(book)
+  response = await run_in_session(db, add_new_book, book)
   return response
 
-@router.post("/add-books", tags=["Books"], response_model=BookSchemaWithOwner | str, description="Add a new book")
-async def new_books(books: list[BookSchemaWithOwner]):
+@router.post("/add-books", tags=["Books"], response_model=BookSchemaWithOwner | str, description="Add several books. A book whose ISBN is already in the catalog, or earlier in the list, adds its owner to that book instead of a second copy")
+async def new_books(books: list[BookSchemaWithOwner], db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
   try:
     if books is None or len(books) == 0:
       raise HTTPException(status_code=400, detail="Book data is required")
-    response = add_new_book(books=books)
+    response = await run_in_session(db, add_new_book, books=books)
     return response if isinstance(response, BookSchemaWithOwner) else "Books added successfully"
   except Exception as e:
     raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/get-all-books", tags=["Books"], response_model=list[ReturnBookSchema | BookSchemaWithOwner], description="Get all books")
-async def get_all_books():
+@router.post("/import", tags=["Books"], response_model=ImportReportSchema, description="Bulk import books from a streamed NDJSON or CSV body (one book per line, with owner_id), committed chunk by chunk. Rows repeating an ISBN add an owner to the existing book")
+async def bulk_import_books(request: Request, format: Literal["ndjson", "csv"] = "ndjson", chunk_size: int = Query(DEFAULT_IMPORT_CHUNK_SIZE, ge=1, le=MAX_IMPORT_CHUNK_SIZE)):
+  return await import_books(request.stream(), format=format, chunk_size=chunk_size)
+
+@router.get("/get-all-books", tags=["Books"], response_model=BookPageSchema, description="Get a page of books. Pass next_cursor back as cursor to get the following page. Supports If-None-Match")
+async def get_all_books(request: Request, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: str | None = None, db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
+  async def load():
+    page_version, page = await run_in_session(db, query_versioned_catalog_page, version, limit=limit, cursor=cursor)
+    return page_version, orjson.dumps(page)
+
   try:
-    response = query_books()
-    return response
+    version = await run_in_session(db, get_cache_version, catalog_page_version_statement(limit, cursor))
+    return await cached_json_response(request, ("get-all-books", limit, cursor), version, load)
+  except HTTPException:
+    raise
   except Exception as e:
     print(f"Error fetching books: {e}")
     raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/get-book/{book_id}", tags=["Books"], response_model=ReturnBookSchema | BookSchemaWithOwner, description="Get a book by ID")
-async def get_book(book_id: int):
+@router.get("/search", tags=["Books"], response_model=BookSearchPageSchema, description="Full-text search over title, author and description, best match first. A cursor returns 409 once a book was added, removed or had its searchable text changed, since the ranking changed with it: search again from the first page")
+async def search(q: str = Query(..., min_length=1, max_length=200), limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: str | None = None, db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
+  return await run_in_session(db, search_books, q, limit=limit, cursor=cursor)
+
+@router.get("/facets", tags=["Books"], response_model=BookFacetsSchema, description="Number of books per language, author, published year and availability, most common first. Optionally filtered by one of them")
+async def get_facets(language: str | None = None, author: str | None = None, published_year: int | None = None, available: bool | None = None, limit: int = Query(DEFAULT_FACET_LIMIT, ge=1, le=MAX_FACET_LIMIT), db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
+  filters = {"language": language, "author": author, "published_year": published_year, "available": available}
+  return await run_in_session(db, query_facets, filters, limit)
+
+@router.get("/export", tags=["Books"], description="Stream the whole catalog, one row per book and owner, as NDJSON (default) or CSV")
+async def export_catalog(format: Literal["ndjson", "csv"] = "ndjson"):
+  # The generators are synchronous, so Starlette runs them on its threadpool.
+  if format == "csv":
+    return StreamingResponse(
+      export_books_csv(),
+      media_type="text/csv",
+      headers={"Content-Disposition": "attachment; filename=books.csv"}
+    )
+  return StreamingResponse(
+    export_books_ndjson(),
+    media_type="application/x-ndjson",
+    headers={"Content-Disposition": "attachment; filename=books.ndjson"}
+  )
+
+@router.get("/get-book/{book_id}", tags=["Books"], response_model=ReturnBookSchema | BookSchemaWithOwner, description="Get a book by ID. Supports If-None-Match")
+async def get_book(request: Request, book_id: int, db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
+  async def load():
+    return await run_in_session(db, query_versioned_book, book_id)
+
   try:
-    response = query_books(id=book_id)
-    if not response:
-      raise HTTPException(status_code=404, detail="Book not found")
-    return response
+    version = await run_in_session(db, get_cache_version, book_version_statement(book_id))
+    return await cached_json_response(request, ("get-book", book_id), version, load)
+  except HTTPException:
+    raise
   except Exception as e:
     print(f"Error fetching book with ID {book_id}: {e}")
     raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/owned-books", tags=["Books"], description="Get book owned by the user")
-async def get_owned_books(token: str = Depends(oauth2_scheme)):
-  response = query_books(email=token)
-  return response
+@router.get("/by-isbn/{isbn}", tags=["Books"], response_model=ReturnBookSchema, description="Get a book by ISBN-10 or ISBN-13, with or without hyphens")
+async def get_book_by_isbn(isbn: str, db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
+  return await run_in_session(db, query_book_by_isbn, isbn)
+
+@router.get("/response-cache-stats", tags=["Books"], description="Hit, miss and eviction counters of this worker's catalog response cache. Administrators only")
+async def response_cache_stats(admin: SensitiveUserSchema = Depends(get_admin_user)):
+  return response_cache.stats()
 
-@router.get("/borrowed-books", tags=["Books"], description="Get books borrowed by the user")
-async def get_borrowed_books(token: str = Depends(oauth2_scheme)):
-  response = query_books(email=token, borrowed=True)
+@router.get("/owned-books", tags=["Books"], response_model=list[ReturnBookSchema], description="Get book owned by the user")
+async def get_owned_books(token: str = Depends(oauth2_scheme), db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
+  email = getEmailFromToken(token)
+  response = await run_in_session(db, query_books, email=email, raw=True)
+  # The rows already have the ReturnBookSchema shape; skip revalidating them.
+  return ORJSONResponse(response)
+
+@router.get("/borrowed-books", tags=["Books"], response_model=list[ReturnBookSchema], description="Get the books the user has borrowed and not returned yet")
+async def get_borrowed_books(token: str = Depends(oauth2_scheme), db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
+  email = getEmailFromToken(token)
+  response = await run_in_session(db, query_books, email=email, borrowed=True, raw=True)
+  return ORJSONResponse(response)
+
+@router.post("/borrow/{book_id}", tags=["Books"], response_model=LendingSchema, description="Borrow a book for the current user. Of concurrent requests for the same book only one succeeds, the others get 409. Retrying with the same Idempotency-Key returns the first result, marked with an Idempotency-Replayed header")
+async def borrow(book_id: int, response: Response, idempotency_key: str | None = Header(None, max_length=IDEMPOTENCY_KEY_MAX_LENGTH), current_user: NonSensitiveUserSchema = Depends(get_current_user), db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
+  lending, replayed = await run_in_session(db, borrow_book, book_id, current_user.id, idempotency_key)
+  if replayed:
+    response.headers["Idempotency-Replayed"] = "true"
+  return lending
+
+@router.post("/return/{book_id}", tags=["Books"], response_model=LendingSchema, description="Return a book the current user borrowed. Supports Idempotency-Key like /borrow")
+async def give_back(book_id: int, response: Response, idempotency_key: str | None = Header(None, max_length=IDEMPOTENCY_KEY_MAX_LENGTH), current_user: NonSensitiveUserSchema = Depends(get_current_user), db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
+  lending, replayed = await run_in_session(db, return_book, book_id, current_user.id, idempotency_key)
+  if replayed:
+    response.headers["Idempotency-Replayed"] = "true"
+  return lending
+
+@router.post("/add-reading", tags=["Books"], response_model=ReadedBookSchema, description="Record that the current user started (and optionally finished) reading a book")
+async def new_reading(reading: ReadedBookSchema, current_user: NonSensitiveUserSchema = Depends(get_current_user), db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
+  if reading.user_id != current_user.id:
+    raise HTTPException(status_code=403, detail="You can only record your own readings")
+  return await run_in_session(db, add_reading, reading)
+
+@router.patch("/finish-reading/{reading_id}", tags=["Books"], response_model=ReadedBookSchema, description="Set the end date of one of the current user's readings")
+async def end_reading(reading_id: int, body: FinishReadingSchema, current_user: NonSensitiveUserSchema = Depends(get_current_user), db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
+  return await run_in_session(db, finish_reading, reading_id, current_user.id, body.end)
+
+@router.post("/upload-cover/{book_id}", tags=["Books"], response_model=CoverUploadSchema, status_code=202, description="Upload a book cover as the raw request body (JPEG, PNG or WebP). Thumbnails and a WebP version are rendered in the background")
+async def upload_book_cover(book_id: int, request: Request, background_tasks: BackgroundTasks, db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
+  content_length = request.headers.get("content-length")
+  response = await upload_cover(db, book_id, request.stream(), int(content_length) if content_length else None)
+  background_tasks.add_task(generate_cover_variants, book_id, response.cover.rsplit("/", 1)[-1])
   return response
 
-""" @router.post("/upload-cover", tags=["Books"], description="Upload a book cover")
-async def upload_cover(file: UploadFile, description: str = None):
-  # Here you would typically save the file to a directory or cloud storage
-  # For demonstration, we'll just return the filename and content type
-  os.makedirs("static", exist_ok=True)
-  file_path = f"static/{file.filename}"
-  with open(file_path, "wb") as buffer:
-    shutil.copyfileobj(file.file, buffer)
-    
-  return {
-    "filename": file.filename,
-    "content_type": file.content_type
-  }
-
-@router.get("/book-cover/{book_id}", tags=["Books"], description="Get book cover")
-async def get_book_cover(book_id: str):
-  # This function would typically query the database for the book cover path
-  # For demonstration, we'll just return a static path
-  return f"static/book_covers/{book_id}.jpg" """
+@router.get("/cover/{book_id}", tags=["Books"], response_model=BookCoverSchema, description="Get the cover of a book and the URLs of its thumbnails and WebP version (null while they are rendered)")
+async def get_cover(book_id: int, db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
+  return await run_in_session(db, query_book_cover, book_id)
+
+@router.get("/book-cover/{book_id}", tags=["Books"], description="Get the cover image of a book. Sends the smallest thumbnail at least `width` pixels wide (the full image without width), as WebP when the Accept header allows it. Supports Range and If-None-Match")
+async def get_book_cover(request: Request, book_id: int, width: int | None = Query(None, ge=1, le=4096), db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
+  row = await run_in_session(db, query_book_cover_row, book_id)
+  name = choose_cover_variant(row, width, accepts_webp(request.headers.get("accept")))
+  if name is None:
+    raise HTTPException(status_code=404, detail="Book has no cover")
+  # The chosen file changes when a new cover is uploaded, so only cache it briefly.
+  return await cover_file_response(request.headers, name, f"public, max-age={COVER_LOOKUP_MAX_AGE}", vary="Accept")
 
+@router.get("/recommendation-stats", tags=["Books"], description="Version, size and last refresh of this worker's book similarity index. Administrators only")
+async def recommendation_stats(admin: SensitiveUserSchema = Depends(get_admin_user)):
+  return similarity_index.stats()
 
+@router.get("/{book_id}/similar", tags=["Books"], response_model=list[RecommendedBookSchema], description="Books most often owned or read by the same users as this one, most similar first")
+async def get_similar_books(book_id: int, limit: int = Query(10, ge=1, le=RECOMMENDATIONS_TOP_K), db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
+  return await run_in_session(db, query_similar_books, book_id, limit)
@@ -1,32 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError
 from sqlalchemy.orm import Session as SQLSession
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncSQLSession
 
-from app.config.database import get_db
+from app.config.database import get_unit_of_work, run_in_session
 from app.schemas.user import SensitiveUserSchema, NonSensitiveUserSchema, UserRegisterSchema, UserLoginSchema
-from app.controller.users import add_new_user, query_users, login, token_validator, oauth2_scheme, get_current_user
+from app.schemas.book import ReadingStatsSchema, RecommendedBookSchema
+from app.controller.recommendations import query_recommendations
+from app.controller.readings import DEFAULT_STATS_MONTHS, MAX_STATS_MONTHS, query_reading_stats
+from app.controller.rate_limit import admission_stats, password_admission
+from app.controller.token_cache import token_cache
+from app.controller.users import add_new_user, query_users, login, token_validator, oauth2_scheme, get_admin_user, get_current_user, resolve_token_user
 
 router = APIRouter()
 
 @router.post("/add-user", tags=["Users"], response_model=SensitiveUserSchema, description="Add a new user")
-async def new_user(user: SensitiveUserSchema):
-    response = add_new_user(user)
+async def new_user(user: SensitiveUserSchema, db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
+    response = await add_new_user(db, user)
     return response
 
 @router.get("/get-user/{user_id}", tags=["Users"], response_model=NonSensitiveUserSchema | SensitiveUserSchema, description="Get a user by ID")
-async def get_user(user_id: int, token: str = Depends(oauth2_scheme)):
+async def get_user(user_id: int, token: str = Depends(oauth2_scheme), db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
     if not user_id:
         raise HTTPException(status_code=400, detail="User ID is required")
     if not token:
         raise HTTPException(status_code=401, detail="Token is required")
-    validation = query_users(token=token)
+    validation = await run_in_session(db, query_users, token=token)
     if validation.id != user_id:
         raise HTTPException(status_code=403, detail="You do not have permission to access this user")
-    response = query_users(id=user_id)
-    if not response:
-        raise HTTPException(status_code=404, detail="User not found")
-    return response
+    # The token already resolved this very user, no need to load it a second time.
+    return validation
 
 @router.get("/get-profile", tags=["Users"], response_model=NonSensitiveUserSchema, description="Get user profile")
 async def get_profile(current_user: NonSensitiveUserSchema = Depends(get_current_user)):
@@ -34,44 +38,58 @@ async def get_profile(current_user: NonSensitiveUserSchema = Depends(get_current
         raise HTTPException(status_code=404, detail="User not found")
     return current_user
 
+@router.get("/reading-stats/{user_id}", tags=["Users"], response_model=ReadingStatsSchema, description="Reading statistics of a user: books finished per month, pages read, average reading time and books being read. Only for that user or a superuser")
+async def get_reading_stats(user_id: int, months: int = Query(DEFAULT_STATS_MONTHS, ge=1, le=MAX_STATS_MONTHS), token: str = Depends(oauth2_scheme), db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
+    # get_current_user drops is_superuser, so the token is resolved as get_admin_user does.
+    current_user = await resolve_token_user(db, token)
+    if current_user.id != user_id and not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="You do not have permission to access this user")
+    return await run_in_session(db, query_reading_stats, user_id, months)
+
+@router.get("/me/recommendations", tags=["Users"], response_model=list[RecommendedBookSchema], description="Books similar to the ones the current user owns or has read")
+async def get_recommendations(limit: int = Query(20, ge=1, le=100), current_user: NonSensitiveUserSchema = Depends(get_current_user), db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
+    return await run_in_session(db, query_recommendations, current_user.id, limit)
+
 @router.get("/get-user", tags=["Users"], response_model=list[NonSensitiveUserSchema], description="Get all users")
-async def get_all_users():
-    response = query_users()
+async def get_all_users(db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
+    response = await run_in_session(db, query_users)
     if not response:
         raise HTTPException(status_code=404, detail="User not found")
     return response
 
 @router.get("/get-user-by-email", tags=["Users"], response_model=NonSensitiveUserSchema, description="Get a user by email")
-async def get_user_by_email(email: str):
-    response = query_users(email=email)
+async def get_user_by_email(email: str, db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
+    response = await run_in_session(db, query_users, email=email)
     if not response:
         raise HTTPException(status_code=404, detail="User not found")
     return response
 
 @router.post("/register", tags=["Users"], description="Register a new user")
-async def register_user(user: UserRegisterSchema):
+async def register_user(request: Request, user: UserRegisterSchema, db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
     try:
-        response = add_new_user(user)
+        with password_admission(request, "register", user.username):
+            response = await add_new_user(db, user)
         return response
     except HTTPException as e:
-        raise HTTPException(status_code=e.status_code, detail=e.detail)
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=e.headers)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/login", tags=["Users"], description="Login a user")
-async def login_user(user: OAuth2PasswordRequestForm = Depends(), db: SQLSession = Depends(get_db)):
+async def login_user(request: Request, user: OAuth2PasswordRequestForm = Depends(), db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
     try:
-        response = login(user, db)
+        with password_admission(request, "login", user.username):
+            response = await login(user, db)
         return response
     except HTTPException as e:
-        raise HTTPException(status_code=e.status_code, detail=e.detail)
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=e.headers)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/validate-token", tags=["Users"], description="Validate a token")
-async def validate_token(token: str = Depends(oauth2_scheme)):
+async def validate_token(token: str = Depends(oauth2_scheme), db: SQLSession | AsyncSQLSession = Depends(get_unit_of_work)):
     try:
-        response = query_users(token=token)
+        response = await run_in_session(db, query_users, token=token)
         return response
     except HTTPException as e:
         raise HTTPException(status_code=e.status_code, detail=e.detail)
@@ -86,4 +104,12 @@ async def validate_token(token: str = Depends(oauth2_scheme)):
     except JWTError as e:
         raise HTTPException(status_code=401, detail=f"Invalid token: {str(e)}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/token-cache-stats", tags=["Users"], description="Hit/miss counters of the token cache in this worker. Administrators only")
+async def get_token_cache_stats(admin: SensitiveUserSchema = Depends(get_admin_user)):
+    return token_cache.stats()
+
+@router.get("/auth-limiter-stats", tags=["Users"], description="Admission control state of /login and /register in this worker: requests in flight and token buckets per client IP and username. Administrators only")
+async def get_auth_limiter_stats(admin: SensitiveUserSchema = Depends(get_admin_user)):
+    return admission_stats()
@@ -45,7 +45,37 @@ class ReturnBookSchema(BaseModel):
         # orm_mode = True
         from_attributes=True
 
+class RecommendedBookSchema(ReturnBookSchema):
+    """
+    Schema representing a recommended book.
+    Attributes:
+        score (float): Cosine similarity with the book, or its sum over the user's books. Higher is better.
+    """
+    score: float
+
+class BookSearchResultSchema(ReturnBookSchema):
+    """
+    Schema representing a book matched by a full-text search.
+    Attributes:
+        snippet (str): Fragment of the best matching field, with the matched terms wrapped in <mark></mark>.
+        score (float): bm25 relevance. Lower is more relevant.
+    """
+    snippet: str
+    score: float
+
+class BookSearchPageSchema(BaseModel):
+    """
+    Schema representing one page of search results, best match first.
+    Attributes:
+        items (list[BookSearchResultSchema]): Matched books in this page.
+        next_cursor (str | None): Opaque cursor for the next page. None when this is the last page.
+            Valid until a title, author or description in the catalog changes; then the next page is a 409.
+    """
+    items: list[BookSearchResultSchema]
+    next_cursor: str | None = None
+
 class ReadedBookSchema(BaseModel):
+    id: int | None = None  # Set once the reading record is stored
     book_id: int
     user_id: int
     start: str | None = None  # Optional start date in ISO format
@@ -55,6 +85,78 @@ class ReadedBookSchema(BaseModel):
         # orm_mode = True
         from_attributes=True
 
+class LendingSchema(BaseModel):
+    """
+    Schema representing one loan of a book.
+    Attributes:
+        id (int): Unique identifier of the loan.
+        book_id (int): Identifier of the borrowed book.
+        user_id (int): Identifier of the user who borrowed it.
+        start (str): When the book was borrowed, in ISO format.
+        end (str): When it was returned, in ISO format; None while it is borrowed.
+    """
+    id: int
+    book_id: int
+    user_id: int
+    start: str
+    end: str | None = None
+
+    class Config:
+        from_attributes=True
+
+class FinishReadingSchema(BaseModel):
+    end: str  # End date in ISO format
+
+class MonthlyReadingSchema(BaseModel):
+    """
+    Schema representing the books a user finished in one month.
+    Attributes:
+        month (str): Month in YYYY-MM format, taken from the end date.
+        finished (int): Readings finished that month.
+        pages_read (int): Pages of the books finished that month.
+    """
+    month: str
+    finished: int
+    pages_read: int
+
+class ReadingStatsSchema(BaseModel):
+    """
+    Schema representing a user's reading statistics.
+    Attributes:
+        user_id (int): Unique identifier of the user.
+        finished (int): Readings with an end date.
+        pages_read (int): Pages of the finished books.
+        average_days (float | None): Mean days from start to end of the finished readings
+            that have both dates. None when there are none.
+        currently_reading (int): Readings with a start date and no end date.
+        months (list[MonthlyReadingSchema]): Most recent months first.
+    """
+    user_id: int
+    finished: int = 0
+    pages_read: int = 0
+    average_days: float | None = None
+    currently_reading: int = 0
+    months: list[MonthlyReadingSchema] = []
+
+class FacetValueSchema(BaseModel):
+    value: str | int | bool
+    count: int
+
+class BookFacetsSchema(BaseModel):
+    """
+    Schema representing the number of books per value of each facet.
+    Attributes:
+        total (int): Books matching the filter, or the whole catalog without one.
+        language, author, published_year, available (list[FacetValueSchema]): The
+            values with most books first. The filtered facet itself is counted
+            over the whole catalog, so the other values of the filter stay visible.
+    """
+    total: int
+    language: list[FacetValueSchema] = []
+    author: list[FacetValueSchema] = []
+    published_year: list[FacetValueSchema] = []
+    available: list[FacetValueSchema] = []
+
 class OwnerBookSchema(BaseModel):
     """
     Schema representing the relationship between a book and its owner.
@@ -71,4 +173,80 @@ class OwnerBookSchema(BaseModel):
 
     class Config:
         # orm_mode = True
-        from_attributes=True
\ No newline at end of file
+        from_attributes=True
+
+class BookImportSchema(BaseModel):
+    """
+    Schema for one row of a bulk import (one NDJSON object or one CSV row).
+    Attributes:
+        owner_id (int): ID of the user who owns the book. Must exist.
+        The rest of the fields match the books table.
+    """
+    title: str
+    author: str
+    published_year: int | None = None
+    isbn: str | None = None
+    pages: int | None = None
+    cover: str | None = None
+    language: str | None = None
+    description: str | None = None
+    available: bool = True
+    date_added: str | None = None
+    owner_id: int
+
+class ImportRowErrorSchema(BaseModel):
+    line: int
+    error: str
+
+class ImportChunkReportSchema(BaseModel):
+    """
+    Outcome of one chunk of a bulk import. Each chunk is its own transaction.
+    Attributes:
+        chunk (int): Position of the chunk in the upload, starting at 1.
+        inserted (int): Books inserted by this chunk.
+        attached (int): Rows whose ISBN was already in the catalog (or earlier in the
+            chunk); they added an owner to that book instead of a new book.
+        already_owned (int): Rows whose owner already had that book (in the catalog or
+            earlier in the chunk); nothing was written for them.
+        rejected (int): Rows that failed validation or referenced an unknown owner, or
+            every row of the chunk if its transaction failed.
+        errors (list[ImportRowErrorSchema]): The first rejected rows and why.
+    """
+    chunk: int
+    inserted: int
+    attached: int = 0
+    already_owned: int = 0
+    rejected: int
+    errors: list[ImportRowErrorSchema] = []
+
+class ImportReportSchema(BaseModel):
+    inserted: int
+    attached: int
+    already_owned: int
+    rejected: int
+    seconds: float
+    rows_per_second: float
+    chunks: list[ImportChunkReportSchema]
+
+class BookCoverSchema(BaseModel):
+    """
+    Schema representing a book's cover and its rendered variants.
+    Attributes:
+        book_id (int): Unique identifier of the book.
+        cover (str | None): URL of the cover as uploaded.
+        variants (dict | None): URLs of the full-size WebP ("webp") and of the JPEG and WebP
+            thumbnails by width ("thumbnails"). None until they have been rendered.
+    """
+    book_id: int
+    cover: str | None = None
+    variants: dict | None = None
+
+class CoverUploadSchema(BookCoverSchema):
+    """
+    Schema returned by a cover upload. Covers are stored under their content hash.
+    Attributes:
+        sha256 (str): SHA-256 of the uploaded file.
+        size (int): Size of the uploaded file in bytes.
+    """
+    sha256: str
+    size: int
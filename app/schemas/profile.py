@@ -0,0 +1,17 @@
+from pydantic import BaseModel
+
+class ProfileSchema(BaseModel):
+    """
+    A profiled request kept in a worker's profile buffer. The stacks
+    themselves are downloaded in collapsed format from
+    /api/admin/profiles/{id}/collapsed.
+    """
+    id: str
+    method: str
+    path: str
+    status: int | None
+    trigger: str
+    started_at: float
+    duration_ms: float | None
+    samples: int
+    interval_ms: float
@@ -38,6 +38,16 @@ class BookSchemaWithOwner(BaseModel):
         # orm_mode = True
         from_attributes=True
 
+class BookPageSchema(BaseModel):
+    """
+    Schema representing one page of the book catalog.
+    Attributes:
+        items (list[BookSchemaWithOwner]): Books in this page, ordered by book ID.
+        next_cursor (str | None): Opaque cursor for the next page. None when this is the last page.
+    """
+    items: list[BookSchemaWithOwner]
+    next_cursor: str | None = None
+
 class UserBookSchema(BaseModel):
     user: NonSensitiveUserSchema
     readed_books: list[BookSchemaWithOwner]
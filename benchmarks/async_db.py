@@ -0,0 +1,62 @@
+"""
+Concurrency benchmark for the sync and async database paths.
+
+Serves the app with uvicorn twice, once with GBOOKS_ASYNC_DB=0 and once with
+GBOOKS_ASYNC_DB=1, each over the same freshly seeded SQLite file, drives the
+same request mix against it over HTTP and prints throughput and latency
+percentiles for both. The "probe" column is the p95 latency of a route that
+never touches the database, requested while the load runs: it grows when
+handlers block the event loop.
+
+    python -m benchmarks.async_db --books 5000 --requests 2000 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+
+from benchmarks.common import drive, run_isolated, seed_database, serve
+
+
+def build_paths(args) -> list[str]:
+    rng = random.Random(7)
+    paths = []
+    for i in range(args.requests):
+        kind = i % 3
+        if kind == 0:
+            paths.append("/api/books/get-all-books?limit=50")
+        elif kind == 1:
+            paths.append(f"/api/books/get-book/{rng.randint(1, args.books)}")
+        else:
+            paths.append(f"/api/users/get-user-by-email?email=user{rng.randint(1, args.users)}@example.com")
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--books", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--seed-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.seed_only:
+        seed_database(users=args.users, books=args.books)
+        return
+
+    paths = build_paths(args)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_env = {"GBOOKS_DB_FILE": os.path.join(tmp, "bench.db")}
+        run_isolated("benchmarks.async_db", ["--seed-only", "--users", str(args.users), "--books", str(args.books)], db_env)
+
+        print(f"{'mode':<6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'probe ms':>9} {'errors':>7}")
+        for mode, flag in (("sync", "0"), ("async", "1")):
+            with serve({**db_env, "GBOOKS_ASYNC_DB": flag}) as base_url:
+                r = asyncio.run(drive(None, paths, args.concurrency, probe_path="/openapi.json", base_url=base_url))
+            print(f"{mode:<6} {r['rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {r['probe_p95_ms']:>9} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Helpers shared by the benchmark scripts.
+
+The app reads its configuration from the environment at import time, so every
+benchmark configures GBOOKS_* variables first and only then imports `app`.
+"""
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def seed_database(users: int, books: int, seed: int = 42) -> None:
+    """
+    Creates the schema on the configured database and fills it with
+    deterministic users, books and one ownership per book.
+    """
+    from benchmarks.datagen import generate
+
+    generate(users=users, books=books, seed=seed)
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies: list[float], elapsed: float) -> dict:
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+async def drive(app, paths: list[str | dict], concurrency: int, method: str = "GET", probe_path: str | None = None, base_url: str | None = None) -> dict:
+    """
+    Sends every path in `paths` through an in-process ASGI client, keeping at
+    most `concurrency` requests in flight, and returns latency statistics.
+    With `app=None` the requests go over the network to `base_url` instead.
+    An item can also be a dict of httpx.AsyncClient.request arguments
+    (method, url, headers, json, content, data).
+
+    When `probe_path` is given, a separate task requests it every 10 ms while
+    the load runs; its latency shows how long the event loop stays blocked.
+    """
+    import httpx
+
+    latencies: list[float] = []
+    errors = 0
+    queue = list(reversed(paths))
+    if app is not None:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app, raise_app_exceptions=False), base_url="http://bench")
+    else:
+        limits = httpx.Limits(max_connections=concurrency + 1)
+        client = httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60)
+    async with client:
+        async def worker():
+            nonlocal errors
+            while queue:
+                path = queue.pop()
+                request = path if isinstance(path, dict) else {"method": method, "url": path}
+                started = time.perf_counter()
+                response = await client.request(**request)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    errors += 1
+
+        probe_latencies: list[float] = []
+
+        async def probe():
+            while queue:
+                probe_started = time.perf_counter()
+                await client.get(probe_path)
+                probe_latencies.append(time.perf_counter() - probe_started)
+                await asyncio.sleep(0.01)
+
+        started = time.perf_counter()
+        tasks = [worker() for _ in range(concurrency)]
+        if probe_path:
+            tasks.append(probe())
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    result = summarize(latencies, elapsed)
+    result["errors"] = errors
+    if probe_path:
+        result["probe_p95_ms"] = round(percentile(probe_latencies, 95) * 1000, 2)
+    return result
+
+
+def run_isolated(module: str, args: list[str], env: dict) -> dict | None:
+    """
+    Re-runs `module` in a fresh interpreter with extra environment variables
+    and returns the JSON document it prints on its last line of stdout, if any.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-m", module, *args],
+        cwd=REPO_ROOT,
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    lines = completed.stdout.strip().splitlines()
+    return json.loads(lines[-1]) if lines else None
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def serve(env: dict, workers: int = 1):
+    """
+    Starts uvicorn on a free local port with extra environment variables and
+    yields its base URL once the app answers, stopping it on exit.
+    """
+    import httpx
+
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.application:get_app", "--factory",
+            "--port", str(port), "--workers", str(workers), "--log-level", "warning",
+        ],
+        cwd=REPO_ROOT,
+        env={**os.environ, **env},
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                httpx.get(f"{base_url}/openapi.json", timeout=1)
+                break
+            except httpx.TransportError:
+                if time.monotonic() > deadline or process.poll() is not None:
+                    raise RuntimeError("uvicorn did not start")
+                time.sleep(0.1)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
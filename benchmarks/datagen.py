@@ -0,0 +1,123 @@
+"""
+Seeded data generator for benchmark databases.
+
+Builds a SQLite database with N users, books, ownerships and reading records.
+The same arguments always produce the same rows. Every user's password is
+BENCHMARK_PASSWORD, hashed once with the configured bcrypt cost.
+
+    python -m benchmarks.datagen --out bench.db --users 1000 --books 20000 --ownerships 30000 --readings 50000
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+
+BENCHMARK_PASSWORD = "benchmark-password"
+LANGUAGES = ["es", "en", "pa", "fr"]
+WORDS = ["night", "river", "garden", "stone", "letter", "winter", "city", "mirror", "road", "song", "house", "sea"]
+CHUNK = 10000
+
+
+def book_isbn(i: int) -> str:
+    """A valid ISBN-13 per book number, so ISBN lookups find every book."""
+    digits = f"978{i:09d}"
+    return digits + str(-sum((3 if position % 2 else 1) * int(d) for position, d in enumerate(digits)) % 10)
+
+
+def _chunks(rows, size: int = CHUNK):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate(users: int, books: int, ownerships: int | None = None, readings: int = 0, seed: int = 42, password_hash: str = "not-a-real-hash") -> None:
+    """
+    Creates the schema on the configured database (GBOOKS_DB_FILE) and fills
+    it with Core bulk inserts. Every book gets one owner; ownerships above
+    `books` add second owners to random books. Readings are spread over
+    2024-2026 and about 80% of them are finished.
+    """
+    from app.config.database import Base, engine
+    from app.models.books import Book, BookOwner, ReadedBook
+    from app.models.users import User
+
+    rng = random.Random(seed)
+    ownerships = books if ownerships is None else max(ownerships, books)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for batch in _chunks({
+            "id": i,
+            "username": f"user{i}",
+            "email": f"user{i}@example.com",
+            "password": password_hash,
+            "first_name": "First",
+            "last_name": "Last",
+            "date_joined": "2024-01-01T00:00:00Z",
+            "birth_date": "1990-01-01",
+        } for i in range(1, users + 1)):
+            conn.execute(User.__table__.insert(), batch)
+
+        for batch in _chunks({
+            "id": i,
+            "title": f"Book {i}",
+            "author": f"Author {rng.randint(1, max(1, books // 10))}",
+            "published_year": rng.randint(1900, 2024),
+            "isbn": book_isbn(i),
+            "pages": rng.randint(80, 900),
+            "language": rng.choice(LANGUAGES),
+            "description": f"Description of book {i}: {' '.join(rng.sample(WORDS, 3))}",
+            "available": True,
+            "date_added": "2024-01-01",
+        } for i in range(1, books + 1)):
+            conn.execute(Book.__table__.insert(), batch)
+
+        owners = ((i, rng.randint(1, users)) for i in range(1, books + 1))
+        extra = ((rng.randint(1, books), rng.randint(1, users)) for _ in range(ownerships - books))
+        for source in (owners, extra):
+            for batch in _chunks({"book_id": book_id, "owner_id": owner_id, "date_added": "2024-01-01"} for book_id, owner_id in source):
+                conn.execute(BookOwner.__table__.insert(), batch)
+
+        first_day = datetime.date(2024, 1, 1)
+
+        def reading():
+            start = first_day + datetime.timedelta(days=rng.randint(0, 1000))
+            end = start + datetime.timedelta(days=rng.randint(1, 60)) if rng.random() < 0.8 else None
+            return {
+                "book_id": rng.randint(1, books),
+                "user_id": rng.randint(1, users),
+                "start": start.isoformat(),
+                "end": end.isoformat() if end else None,
+            }
+
+        for batch in _chunks(reading() for _ in range(readings)):
+            conn.execute(ReadedBook.__table__.insert(), batch)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True, help="SQLite file to create; must not exist")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--books", type=int, default=20000)
+    parser.add_argument("--ownerships", type=int, default=None, help="book_owners rows (at least --books)")
+    parser.add_argument("--readings", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if os.path.exists(args.out):
+        sys.exit(f"{args.out} already exists")
+    # The app reads GBOOKS_DB_FILE when it is imported.
+    os.environ["GBOOKS_DB_FILE"] = args.out
+    from app.config.authentication import pwd_context
+
+    generate(args.users, args.books, args.ownerships, args.readings, args.seed, pwd_context.hash(BENCHMARK_PASSWORD))
+    print(f"{args.out}: {args.users} users, {args.books} books, {max(args.ownerships or 0, args.books)} ownerships, {args.readings} readings")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Facet counts at several catalog sizes: reading /api/books/facets from the
+book_facet_counts table against grouping the books table on every request,
+plus what the triggers add to inserting a book and to a borrow/return, and
+the cost per book of a bulk import chunk, which adds its counts once.
+
+Every size runs in a fresh interpreter over a freshly seeded database, and
+afterwards the counts are compared with a GROUP BY over books, so the
+command exits with status 1 if the triggers ever drifted.
+
+    python -m benchmarks.facets --books 1000,10000,100000 --repeat 200
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.common import percentile, run_isolated, seed_database
+
+
+def timed(call, repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def measure(args) -> dict:
+    seed_database(users=100, books=args.books)
+
+    from sqlalchemy import insert, text, update
+    from app.config.database import engine, unit_of_work
+    from app.controller.facets import query_facets
+    from app.models.books import Book, FACET_VALUES
+
+    no_filter = {facet: None for facet in FACET_VALUES}
+    by_language = {**no_filter, "language": "es"}
+
+    def read(filters: dict):
+        with unit_of_work() as db:
+            query_facets(db, filters, limit=20)
+
+    def group_by(where: str = ""):
+        with engine.connect() as conn:
+            for facet, value in FACET_VALUES.items():
+                value = value.format(row="books")
+                conn.execute(text(f"SELECT {value}, count(*) FROM books {where} GROUP BY 1 ORDER BY 2 DESC LIMIT 20")).all()
+
+    result = {
+        "facets_ms": percentile(timed(lambda: read(no_filter), args.repeat), 50) * 1000,
+        "facets_filtered_ms": percentile(timed(lambda: read(by_language), args.repeat), 50) * 1000,
+        "group_by_ms": percentile(timed(group_by, max(1, args.repeat // 10)), 50) * 1000,
+        "group_by_filtered_ms": percentile(timed(lambda: group_by("WHERE language = 'es'"), max(1, args.repeat // 10)), 50) * 1000,
+    }
+
+    # Writes, each in its own transaction like a request.
+    next_id = iter(range(args.books + 1, args.books + 1 + args.repeat))
+
+    def add_book():
+        book_id = next(next_id)
+        with engine.begin() as conn:
+            conn.execute(insert(Book), {
+                "id": book_id, "title": f"Book {book_id}", "author": f"Author {book_id % 97}",
+                "published_year": 1900 + book_id % 125, "language": "es", "available": True,
+            })
+
+    def flip(available: bool):
+        with engine.begin() as conn:
+            conn.execute(update(Book).where(Book.id == 1).values(available=available))
+
+    result["insert_us"] = statistics.median(timed(add_book, args.repeat)) * 1e6
+
+    # A bulk import chunk adds its counts once, after its inserts.
+    from app.controller.bulk_import import insert_chunk
+    from app.schemas.book import BookImportSchema
+    chunk = [
+        (line, BookImportSchema(title=f"Bulk {line}", author=f"Author {line % 97}", published_year=1900 + line % 125, language="en", owner_id=1 + line % 100))
+        for line in range(args.bulk)
+    ]
+    result["bulk_insert_us"] = timed(lambda: insert_chunk(chunk), 1)[0] / args.bulk * 1e6
+    flips = timed(lambda: flip(False), 1) + [sample for _ in range(args.repeat // 2) for sample in timed(lambda: flip(True), 1) + timed(lambda: flip(False), 1)]
+    result["availability_us"] = statistics.median(flips) * 1e6
+
+    result["mismatches"] = check_counts(engine, text, FACET_VALUES)
+    return result
+
+
+def check_counts(engine, text, facet_values: dict) -> int:
+    """
+    Recomputes every count from the books table and returns how many rows of
+    book_facet_counts disagree (counts of zero are the same as no row).
+    """
+    expected = {}
+    with engine.connect() as conn:
+        values = {facet: value.format(row="books") for facet, value in facet_values.items()}
+        for filter_facet in ["", *values]:
+            for facet in values:
+                if facet == filter_facet:
+                    continue
+                filter_value = values[filter_facet] if filter_facet else "''"
+                for row in conn.execute(text(
+                    f"SELECT {filter_value}, {values[facet]}, count(*) FROM books "
+                    f"WHERE {filter_value} IS NOT NULL AND {values[facet]} IS NOT NULL GROUP BY 1, 2"
+                )):
+                    expected[(filter_facet, row[0], facet, row[1])] = row[2]
+        stored = {
+            tuple(row[:4]): row[4]
+            for row in conn.execute(text("SELECT filter_facet, filter_value, facet, value, count FROM book_facet_counts WHERE count != 0"))
+        }
+    return sum(1 for key in expected.keys() | stored.keys() if expected.get(key) != stored.get(key))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", default="1000,10000,100000", help="comma-separated catalog sizes")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--bulk", type=int, default=5000, help="rows in the bulk import chunk")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        args.books = int(args.books)
+        print(json.dumps(measure(args)))
+        return
+
+    failed = False
+    for books in (int(size) for size in args.books.split(",")):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {"GBOOKS_DB_FILE": os.path.join(tmp, "facets.db")}
+            result = run_isolated("benchmarks.facets", ["--worker", "--books", str(books), "--repeat", str(args.repeat), "--bulk", str(args.bulk)], env)
+        failed = failed or result["mismatches"] > 0
+        print(
+            f"{books:>8} books  facets p50 {result['facets_ms']:7.2f} ms  filtered {result['facets_filtered_ms']:7.2f} ms  |  "
+            f"GROUP BY {result['group_by_ms']:8.2f} ms  filtered {result['group_by_filtered_ms']:8.2f} ms  |  "
+            f"insert {result['insert_us']:7.0f} us  bulk {result['bulk_insert_us']:5.0f} us/book  availability {result['availability_us']:6.0f} us  "
+            f"{'ok' if not result['mismatches'] else 'FAIL %d counts drifted' % result['mismatches']}"
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
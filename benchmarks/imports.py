@@ -0,0 +1,174 @@
+"""
+Contention benchmark for ISBN deduplication in /api/books/import and
+/api/books/add-books.
+
+Serves the app with several uvicorn workers over a freshly seeded database.
+Every client is a different user that keeps sending small batches, as an
+import or through add-books, drawn from a window of ISBNs that are not in
+the catalog yet. The window moves forward over time, so new ISBNs keep
+arriving and several workers try to insert the same book at the same moment.
+
+Afterwards the catalog is checked against what the clients sent: one book
+per ISBN, no ownership stored twice, and every acknowledged row owned by its
+client. Exits with status 1 if any check fails.
+
+    python -m benchmarks.imports --workers 2 --clients 32 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from benchmarks.common import percentile, run_isolated, seed_database, serve
+from benchmarks.datagen import book_isbn
+
+# Book numbers of the ISBNs sent, far above the seeded catalog.
+FIRST_NEW_BOOK = 500_000_000
+
+
+async def run_clients(args, base_url: str) -> dict:
+    import httpx
+
+    acknowledged: dict[str, set[int]] = defaultdict(set)  # ISBN -> owners of rows that were written
+    attempted: dict[str, set[int]] = defaultdict(set)  # ISBN -> owners of every row sent
+    statuses = Counter()
+    latencies = defaultdict(list)
+    rows_per_second = Counter()
+    started = time.perf_counter()
+    deadline = started + args.seconds
+
+    def batch(rng: random.Random) -> list[str]:
+        window = FIRST_NEW_BOOK + int((time.perf_counter() - started) * args.new_per_second)
+        return [book_isbn(window + rng.randrange(args.hot_isbns)) for _ in range(args.batch)]
+
+    async def client_loop(client, user_id: int):
+        rng = random.Random(user_id)
+        while time.perf_counter() < deadline:
+            isbns = batch(rng)
+            books = [
+                {
+                    "title": f"Book {isbn}", "author": "Load Test", "published_year": 2000, "isbn": isbn,
+                    "pages": 200, "cover": None, "language": "es", "owner_id": user_id,
+                }
+                for isbn in isbns
+            ]
+            for isbn in isbns:
+                attempted[isbn].add(user_id)
+            route = "import" if rng.random() < args.import_ratio else "add-books"
+            request_started = time.perf_counter()
+            if route == "import":
+                content = "\n".join(json.dumps(book) for book in books).encode()
+                response = await client.post("/api/books/import", content=content)
+            else:
+                response = await client.post("/api/books/add-books", json=[{**book, "owner": None} for book in books])
+            latencies[route].append(time.perf_counter() - request_started)
+            statuses[f"{route} {response.status_code}"] += 1
+            written = response.status_code == 200
+            if written and route == "import" and response.json()["rejected"]:
+                statuses["import with rejected rows"] += 1
+                written = False
+            if written:
+                rows_per_second[int(time.perf_counter() - started)] += len(books)
+                for isbn in isbns:
+                    acknowledged[isbn].add(user_id)
+
+    limits = httpx.Limits(max_connections=args.clients + 1)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await asyncio.gather(*(client_loop(client, user_id) for user_id in range(1, args.clients + 1)))
+    elapsed = time.perf_counter() - started
+
+    # The last, partial second would drag the minimum down.
+    seconds = range(int(elapsed))
+    return {
+        "acknowledged": acknowledged,
+        "attempted": attempted,
+        "statuses": statuses,
+        "elapsed": elapsed,
+        "rows_per_second": [rows_per_second[second] for second in seconds],
+        "import_p95_ms": percentile(latencies["import"], 95) * 1000,
+        "add_books_p95_ms": percentile(latencies["add-books"], 95) * 1000,
+    }
+
+
+def check_catalog(db_file: str, result: dict) -> list[str]:
+    """
+    Compares the books and ownerships stored for the ISBNs sent with what the
+    clients were told. Returns the failed checks.
+    """
+    failures = []
+    conn = sqlite3.connect(db_file)
+    conn.execute("CREATE TEMP TABLE sent(isbn TEXT PRIMARY KEY)")
+    conn.executemany("INSERT INTO sent VALUES (?)", [(isbn,) for isbn in result["attempted"]])
+    copies = conn.execute(
+        "SELECT isbn_canonical, count(*) FROM books WHERE isbn_canonical IN (SELECT isbn FROM sent) "
+        "GROUP BY isbn_canonical HAVING count(*) > 1"
+    ).fetchall()
+    owners = defaultdict(list)
+    for isbn, owner_id in conn.execute(
+        "SELECT books.isbn_canonical, book_owners.owner_id FROM books JOIN book_owners ON book_owners.book_id = books.id "
+        "WHERE books.isbn_canonical IN (SELECT isbn FROM sent)"
+    ):
+        owners[isbn].append(owner_id)
+    conn.close()
+
+    if copies:
+        failures.append(f"{len(copies)} ISBNs stored as more than one book, up to {max(count for _, count in copies)} copies")
+    twice = sum(len(ids) - len(set(ids)) for ids in owners.values())
+    if twice:
+        failures.append(f"{twice} ownerships stored twice")
+    missing = sum(len(result["acknowledged"][isbn] - set(owners[isbn])) for isbn in result["acknowledged"])
+    if missing:
+        failures.append(f"{missing} acknowledged rows without their ownership")
+    phantom = sum(len(set(ids) - result["attempted"][isbn]) for isbn, ids in owners.items())
+    if phantom:
+        failures.append(f"{phantom} ownerships no client sent")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--batch", type=int, default=10, help="rows per request")
+    parser.add_argument("--hot-isbns", type=int, default=20, help="width of the window of ISBNs the clients draw from")
+    parser.add_argument("--new-per-second", type=float, default=20, help="how fast the window moves to ISBNs not sent yet")
+    parser.add_argument("--import-ratio", type=float, default=0.5, help="share of batches sent to /import instead of /add-books")
+    parser.add_argument("--async-db", choices=["0", "1"], default="1")
+    parser.add_argument("--seed-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.seed_only:
+        seed_database(users=args.clients, books=100)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, "imports.db")
+        env = {"GBOOKS_DB_FILE": db_file, "GBOOKS_ASYNC_DB": args.async_db, "GBOOKS_RECOMMENDATIONS_REFRESH_SECONDS": "0"}
+        run_isolated("benchmarks.imports", ["--seed-only", "--clients", str(args.clients)], env)
+        os.environ.update(env)
+        with serve(env, workers=args.workers) as base_url:
+            result = asyncio.run(run_clients(args, base_url))
+        failures = check_catalog(db_file, result)
+
+    print(f"{args.workers} workers, {args.clients} clients, {len(result['attempted'])} ISBNs, {result['elapsed']:.1f} s")
+    per_second = result["rows_per_second"] or [0]
+    print(f"rows per second: min {min(per_second)}  median {statistics.median(per_second):.0f}  max {max(per_second)}")
+    print(f"import p95 {result['import_p95_ms']:.2f} ms  add-books p95 {result['add_books_p95_ms']:.2f} ms")
+    print("responses: " + ", ".join(f"{key} x{count}" for key, count in sorted(result["statuses"].items())))
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if not failures:
+        print("ok   one book per ISBN and one ownership per acknowledged row")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
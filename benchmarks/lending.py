@@ -0,0 +1,179 @@
+"""
+Contention benchmark for /api/books/borrow and /api/books/return.
+
+Serves the app with several uvicorn workers over a freshly seeded database.
+Every client is a different user that keeps borrowing and returning books
+picked from a small hot set for --seconds, so most borrow attempts race
+for a book another worker is lending at the same moment. Some requests are
+sent a second time with the same Idempotency-Key, as a retry after a
+timeout would.
+
+Afterwards the lending history is checked against what the clients saw:
+one booked_books row per successful borrow, no overlapping loans of a
+book, replays returning the original loan, and books.available matching
+the open loans. Exits with status 1 if any check fails.
+
+    python -m benchmarks.lending --workers 2 --clients 64 --hot-books 1 --seconds 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+
+from benchmarks.common import percentile, run_isolated, seed_database, serve
+
+
+async def run_clients(args, base_url: str) -> dict:
+    import httpx
+    from app.controller.users import create_access_token
+
+    borrowed: dict[int, int] = {}  # loan id -> book id, as seen by the clients
+    returned: set[int] = set()
+    statuses = Counter()
+    replay_mismatches = 0
+    latencies = defaultdict(list)
+    requests_per_second = Counter()
+    cycles_per_second = Counter()
+    started = time.perf_counter()
+    deadline = started + args.seconds
+
+    async def send(client, headers: dict, action: str, book_id: int, retry: bool):
+        nonlocal replay_mismatches
+        headers = {**headers, "Idempotency-Key": uuid.uuid4().hex}
+        request_started = time.perf_counter()
+        response = await client.post(f"/api/books/{action}/{book_id}", headers=headers)
+        latencies[action].append(time.perf_counter() - request_started)
+        requests_per_second[int(time.perf_counter() - started)] += 1
+        statuses[f"{action} {response.status_code}"] += 1
+        if response.status_code == 200 and retry:
+            replay = await client.post(f"/api/books/{action}/{book_id}", headers=headers)
+            statuses[f"{action} replay {replay.status_code}"] += 1
+            if replay.headers.get("idempotency-replayed") != "true" or replay.json()["id"] != response.json()["id"]:
+                replay_mismatches += 1
+        return response
+
+    async def client_loop(client, user_id: int):
+        rng = random.Random(user_id)
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': f'user{user_id}@example.com'})}"}
+        while time.perf_counter() < deadline:
+            book_id = rng.randint(1, args.hot_books)
+            response = await send(client, headers, "borrow", book_id, rng.random() < args.retry_ratio)
+            if response.status_code != 200:
+                continue
+            loan = response.json()
+            borrowed[loan["id"]] = book_id
+            response = await send(client, headers, "return", book_id, rng.random() < args.retry_ratio)
+            if response.status_code == 200:
+                returned.add(loan["id"])
+                cycles_per_second[int(time.perf_counter() - started)] += 1
+
+    limits = httpx.Limits(max_connections=args.clients + 1)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await asyncio.gather(*(client_loop(client, user_id) for user_id in range(1, args.clients + 1)))
+    elapsed = time.perf_counter() - started
+
+    # The last, partial second would drag the minimum down.
+    seconds = range(int(elapsed))
+    return {
+        "borrowed": borrowed,
+        "returned": returned,
+        "statuses": statuses,
+        "replay_mismatches": replay_mismatches,
+        "elapsed": elapsed,
+        "requests_per_second": [requests_per_second[second] for second in seconds],
+        "cycles_per_second": [cycles_per_second[second] for second in seconds],
+        "borrow_p50_ms": percentile(latencies["borrow"], 50) * 1000,
+        "borrow_p95_ms": percentile(latencies["borrow"], 95) * 1000,
+        "return_p95_ms": percentile(latencies["return"], 95) * 1000,
+    }
+
+
+def check_history(db_file: str, result: dict, hot_books: int) -> list[str]:
+    """
+    Compares the lending history with what the clients were told. Returns the
+    failed checks.
+    """
+    failures = []
+    conn = sqlite3.connect(db_file)
+    rows = conn.execute(
+        'SELECT id, book_id, start, "end" FROM booked_books WHERE book_id <= ? ORDER BY book_id, id', (hot_books,)
+    ).fetchall()
+    available = dict(conn.execute("SELECT id, available FROM books WHERE id <= ?", (hot_books,)).fetchall())
+    conn.close()
+
+    stored = {row[0]: row[1] for row in rows}
+    if stored != result["borrowed"]:
+        lost = len(set(result["borrowed"]) - set(stored))
+        phantom = len(set(stored) - set(result["borrowed"]))
+        failures.append(f"{len(result['borrowed'])} successful borrows but {len(stored)} loans stored ({lost} lost, {phantom} unacknowledged)")
+    closed = {row[0] for row in rows if row[3] is not None}
+    if closed != result["returned"]:
+        failures.append(f"{len(result['returned'])} successful returns but {len(closed)} loans closed")
+
+    previous: dict[int, tuple] = {}
+    open_loans = Counter()
+    for loan_id, book_id, start, end in rows:
+        last = previous.get(book_id)
+        if last is not None and (last[3] is None or start < last[3]):
+            failures.append(f"loans {last[0]} and {loan_id} of book {book_id} overlap")
+        if end is None:
+            open_loans[book_id] += 1
+        previous[book_id] = (loan_id, book_id, start, end)
+    for book_id in range(1, hot_books + 1):
+        if open_loans[book_id] > 1:
+            failures.append(f"book {book_id} has {open_loans[book_id]} open loans")
+        if bool(available.get(book_id)) == bool(open_loans[book_id]):
+            failures.append(f"book {book_id} available={available.get(book_id)} with {open_loans[book_id]} open loans")
+    if result["replay_mismatches"]:
+        failures.append(f"{result['replay_mismatches']} retries with the same Idempotency-Key did not replay the original loan")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--hot-books", type=int, default=1, help="books the clients compete for")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--retry-ratio", type=float, default=0.1, help="share of successful requests sent again with the same Idempotency-Key")
+    parser.add_argument("--async-db", choices=["0", "1"], default="1")
+    parser.add_argument("--seed-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.seed_only:
+        seed_database(users=args.clients, books=max(args.hot_books, 100))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, "lending.db")
+        env = {"GBOOKS_DB_FILE": db_file, "GBOOKS_ASYNC_DB": args.async_db, "GBOOKS_RECOMMENDATIONS_REFRESH_SECONDS": "0"}
+        run_isolated("benchmarks.lending", ["--seed-only", "--clients", str(args.clients), "--hot-books", str(args.hot_books)], env)
+        os.environ.update(env)
+        with serve(env, workers=args.workers) as base_url:
+            result = asyncio.run(run_clients(args, base_url))
+        failures = check_history(db_file, result, args.hot_books)
+
+    cycles = len(result["returned"])
+    print(f"{args.workers} workers, {args.clients} clients, {args.hot_books} hot book(s), {result['elapsed']:.1f} s")
+    print(f"borrow/return cycles: {cycles} ({cycles / result['elapsed']:.1f}/s)")
+    for label in ("requests", "cycles"):
+        per_second = result[f"{label}_per_second"] or [0]
+        print(f"{label} per second: min {min(per_second)}  median {statistics.median(per_second):.0f}  max {max(per_second)}")
+    print(f"borrow p50 {result['borrow_p50_ms']:.2f} ms  p95 {result['borrow_p95_ms']:.2f} ms  return p95 {result['return_p95_ms']:.2f} ms")
+    print("responses: " + ", ".join(f"{key} x{count}" for key, count in sorted(result["statuses"].items())))
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if not failures:
+        print("ok   lending history matches every acknowledged borrow and return")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Query-count regression check.
+
+Seeds a throwaway database, calls every budgeted endpoint through the app in
+both the sync and the async database modes and counts the SQL statements each
+request sends. Exits with status 1 when any endpoint goes over its budget, so
+it can run as a CI step:
+
+    python -m benchmarks.query_budget
+"""
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.common import run_isolated, seed_database
+
+USERS = 20
+BOOKS = 200
+
+# Statements allowed per request once the caller's token is cached. The cached
+# endpoints read their cache version first, then query on a cache miss.
+BUDGETS = {
+    "/api/books/get-all-books?limit=50": 2,
+    "/api/books/get-book/7": 2,
+    "/api/books/by-isbn/978-0-00-000007-1": 1,
+    "/api/books/facets": 1,
+    "/api/books/facets?language=es": 1,
+    "/api/books/owned-books": 1,
+    "/api/books/borrowed-books": 1,
+    "/api/users/get-profile": 0,
+    "/api/users/get-user/1": 0,
+    "/api/users/validate-token": 0,
+}
+
+
+def check() -> dict:
+    seed_database(users=USERS, books=BOOKS)
+
+    from fastapi.testclient import TestClient
+    from app.application import get_app
+    from app.config.query_counter import QueryCounter
+    from app.controller.recommendations import similarity_index
+    from app.controller.users import create_access_token
+
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'user1@example.com'})}"}
+    results = {}
+    with TestClient(get_app()) as client:
+        # The startup similarity refresh runs in the background; keep its statements out of the counts.
+        while not similarity_index.version:
+            time.sleep(0.01)
+        client.get("/api/users/get-profile", headers=headers)  # warm the token cache
+        for path, budget in BUDGETS.items():
+            with QueryCounter() as counter:
+                response = client.get(path, headers=headers)
+            results[path] = {"status": response.status_code, "count": counter.count, "budget": budget}
+    return results
+
+
+def main() -> None:
+    if "--worker" in sys.argv:
+        import json
+        print(json.dumps(check()))
+        return
+
+    failed = False
+    for mode, flag in (("sync", "0"), ("async", "1")):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {"GBOOKS_DB_FILE": os.path.join(tmp, "budget.db"), "GBOOKS_ASYNC_DB": flag}
+            results = run_isolated("benchmarks.query_budget", ["--worker"], env)
+        for path, r in results.items():
+            ok = r["status"] < 400 and r["count"] <= r["budget"]
+            failed = failed or not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {mode:<5} {path:<40} {r['count']}/{r['budget']} statements (HTTP {r['status']})")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
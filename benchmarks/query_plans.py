@@ -0,0 +1,112 @@
+"""
+Query-plan check for the controller queries.
+
+Seeds a throwaway database, runs every read path of the book and user
+controllers while recording the SQL they send, and asks SQLite for the plan of
+each statement with EXPLAIN QUERY PLAN. Exits with status 1 when a plan
+contains a full table SCAN, unless the query is listed as an intentional scan:
+
+    python -m benchmarks.query_plans
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+from benchmarks.common import seed_database
+
+
+def controller_calls() -> list[tuple[str, object, bool]]:
+    """
+    (name, call, scan allowed) for every read path worth checking; each call
+    gets the session of its unit of work.
+    """
+    from fastapi.security import OAuth2PasswordRequestForm
+    from app.controller.books import (
+        add_new_book, book_version_statement, catalog_page_version_statement, encode_cursor, query_book_by_isbn, query_books,
+        query_versioned_book, query_versioned_catalog_page,
+    )
+    from app.controller.response_cache import get_cache_version
+    from app.controller.facets import query_facets
+    from app.controller.lending import borrow_book, return_book
+    from app.controller.users import create_access_token, login, query_users
+    from app.schemas.user_book import BookSchemaWithOwner
+
+    token = create_access_token(data={"sub": "user2@example.com"})
+
+    def run_login(db, username: str):
+        try:
+            asyncio.run(login(OAuth2PasswordRequestForm(username=username, password="x" * 8), db))
+        except Exception:
+            pass  # the seeded hashes are not real bcrypt hashes; only the lookups matter here
+
+    def import_books(db):
+        books = [
+            BookSchemaWithOwner(title="Plan", author="Plan", published_year=None, isbn=isbn, pages=None, cover=None, language=None, owner_id=3, owner=None)
+            for isbn in ("978-0-00-000004-0", "0-306-40615-2", "9780306406157")
+        ]
+        add_new_book(db, books=books)
+
+    return [
+        ("query_books() first page", lambda db: query_books(db, limit=50), False),
+        ("query_books() next page", lambda db: query_books(db, limit=50, cursor=encode_cursor(100, 100)), False),
+        ("query_books(id=...)", lambda db: query_books(db, id=42), False),
+        ("catalog page version", lambda db: get_cache_version(db, catalog_page_version_statement(50, encode_cursor(100, 100))), False),
+        ("book version", lambda db: get_cache_version(db, book_version_statement(42)), False),
+        ("query_versioned_catalog_page() next page", lambda db: query_versioned_catalog_page(db, 0, limit=50, cursor=encode_cursor(100, 100)), False),
+        ("query_versioned_book()", lambda db: query_versioned_book(db, 42), False),
+        ("query_books(email=...)", lambda db: query_books(db, email="user3@example.com"), False),
+        ("query_books(email=..., borrowed=True)", lambda db: query_books(db, email="user3@example.com", borrowed=True), False),
+        ("query_book_by_isbn()", lambda db: query_book_by_isbn(db, "978-0-00-000004-0"), False),
+        ("add_new_book(books=...) deduplicating by ISBN", import_books, False),
+        ("query_facets()", lambda db: query_facets(db, {}), False),
+        ("query_facets(language=...)", lambda db: query_facets(db, {"language": "es"}), False),
+        ("borrow_book() with Idempotency-Key", lambda db: borrow_book(db, 7, 5, "plan-borrow"), False),
+        ("borrow_book() replayed", lambda db: borrow_book(db, 7, 5, "plan-borrow"), False),
+        ("return_book() with Idempotency-Key", lambda db: return_book(db, 7, 5, "plan-return"), False),
+        ("query_users(id=...)", lambda db: query_users(db, id=3), False),
+        ("query_users(email=...)", lambda db: query_users(db, email="user3@example.com"), False),
+        ("query_users(token=...)", lambda db: query_users(db, token=token), False),
+        ("login() by email", lambda db: run_login(db, "user4@example.com"), False),
+        ("login() by username", lambda db: run_login(db, "user4"), False),
+        ("query_users() lists every user", lambda db: query_users(db), True),
+    ]
+
+
+def check() -> bool:
+    seed_database(users=50, books=500)
+
+    from app.config.database import engine, unit_of_work
+    from app.config.query_counter import QueryCounter
+
+    ok = True
+    for name, call, scan_allowed in controller_calls():
+        with QueryCounter([engine]) as counter, unit_of_work() as db:
+            call(db)
+        with engine.connect() as conn:
+            for statement, parameters in counter.statements:
+                plan = [row[3] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+                # A virtual table walks its own data: json_each scans the bound array, not a table.
+                # Scanning a subquery (anon_N) reads the rows its own SEARCH produced.
+                scans = [
+                    step for step in plan
+                    if step.startswith("SCAN") and step != "SCAN CONSTANT ROW" and "VIRTUAL TABLE" not in step and not step.startswith("SCAN anon_")
+                ]
+                failed = bool(scans) and not scan_allowed
+                ok = ok and not failed
+                label = "FAIL" if failed else ("scan" if scans else "ok  ")
+                print(f"{label} {name}: {'; '.join(plan)}")
+    return ok
+
+
+def main() -> None:
+    # Set before anything imports app.config.database.
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["GBOOKS_DB_FILE"] = os.path.join(tmp, "plans.db")
+        os.environ["GBOOKS_ASYNC_DB"] = "0"
+        ok = check()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Load test for every route under app/routers/main.py.
+
+Generates a database with benchmarks.datagen, starts the app in-process
+(lifespan included) and, for each concurrency level, drives every route
+through an ASGI client, reporting p50/p95/p99 latency and requests per
+second. Routes without a request factory below are listed, so new routes do
+not silently go unmeasured.
+
+    python -m benchmarks.routes --concurrency 1,8,32 --requests 100
+    python -m benchmarks.routes --save-baseline baseline.json
+    python -m benchmarks.routes --baseline baseline.json --tolerance 0.25
+
+With --baseline, a route whose p95 grew or whose throughput dropped by more
+than the tolerance at any level is flagged and the exit status is 1.
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.common import drive, run_isolated
+from benchmarks.datagen import book_isbn
+
+DEFAULT_CONCURRENCY = "1,8,32"
+# p95 changes smaller than this are noise, whatever the tolerance says.
+MIN_P95_DELTA_MS = 1.0
+
+
+class Context:
+    """
+    Everything the request factories need: ID ranges, tokens of the first
+    users, their reading IDs and a cover image.
+    """
+    def __init__(self, args, readings_by_user: dict[int, list[int]], cover: bytes):
+        from app.controller.books import encode_cursor
+        from app.controller.users import create_access_token
+
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.counter = itertools.count(1)
+        self.encode_cursor = encode_cursor
+        self.auth_users = sorted(readings_by_user) or [1]
+        self.tokens = {
+            user_id: {"Authorization": f"Bearer {create_access_token(data={'sub': f'user{user_id}@example.com'})}"}
+            for user_id in self.auth_users
+        }
+        # run() makes user 1 a superuser for the administrator-only routes.
+        self.admin = {"Authorization": f"Bearer {create_access_token(data={'sub': 'user1@example.com'})}"}
+        self.readings_by_user = readings_by_user
+        self.cover = cover
+
+    def book_id(self) -> int:
+        return self.rng.randint(1, self.args.books)
+
+    def user(self) -> tuple[int, dict]:
+        user_id = self.rng.choice(self.auth_users)
+        return user_id, self.tokens[user_id]
+
+    def new_book(self) -> dict:
+        return {
+            "title": f"Load test book {next(self.counter)}", "author": "Load Test", "published_year": 2024,
+            "isbn": None, "pages": 200, "cover": None, "language": "es",
+            "owner_id": self.rng.randint(1, self.args.users), "owner": None,
+        }
+
+    def new_user(self) -> dict:
+        n = next(self.counter)
+        return {
+            "username": f"load{n}", "email": f"load{n}@example.com", "password": "load-test-password",
+            "first_name": "Load", "last_name": "Test", "date_joined": "2024-01-01", "birth_date": "1990-01-01",
+        }
+
+
+def _get(url: str, headers: dict | None = None) -> dict:
+    return {"method": "GET", "url": url, "headers": headers or {}}
+
+
+def _authenticated(ctx: Context, url: str) -> dict:
+    return _get(url, ctx.user()[1])
+
+
+def _finish_reading(ctx: Context) -> dict:
+    user_id, headers = ctx.user()
+    reading_id = ctx.rng.choice(ctx.readings_by_user[user_id])
+    return {"method": "PATCH", "url": f"/api/books/finish-reading/{reading_id}", "headers": headers, "json": {"end": "2026-12-31"}}
+
+
+def _import(ctx: Context) -> dict:
+    rows = [
+        json.dumps({"title": f"Imported {next(ctx.counter)}", "author": "Load Test", "owner_id": ctx.rng.randint(1, ctx.args.users)})
+        for _ in range(100)
+    ]
+    return {"method": "POST", "url": "/api/books/import", "content": "\n".join(rows).encode()}
+
+
+# "METHOD path" -> (request factory, share of --requests sent to the route).
+ROUTES = {
+    "POST /api/books/add-book": (lambda ctx: {"method": "POST", "url": "/api/books/add-book", "json": ctx.new_book()}, 1.0),
+    "POST /api/books/add-books": (lambda ctx: {"method": "POST", "url": "/api/books/add-books", "json": [ctx.new_book() for _ in range(10)]}, 1.0),
+    "POST /api/books/import": (_import, 0.25),
+    "GET /api/books/get-all-books": (lambda ctx: _get(f"/api/books/get-all-books?limit=50&cursor={ctx.encode_cursor(ctx.book_id(), 0)}"), 1.0),
+    "GET /api/books/search": (lambda ctx: _get(f"/api/books/search?q=Author {ctx.rng.randint(1, max(1, ctx.args.books // 10))}&limit=20"), 1.0),
+    "GET /api/books/facets": (lambda ctx: _get(f"/api/books/facets?language={ctx.rng.choice(['es', 'en', 'pa', 'fr'])}" if ctx.rng.random() < 0.5 else "/api/books/facets"), 1.0),
+    "GET /api/books/export": (lambda ctx: _get("/api/books/export"), 0.05),
+    "GET /api/books/get-book/{book_id}": (lambda ctx: _get(f"/api/books/get-book/{ctx.book_id()}"), 1.0),
+    "GET /api/books/by-isbn/{isbn}": (lambda ctx: _get(f"/api/books/by-isbn/{book_isbn(ctx.book_id())}"), 1.0),
+    "GET /api/books/response-cache-stats": (lambda ctx: _get("/api/books/response-cache-stats", ctx.admin), 1.0),
+    "GET /api/books/owned-books": (lambda ctx: _authenticated(ctx, "/api/books/owned-books"), 1.0),
+    "GET /api/books/borrowed-books": (lambda ctx: _authenticated(ctx, "/api/books/borrowed-books"), 1.0),
+    "POST /api/books/add-reading": (lambda ctx: (lambda user_id, headers: {
+        "method": "POST", "url": "/api/books/add-reading", "headers": headers,
+        "json": {"book_id": ctx.book_id(), "user_id": user_id, "start": "2026-01-01"},
+    })(*ctx.user()), 1.0),
+    "PATCH /api/books/finish-reading/{reading_id}": (_finish_reading, 1.0),
+    "POST /api/books/upload-cover/{book_id}": (lambda ctx: {"method": "POST", "url": f"/api/books/upload-cover/{ctx.book_id()}", "content": ctx.cover}, 0.25),
+    "GET /api/books/cover/{book_id}": (lambda ctx: _get(f"/api/books/cover/{ctx.book_id()}"), 1.0),
+    "GET /api/books/book-cover/{book_id}": (lambda ctx: {**_get(f"/api/books/book-cover/{ctx.rng.randint(1, 20)}?width=320"), "headers": {"Accept": "image/webp"}}, 1.0),
+    "GET /api/books/recommendation-stats": (lambda ctx: _get("/api/books/recommendation-stats", ctx.admin), 1.0),
+    "GET /api/books/{book_id}/similar": (lambda ctx: _get(f"/api/books/{ctx.book_id()}/similar"), 1.0),
+    "POST /api/users/add-user": (lambda ctx: {"method": "POST", "url": "/api/users/add-user", "json": {
+        **ctx.new_user(), "id": 1_000_000 + next(ctx.counter), "is_active": True, "is_superuser": False, "is_verified": False,
+    }}, 0.25),
+    "GET /api/users/get-user/{user_id}": (lambda ctx: (lambda user_id, headers: _get(f"/api/users/get-user/{user_id}", headers))(*ctx.user()), 1.0),
+    "GET /api/users/get-profile": (lambda ctx: _authenticated(ctx, "/api/users/get-profile"), 1.0),
+    "GET /api/users/reading-stats/{user_id}": (lambda ctx: (lambda user_id, headers: _get(f"/api/users/reading-stats/{user_id}", headers))(*ctx.user()), 1.0),
+    "GET /api/users/me/recommendations": (lambda ctx: _authenticated(ctx, "/api/users/me/recommendations"), 1.0),
+    "GET /api/users/get-user": (lambda ctx: _get("/api/users/get-user"), 0.25),
+    "GET /api/users/get-user-by-email": (lambda ctx: _get(f"/api/users/get-user-by-email?email=user{ctx.rng.randint(1, ctx.args.users)}@example.com"), 1.0),
+    "POST /api/users/register": (lambda ctx: {"method": "POST", "url": "/api/users/register", "json": (lambda user: {**user, "confirm_password": user["password"]})(ctx.new_user())}, 0.25),
+    "POST /api/users/login": (lambda ctx: {
+        "method": "POST", "url": "/api/users/login",
+        "data": {"username": f"user{ctx.rng.randint(1, ctx.args.users)}@example.com", "password": "benchmark-password"},
+    }, 0.25),
+    "GET /api/users/validate-token": (lambda ctx: _authenticated(ctx, "/api/users/validate-token"), 1.0),
+    "POST /api/users/tokenvalidate": (lambda ctx: {**_authenticated(ctx, "/api/users/tokenvalidate"), "method": "POST"}, 1.0),
+    "GET /api/users/token-cache-stats": (lambda ctx: _get("/api/users/token-cache-stats", ctx.admin), 1.0),
+    "GET /api/users/auth-limiter-stats": (lambda ctx: _get("/api/users/auth-limiter-stats", ctx.admin), 1.0),
+}
+
+
+def discover_routes() -> list[str]:
+    from fastapi.routing import APIRoute
+    from app.routers.main import router
+
+    return [
+        f"{method} {route.path}"
+        for route in router.routes if isinstance(route, APIRoute)
+        for method in sorted(route.methods)
+    ]
+
+
+def make_cover() -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.effect_noise((600, 900), 40).convert("RGB").save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+async def run(args) -> dict:
+    from benchmarks.datagen import BENCHMARK_PASSWORD, generate
+    from app.config.authentication import pwd_context
+
+    generate(args.users, args.books, args.ownerships, args.readings, args.seed, pwd_context.hash(BENCHMARK_PASSWORD))
+
+    from sqlalchemy import select, update
+    from app.application import get_app
+    from app.config.database import Session
+    from app.controller.recommendations import similarity_index
+    from app.models.books import ReadedBook
+    from app.models.users import User
+
+    db = Session()
+    db.execute(update(User).where(User.id == 1).values(is_superuser=True))
+    db.commit()
+    readings_by_user: dict[int, list[int]] = {}
+    for reading_id, user_id in db.execute(select(ReadedBook.id, ReadedBook.user_id).where(ReadedBook.user_id <= 20)):
+        readings_by_user.setdefault(user_id, []).append(reading_id)
+    db.close()
+
+    app = get_app()
+    ctx = Context(args, readings_by_user, make_cover())
+    discovered = discover_routes()
+    selected = [route for route in discovered if route in ROUTES and (not args.routes or any(f in route for f in args.routes))]
+    results = {"missing": [route for route in discovered if route not in ROUTES], "routes": {}}
+
+    async with app.router.lifespan_context(app):
+        while not similarity_index.version:
+            await asyncio.sleep(0.05)
+        # Covers for the first books, so /book-cover has something to send.
+        await drive(app, [{"method": "POST", "url": f"/api/books/upload-cover/{book_id}", "content": ctx.cover} for book_id in range(1, 21)], 4)
+        for concurrency in args.concurrency:
+            for route in selected:
+                factory, share = ROUTES[route]
+                count = max(concurrency, int(args.requests * share))
+                requests = [factory(ctx) for _ in range(count)]
+                await drive(app, [factory(ctx) for _ in range(concurrency)], concurrency)  # warm-up
+                results["routes"].setdefault(route, {})[str(concurrency)] = await drive(app, requests, concurrency)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for route, levels in results["routes"].items():
+        for level, current in levels.items():
+            before = baseline["routes"].get(route, {}).get(level)
+            if before is None:
+                continue
+            slower = current["p95_ms"] > before["p95_ms"] * (1 + tolerance) and current["p95_ms"] - before["p95_ms"] > MIN_P95_DELTA_MS
+            fewer = current["rps"] < before["rps"] * (1 - tolerance)
+            if slower or fewer:
+                regressions.append(
+                    f"{route} @ {level}: p95 {before['p95_ms']} -> {current['p95_ms']} ms, "
+                    f"{before['rps']} -> {current['rps']} req/s"
+                )
+    return regressions
+
+
+def print_results(results: dict, baseline: dict | None) -> None:
+    for route, levels in results["routes"].items():
+        for level, r in levels.items():
+            line = (f"{route:<48} c={level:<4} {r['rps']:>9} req/s  p50 {r['p50_ms']:>8}  "
+                    f"p95 {r['p95_ms']:>8}  p99 {r['p99_ms']:>8} ms  errors {r['errors']}")
+            before = (baseline or {}).get("routes", {}).get(route, {}).get(level)
+            if before:
+                line += f"  (p95 was {before['p95_ms']}, req/s was {before['rps']})"
+            print(line)
+    for route in results["missing"]:
+        print(f"not measured (no request factory): {route}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--books", type=int, default=5000)
+    parser.add_argument("--ownerships", type=int, default=7000)
+    parser.add_argument("--readings", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=100, help="requests per route and concurrency level")
+    parser.add_argument("--concurrency", default=DEFAULT_CONCURRENCY, help="comma-separated levels")
+    parser.add_argument("--routes", nargs="*", help="only routes containing one of these substrings")
+    parser.add_argument("--bcrypt-rounds", type=int, default=4, help="bcrypt cost for login/register (the app default is 12)")
+    parser.add_argument("--async-db", choices=["0", "1"], default="1")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON file and exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.concurrency = [int(level) for level in str(args.concurrency).split(",")]
+
+    if args.worker:
+        results = asyncio.run(run(args))
+        print(json.dumps(results))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            "GBOOKS_DB_FILE": os.path.join(tmp, "routes.db"),
+            "GBOOKS_COVERS_DIR": os.path.join(tmp, "covers"),
+            "GBOOKS_ASYNC_DB": args.async_db,
+            "GBOOKS_BCRYPT_ROUNDS": str(args.bcrypt_rounds),
+            "GBOOKS_RECOMMENDATIONS_REFRESH_SECONDS": "0",
+            # Every request comes from one client; measure the handlers, not the 429s.
+            "GBOOKS_AUTH_RATE_LIMIT": "0",
+        }
+        started = time.perf_counter()
+        results = run_isolated("benchmarks.routes", [*sys.argv[1:], "--worker"], env)
+    results["meta"] = {key: value for key, value in vars(args).items() if key not in ("worker", "save_baseline", "baseline")}
+    results["meta"]["seconds"] = round(time.perf_counter() - started, 1)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"baseline saved to {args.save_baseline}")
+
+    if baseline is not None:
+        if baseline.get("meta", {}).get("books") != args.books or baseline.get("meta", {}).get("users") != args.users:
+            print("warning: the baseline was recorded with a different dataset")
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
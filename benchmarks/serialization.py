@@ -0,0 +1,106 @@
+"""
+Serialization cost of the book list responses, per 10k rows.
+
+Seeds a throwaway database, fetches the same catalog rows once and times only
+the step from fetched rows to response bytes, two ways:
+
+- models: ORM rows -> get_parse_bookModel_bookSchemaOwner for every row ->
+  FastAPI's response_model validation and serialization against
+  list[ReturnBookSchema | BookSchemaWithOwner] -> JSONResponse, which is what
+  the list endpoints did before the fast path.
+- fast: column rows -> get_catalog_row_dict -> orjson, what they do now.
+
+    python -m benchmarks.serialization --rows 10000 --repeat 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.common import run_isolated, seed_database
+
+USERS = 200
+
+
+def measure(args) -> dict:
+    seed_database(users=USERS, books=args.rows)
+
+    import orjson
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_model_field
+    from sqlalchemy import select
+    from app.config.database import Session
+    from app.controller.books import catalog_page_statement, get_catalog_row_dict, get_parse_bookModel_bookSchemaOwner
+    from app.models.books import Book as BookModel, BookOwner as BookOwnerModel
+    from app.models.users import User
+    from app.schemas.book import ReturnBookSchema
+    from app.schemas.user_book import BookSchemaWithOwner
+
+    db = Session()
+    orm_rows = db.execute(
+        select(BookModel, User).join(BookOwnerModel, BookOwnerModel.book_id == BookModel.id)
+        .join(User, User.id == BookOwnerModel.owner_id).order_by(BookOwnerModel.book_id, BookOwnerModel.id)
+    ).all()
+    column_rows = db.execute(catalog_page_statement(args.rows)).all()[:args.rows]
+    db.close()
+
+    field = create_model_field(name="Response", type_=list[ReturnBookSchema | BookSchemaWithOwner], mode="serialization")
+
+    async def models() -> bytes:
+        items = [get_parse_bookModel_bookSchemaOwner(book, user) for book, user in orm_rows]
+        content = await serialize_response(field=field, response_content=items, is_coroutine=True)
+        return JSONResponse(content).body
+
+    async def fast() -> bytes:
+        return orjson.dumps([get_catalog_row_dict(row) for row in column_rows])
+
+    results = {}
+    for name, path in (("models", models), ("fast", fast)):
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            body = asyncio.run(path())
+            timings.append(time.perf_counter() - started)
+        results[name] = {"body": body, "timings": timings}
+
+    if json.loads(results["models"]["body"]) != json.loads(results["fast"]["body"]):
+        raise SystemExit("The fast path produced a different document")
+
+    per_10k = 10000 / len(column_rows)
+    return {
+        name: {
+            "median_ms_per_10k": round(statistics.median(r["timings"]) * 1000 * per_10k, 1),
+            "best_ms_per_10k": round(min(r["timings"]) * 1000 * per_10k, 1),
+            "bytes": len(r["body"]),
+        }
+        for name, r in results.items()
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {"GBOOKS_DB_FILE": os.path.join(tmp, "serialization.db")}
+        results = run_isolated("benchmarks.serialization", [*sys.argv[1:], "--worker"], env)
+    for name, r in results.items():
+        print(f"{name:<7} median {r['median_ms_per_10k']:>8} ms / 10k rows   best {r['best_ms_per_10k']:>8} ms   {r['bytes']} bytes")
+    speedup = results["models"]["median_ms_per_10k"] / max(results["fast"]["median_ms_per_10k"], 0.001)
+    print(f"fast path is {speedup:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
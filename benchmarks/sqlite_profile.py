@@ -0,0 +1,114 @@
+"""
+Mixed read/write benchmark for the SQLite engine profiles.
+
+Runs the same workload with GBOOKS_DB_PROFILE=default (rollback journal,
+SQLAlchemy's default pool) and GBOOKS_DB_PROFILE=production (WAL and pragmas
+from app.config.database), each in its own interpreter over a freshly seeded
+database. Several processes, each with several threads, call the controllers
+directly: most operations read a catalog page or a book, the rest add a book.
+
+    python -m benchmarks.sqlite_profile --processes 2 --threads 8 --ops 500 --write-ratio 0.2
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.common import percentile, run_isolated, seed_database
+
+USERS = 200
+BOOKS = 20000
+
+
+def run_thread(thread_index: int, args, reads: list, writes: list, errors: list) -> None:
+    from app.config.database import unit_of_work
+    from app.controller.books import add_new_book, query_books
+    from app.schemas.user_book import BookSchemaWithOwner
+
+    rng = random.Random(os.getpid() * 1000 + thread_index)
+    for _ in range(args.ops):
+        started = time.perf_counter()
+        try:
+            if rng.random() < args.write_ratio:
+                with unit_of_work() as db:
+                    add_new_book(db, BookSchemaWithOwner(
+                        title="Benchmark book", author="Benchmark", published_year=2024, isbn=None,
+                        pages=100, cover=None, language="es", owner_id=rng.randint(1, USERS), owner=None,
+                    ))
+                writes.append(time.perf_counter() - started)
+            else:
+                with unit_of_work() as db:
+                    if rng.random() < 0.5:
+                        query_books(db, id=rng.randint(1, BOOKS))
+                    else:
+                        query_books(db, limit=50)
+                reads.append(time.perf_counter() - started)
+        except Exception as e:
+            errors.append(str(e))
+
+
+def run_process(args) -> dict:
+    reads, writes, errors = [], [], []
+    threads = [threading.Thread(target=run_thread, args=(i, args, reads, writes, errors)) for i in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {"reads": reads, "writes": writes, "errors": errors, "elapsed": time.perf_counter() - started}
+
+
+def run_worker(args) -> None:
+    with ProcessPoolExecutor(max_workers=args.processes) as pool:
+        parts = list(pool.map(run_process, [args] * args.processes))
+    reads = [x for p in parts for x in p["reads"]]
+    writes = [x for p in parts for x in p["writes"]]
+    errors = [x for p in parts for x in p["errors"]]
+    elapsed = max(p["elapsed"] for p in parts)
+    print(json.dumps({
+        "ops_per_s": round((len(reads) + len(writes)) / elapsed, 1),
+        "read_p95_ms": round(percentile(reads, 95) * 1000, 2),
+        "write_p95_ms": round(percentile(writes, 95) * 1000, 2),
+        "errors": len(errors),
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=500, help="operations per thread")
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--seed-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.seed_only:
+        seed_database(users=USERS, books=BOOKS)
+        return
+    if args.worker:
+        run_worker(args)
+        return
+
+    forwarded = [
+        "--worker",
+        "--processes", str(args.processes),
+        "--threads", str(args.threads),
+        "--ops", str(args.ops),
+        "--write-ratio", str(args.write_ratio),
+    ]
+    print(f"{'profile':<11} {'ops/s':>9} {'read p95 ms':>12} {'write p95 ms':>13} {'errors':>7}")
+    for profile in ("default", "production"):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {"GBOOKS_DB_FILE": os.path.join(tmp, "bench.db"), "GBOOKS_DB_PROFILE": profile}
+            run_isolated("benchmarks.sqlite_profile", ["--seed-only"], env)
+            r = run_isolated("benchmarks.sqlite_profile", forwarded, env)
+        print(f"{profile:<11} {r['ops_per_s']:>9} {r['read_p95_ms']:>12} {r['write_p95_ms']:>13} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Worker cold start: interpreter start, importing app.application and get_app(),
+with and without create_all, on an already migrated database.
+
+Each run is a fresh interpreter, so the numbers include reading the modules
+from disk (or the bytecode cache) like a newly spawned uvicorn worker does.
+
+    python -m benchmarks.startup --repeat 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import REPO_ROOT, run_isolated
+
+
+def measure(args) -> dict:
+    import app.application as application
+
+    started = time.perf_counter()
+    application.get_app(create_schema=args.create_schema)
+    return {
+        "import_ms": application.IMPORT_SECONDS * 1000,
+        "get_app_ms": (time.perf_counter() - started) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--create-schema", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {"GBOOKS_DB_FILE": os.path.join(tmp, "startup.db"), "GBOOKS_COVERS_DIR": os.path.join(tmp, "covers")}
+        subprocess.run(
+            [sys.executable, "-m", "alembic", "upgrade", "head"],
+            cwd=REPO_ROOT, env={**os.environ, **env}, check=True, capture_output=True,
+        )
+        for label, extra in (("create_all", ["--create-schema"]), ("migrated", [])):
+            runs = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                result = run_isolated("benchmarks.startup", ["--worker", *extra], env)
+                result["process_ms"] = (time.perf_counter() - started) * 1000
+                runs.append(result)
+            medians = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+            print(f"{label:<11} " + "  ".join(f"{key} {value:8.1f}" for key, value in medians.items()))
+
+
+if __name__ == "__main__":
+    main()